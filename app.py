@@ -5,9 +5,12 @@ This is the entry point for the e-commerce AI platform API.
 from flask import Flask, jsonify
 from flask_cors import CORS
 from config.database import init_db
+from modules.models import configure_mappers
 from modules.auth.routes import user_bp
+from modules.auth.tokens import signing_key
 from modules.orders.routes import orders_bp
 from modules.products.routes import products_bp
+from modules.analytics.routes import analytics_bp
 import os
 from dotenv import load_dotenv
 
@@ -16,11 +19,14 @@ load_dotenv()
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+configure_mappers()
+signing_key()  # refuse to start without a token secret (see modules/auth/tokens.py)
 CORS(app)
 
 app.register_blueprint(orders_bp)
 app.register_blueprint(user_bp)
 app.register_blueprint(products_bp)
+app.register_blueprint(analytics_bp)
 
 #root endpoint
 @app.route('/')
@@ -33,6 +39,7 @@ def home():
             'users': '/api//users',
             'products': '/api/products',
             'orders': '/api/orders',
+            'analytics': '/api/analytics/sales',
             'health': '/api/health',
         },
         'documentation': 'See README.md for full API documentation'
@@ -2,7 +2,8 @@
 Database configuration and connection management
 """
 import os
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
@@ -34,4 +35,40 @@ def drop_db():
     Drop all tables - use with caution!
     """
     Base.metadata.drop_all(bind=engine)
-    print("All tables dropped!")
\ No newline at end of file
+    print("All tables dropped!")
+
+
+class QueryCounter:
+    """Statements sent to the database (executemany counts once), their SQL, and commits"""
+
+    def __init__(self):
+        self.count = 0
+        self.commits = 0
+        self.statements = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+    def _commit(self, conn):
+        self.commits += 1
+
+
+@contextmanager
+def count_queries(bind=None):
+    """
+    Count the round trips made inside the block, for benchmarks and N+1 checks:
+
+        with count_queries() as queries:
+            OrderService.create_order(db, ...)
+        print(queries.count)
+    """
+    target = bind if bind is not None else engine
+    counter = QueryCounter()
+    event.listen(target, 'before_cursor_execute', counter._before_cursor_execute)
+    event.listen(target, 'commit', counter._commit)
+    try:
+        yield counter
+    finally:
+        event.remove(target, 'before_cursor_execute', counter._before_cursor_execute)
+        event.remove(target, 'commit', counter._commit)
@@ -0,0 +1,58 @@
+"""
+TrinketHub - Sales Rollup Backfill
+Rebuilds sales_daily for a range of days from orders, in chunks of days
+processed in parallel (one session per worker). Safe to run while the API
+and the incremental rollup are live: chunks only cover days up to the
+rollup watermark, and the incremental job waits for them.
+
+On a fresh install, run this once and then keep run_rollups.py sales going.
+
+Run with: python data/scripts/backfill_sales.py [--from 2024-01-01] [--to 2024-12-31] [--workers 4] [--chunk-days 31]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+from config.database import SessionLocal
+from modules.models import configure_mappers
+from modules.analytics.sales import SalesRollupService, BACKFILL_CHUNK_DAYS
+
+
+def parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main():
+    configure_mappers()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--from', dest='day_from', type=parse_day, help='first day (default: first order)')
+    parser.add_argument('--to', dest='day_to', type=parse_day, help='last day, inclusive (default: today)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chunk-days', type=int, default=BACKFILL_CHUNK_DAYS)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("TrinketHub - Sales Rollup Backfill")
+    print("=" * 50)
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        result = SalesRollupService.backfill(
+            db,
+            day_from=args.day_from,
+            day_to=args.day_to + timedelta(days=1) if args.day_to else None,
+            workers=args.workers,
+            chunk_days=args.chunk_days,
+        )
+        elapsed = time.perf_counter() - start
+        print(f"\nRebuilt {result['days']} days in {result['chunks']} chunks "
+              f"({result['orders']} orders) with {args.workers} workers in {elapsed:.2f}s")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
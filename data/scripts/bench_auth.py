@@ -0,0 +1,80 @@
+"""
+TrinketHub - Auth Overhead Benchmark
+Per-request cost of bearer token checks, in microseconds:
+- full verification (HMAC + decode, cache cleared before each call)
+- verify_token() on a token in the verified-token cache
+- a revocation lookup with --revoked entries in the list
+- GET /api/users/me through the Flask test client, next to GET /api/health
+  (no auth), so the difference is what @require_auth adds to a request
+
+Writes nothing to the database (revocations are added to this process's
+list only), but the revocation list loads once from revoked_tokens, so the
+schema must be there. Like the app, needs JWT_SECRET_KEY or SECRET_KEY
+(or FLASK_ENV=development).
+
+Run with: python data/scripts/bench_auth.py [--repeat 20000] [--revoked 100000]
+"""
+import argparse
+import secrets
+import statistics
+import time
+from types import SimpleNamespace
+from modules.auth import tokens
+from app import app
+
+
+def per_call_us(func, repeat):
+    """Median of 5 runs of `repeat` calls, in microseconds per call"""
+    runs = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        runs.append((time.perf_counter() - start) / repeat * 1_000_000)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20000, help='calls per run (requests use a tenth)')
+    parser.add_argument('--revoked', type=int, default=100_000, help='revoked tokens to put in the list')
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("TrinketHub - Auth Overhead Benchmark")
+    print("=" * 50)
+
+    token, claims = tokens.issue_token(SimpleNamespace(user_id=1, username='bench-auth'))
+    tokens.verify_token(token)   # loads the revocation list
+
+    def full_verify():
+        tokens.verified_token_cache.delete(token)
+        tokens.verify_token(token)
+
+    cold = per_call_us(full_verify, args.repeat)
+    cached = per_call_us(lambda: tokens.verify_token(token), args.repeat)
+    empty_lookup = per_call_us(lambda: claims['jti'] in tokens.revocation_list, args.repeat)
+    exp = claims['exp']
+    for _ in range(args.revoked):
+        tokens.revocation_list.add(secrets.token_hex(8), exp)
+    full_lookup = per_call_us(lambda: claims['jti'] in tokens.revocation_list, args.repeat)
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    requests = max(args.repeat // 10, 1)
+    baseline = per_call_us(lambda: client.get('/api/health'), requests)
+    authed = per_call_us(lambda: client.get('/api/users/me', headers=headers), requests)
+    assert client.get('/api/users/me', headers=headers).status_code == 200
+
+    print(f"\nfull verification (HMAC + decode) : {cold:>9.2f} us")
+    print(f"verify_token, cached             : {cached:>9.2f} us  ({cold / cached:.1f}x faster)")
+    print(f"revocation lookup, empty list    : {empty_lookup:>9.3f} us")
+    print(f"{f'revocation lookup, {len(tokens.revocation_list)} revoked':<33}: {full_lookup:>9.3f} us")
+    print(f"GET /api/health (no auth)        : {baseline:>9.2f} us")
+    print(f"GET /api/users/me (bearer token) : {authed:>9.2f} us  (+{authed - baseline:.2f} us)")
+    print(f"\ncache: {tokens.verified_token_cache.stats()}")
+    tokens.revocation_list.clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+TrinketHub - Checkout Benchmark
+Times OrderService.create_order against order size, next to the previous
+per-item implementation (one SELECT + one UPDATE + one commit per line item),
+and reports the round trips and commits each makes.
+
+Creates its own user and products (names start with "bench-checkout-") and
+deletes them afterwards. Needs a database with the schema loaded.
+
+Run with: python data/scripts/bench_checkout.py [--sizes 1,5,10,20,50] [--repeat 20]
+"""
+import argparse
+import statistics
+import time
+from sqlalchemy import text
+from config.database import SessionLocal, count_queries
+from modules.auth.models import User
+from modules.orders.models import Order, OrderItem
+from modules.products.models import Product
+from modules.products.services import ProductService
+from modules.orders.services import OrderService
+
+PREFIX = 'bench-checkout-'
+
+
+def legacy_create_order(db, user_id, items, shipping_address=None):
+    """The old create_order: per-item product lookup and per-item stock commit"""
+    total_amount = 0
+    order_items = []
+    for item in items:
+        product = ProductService.get_product_by_id(db, item['product_id'])
+        if not product:
+            return None
+        if product.stock_quantity < item['quantity']:
+            raise ValueError(f"Insufficient stock for product {product.name}")
+        total_amount += product.price * item['quantity']
+        order_items.append({'product_id': product.product_id, 'quantity': item['quantity'], 'price': product.price})
+
+    order = Order(user_id=user_id, total_amount=total_amount, shipping_address=shipping_address, status='pending')
+    db.add(order)
+    db.flush()
+    for item_data in order_items:
+        db.add(OrderItem(order_id=order.order_id, **item_data))
+        product = db.query(Product).filter(Product.product_id == item_data['product_id']).first()
+        product.stock_quantity -= item_data['quantity']
+        db.commit()
+        db.refresh(product)
+    db.commit()
+    db.refresh(order)
+    return order
+
+
+def setup(db, max_size):
+    user = User(username=f'{PREFIX}user', email=f'{PREFIX}user@example.com', password_hash='x')
+    db.add(user)
+    products = [
+        Product(name=f'{PREFIX}{i}', price=10 + i, stock_quantity=1_000_000, is_active=True)
+        for i in range(max_size)
+    ]
+    db.add_all(products)
+    db.commit()
+    return user.user_id, [product.product_id for product in products]
+
+
+def cleanup(db):
+    db.execute(text(
+        "DELETE FROM order_items WHERE order_id IN "
+        "(SELECT order_id FROM orders WHERE user_id IN (SELECT user_id FROM users WHERE username LIKE :p))"
+    ), {'p': PREFIX + '%'})
+    db.execute(text("DELETE FROM orders WHERE user_id IN (SELECT user_id FROM users WHERE username LIKE :p)"),
+               {'p': PREFIX + '%'})
+    db.execute(text("DELETE FROM products WHERE name LIKE :p"), {'p': PREFIX + '%'})
+    db.execute(text("DELETE FROM users WHERE username LIKE :p"), {'p': PREFIX + '%'})
+    db.commit()
+
+
+def measure(create, user_id, product_ids, size, repeat):
+    items = [{'product_id': product_id, 'quantity': 1} for product_id in product_ids[:size]]
+    timings = []
+    db = SessionLocal()
+    try:
+        with count_queries() as queries:
+            create(db, user_id, items)
+        db.expunge_all()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            create(db, user_id, items)
+            timings.append(time.perf_counter() - start)
+            db.expunge_all()
+    finally:
+        db.close()
+    return statistics.median(timings), queries.count, queries.commits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1,5,10,20,50', help='comma-separated line-item counts')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print("=" * 50)
+    print("TrinketHub - Checkout Benchmark")
+    print("=" * 50)
+    db = SessionLocal()
+    try:
+        cleanup(db)
+        user_id, product_ids = setup(db, max(sizes))
+        print(f"\n{'items':>5} | {'legacy ms':>9} {'queries':>7} {'commits':>7} | "
+              f"{'current ms':>10} {'queries':>7} {'commits':>7} | {'speed-up':>8}")
+        for size in sizes:
+            legacy = measure(legacy_create_order, user_id, product_ids, size, args.repeat)
+            current = measure(OrderService.create_order, user_id, product_ids, size, args.repeat)
+            print(f"{size:>5} | {legacy[0] * 1000:>9.2f} {legacy[1]:>7} {legacy[2]:>7} | "
+                  f"{current[0] * 1000:>10.2f} {current[1]:>7} {current[2]:>7} | {legacy[0] / current[0]:>7.1f}x")
+    finally:
+        cleanup(db)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+TrinketHub - Login Benchmark
+Hammers POST /api/users/login from --clients threads for --seconds per
+hashing pool size, and reports logins/second, latency, how many requests
+were turned away with 503 (queue full), and how long a request that does
+no hashing (GET /api/users/<id>) takes meanwhile. Worker count 0 hashes
+inline on the request thread, as before modules/auth/hashing.py.
+
+Creates its own user (username starts with "bench-login-") and deletes it
+afterwards. Needs a database with the schema loaded.
+
+Run with: python data/scripts/bench_login.py [--workers 0,1,2,4,8] [--clients 16] [--seconds 5] [--rounds 12]
+"""
+import argparse
+import statistics
+import threading
+import time
+from sqlalchemy import text
+from config.database import SessionLocal
+from modules.auth.models import User
+from modules.auth.hashing import password_hasher
+from app import app
+
+PREFIX = 'bench-login-'
+PASSWORD = 'bench-password'
+
+
+def setup(db):
+    user = User(username=f'{PREFIX}user', email=f'{PREFIX}user@example.com')
+    user.set_password(PASSWORD)
+    db.add(user)
+    db.commit()
+    return user.user_id, user.email
+
+
+def cleanup(db):
+    db.execute(text("DELETE FROM users WHERE username LIKE :p"), {'p': PREFIX + '%'})
+    db.commit()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(user_id, email, clients, seconds):
+    deadline = time.perf_counter() + seconds
+    lock = threading.Lock()
+    latencies, probes = [], []
+    counts = {'ok': 0, 'busy': 0, 'error': 0}
+
+    def login_client():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = client.post('/api/users/login', json={'email': email, 'password': PASSWORD})
+            elapsed = time.perf_counter() - start
+            key = {200: 'ok', 503: 'busy'}.get(response.status_code, 'error')
+            with lock:
+                counts[key] += 1
+                if key == 'ok':
+                    latencies.append(elapsed)
+
+    def probe_client():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            client.get(f'/api/users/{user_id}')
+            probes.append(time.perf_counter() - start)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=login_client) for _ in range(clients)]
+    threads.append(threading.Thread(target=probe_client))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts, latencies, probes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='0,1,2,4,8', help='comma-separated hashing pool sizes')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent login threads')
+    parser.add_argument('--seconds', type=float, default=5.0, help='duration per pool size')
+    parser.add_argument('--rounds', type=int, default=password_hasher.rounds, help='bcrypt cost factor')
+    parser.add_argument('--queue-limit', type=int, default=None, help='waiting hashes allowed (default 2 x workers)')
+    args = parser.parse_args()
+    worker_counts = [int(workers) for workers in args.workers.split(',')]
+
+    print("=" * 50)
+    print("TrinketHub - Login Benchmark")
+    print("=" * 50)
+    password_hasher.configure(workers=0, rounds=args.rounds)
+    db = SessionLocal()
+    try:
+        cleanup(db)
+        user_id, email = setup(db)
+        print(f"\ncost {args.rounds}, {args.clients} clients, {args.seconds:g}s per run")
+        print(f"\n{'workers':>7} | {'logins/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'503s':>6} {'errors':>6} | "
+              f"{'other p50 ms':>12} {'p95 ms':>8}")
+        for workers in worker_counts:
+            queue_limit = args.queue_limit if args.queue_limit is not None else 2 * max(workers, 1)
+            password_hasher.configure(workers=workers, queue_limit=queue_limit)
+            counts, latencies, probes = run(user_id, email, args.clients, args.seconds)
+            label = f"{workers}" if workers else "inline"
+            print(f"{label:>7} | {counts['ok'] / args.seconds:>8.1f} "
+                  f"{statistics.median(latencies) * 1000 if latencies else 0:>8.1f} "
+                  f"{percentile(latencies, 0.95) * 1000:>8.1f} {counts['busy']:>6} {counts['error']:>6} | "
+                  f"{statistics.median(probes) * 1000 if probes else 0:>12.1f} "
+                  f"{percentile(probes, 0.95) * 1000:>8.1f}")
+    finally:
+        password_hasher.configure(workers=0)
+        cleanup(db)
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
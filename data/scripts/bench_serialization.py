@@ -0,0 +1,106 @@
+"""
+TrinketHub - Serialization Benchmark
+Compares the list-endpoint JSON paths on a 10k-row page:
+  - ORM path:  Product objects -> to_dict() -> json.dumps   (what the endpoints used to do)
+  - Fast path: Core rows of PRODUCT_LIST_COLUMNS -> product_list_encoder
+
+By default only the encoding step is timed, on in-memory data (no database needed).
+With --db both paths are timed end to end against the configured database,
+query and hydration included (seed it first, e.g. with seed_trinkets.py).
+
+Run with: python data/scripts/bench_serialization.py [--rows 10000] [--repeat 5] [--db]
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from decimal import Decimal
+from modules.models import configure_mappers
+from modules.products.models import Product
+from modules.products.services import PRODUCT_LIST_COLUMNS, product_list_encoder
+
+
+def make_products(count):
+    now = datetime.utcnow()
+    return [
+        Product(
+            product_id=i, name=f'First Edition Charizard Pokemon Card #{i}', category_id=11,
+            price=Decimal('450.00') + i, description='First edition base set Charizard. ' * 8,
+            brand='Wizards of the Coast', stock_quantity=1, image_url=f'https://img.example.com/{i}.jpg',
+            condition='near_mint', year_manufactured=1999, rarity='ultra_rare', material='cardboard',
+            dimensions='3.5x2.5 inches', authenticity_verified=True, suggested_price=Decimal('470.00'),
+            price_confidence='high', market_average=Decimal('455.25'), created_at=now, updated_at=now,
+            is_active=True,
+        )
+        for i in range(count)
+    ]
+
+
+def as_rows(products):
+    """The tuples a select of PRODUCT_LIST_COLUMNS would return"""
+    keys = [column.key for column in PRODUCT_LIST_COLUMNS]
+    return [tuple(getattr(product, key) for key in keys) for product in products]
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def report(label, orm_seconds, fast_seconds, rows):
+    print(f"\n{label}")
+    print(f"  ORM + to_dict : {orm_seconds * 1000:8.1f} ms  ({rows / orm_seconds:,.0f} rows/s)")
+    print(f"  RowEncoder    : {fast_seconds * 1000:8.1f} ms  ({rows / fast_seconds:,.0f} rows/s)")
+    print(f"  Speed-up      : {orm_seconds / fast_seconds:8.1f}x")
+
+
+def bench_encoding(rows, repeat):
+    products = make_products(rows)
+    tuples = as_rows(products)
+    orm = best_of(repeat, lambda: json.dumps([product.to_dict() for product in products]))
+    fast = best_of(repeat, lambda: product_list_encoder.encode_many(tuples))
+    report(f"Encoding only, {rows:,} rows (best of {repeat})", orm, fast, rows)
+
+
+def bench_database(rows, repeat):
+    from config.database import SessionLocal
+    db = SessionLocal()
+    try:
+        def orm_path():
+            products = db.query(Product).filter(Product.is_active == True).limit(rows).all()
+            json.dumps([product.to_dict() for product in products])
+            db.expunge_all()
+
+        def fast_path():
+            result = db.query(*PRODUCT_LIST_COLUMNS).filter(Product.is_active == True).limit(rows).all()
+            product_list_encoder.encode_many(result)
+
+        orm = best_of(repeat, orm_path)
+        fast = best_of(repeat, fast_path)
+        report(f"Query + hydrate + encode, up to {rows:,} rows (best of {repeat})", orm, fast, rows)
+    finally:
+        db.close()
+
+
+def main():
+    configure_mappers()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db', action='store_true', help='also time the full path against the database')
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("TrinketHub - Serialization Benchmark")
+    print("=" * 50)
+    bench_encoding(args.rows, args.repeat)
+    if args.db:
+        bench_database(args.rows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
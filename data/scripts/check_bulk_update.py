@@ -0,0 +1,82 @@
+"""
+TrinketHub - Bulk Product Update Check
+Runs PATCH /products through the Flask test client against its own
+products and checks the results in the database:
+- repricing and restocking in one request
+- clearing optional fields with null, including a group in which every
+  row is null (the VALUES column then has no type of its own)
+- all-or-nothing: one invalid delta means nothing is written
+
+Creates its own rows (names start with "bulk-update-check-") and deletes
+them afterwards. Needs a database with the schema loaded. Exits with
+status 1 on any failure, so it can run in CI.
+
+Run with: python data/scripts/check_bulk_update.py
+"""
+import sys
+from sqlalchemy import text
+from config.database import SessionLocal
+from modules.products.models import Product
+from app import app
+
+PREFIX = 'bulk-update-check-'
+
+
+def setup(db):
+    products = [Product(name=f'{PREFIX}{i}', price=10, stock_quantity=5, is_active=True,
+                        suggested_price=12, market_average=11, price_confidence='high')
+                for i in range(4)]
+    db.add_all(products)
+    db.commit()
+    return [product.product_id for product in products]
+
+
+def cleanup(db):
+    db.execute(text("DELETE FROM products WHERE name LIKE :p"), {'p': PREFIX + '%'})
+    db.commit()
+
+
+def fetch(db, product_id):
+    db.expire_all()
+    return db.query(Product).filter(Product.product_id == product_id).one()
+
+
+def main():
+    print("=" * 50)
+    print("TrinketHub - Bulk Product Update Check")
+    print("=" * 50)
+
+    db = SessionLocal()
+    cleanup(db)
+    ids = setup(db)
+    client = app.test_client()
+    checks = [
+        ('price + stock', [{'product_id': ids[0], 'price': 19.99, 'stock_quantity': 2}], 200,
+         lambda: float(fetch(db, ids[0]).price) == 19.99 and fetch(db, ids[0]).stock_quantity == 2),
+        ('clear one field (all rows null)', [{'product_id': ids[1], 'suggested_price': None}], 200,
+         lambda: fetch(db, ids[1]).suggested_price is None),
+        ('clear several fields', [{'product_id': ids[2], 'market_average': None, 'price_confidence': None},
+                                  {'product_id': ids[3], 'market_average': None, 'price_confidence': None}], 200,
+         lambda: all(fetch(db, i).market_average is None and fetch(db, i).price_confidence is None for i in ids[2:])),
+        ('null on a required field', [{'product_id': ids[3], 'suggested_price': None},
+                                      {'product_id': ids[3], 'price': None}], 400,
+         lambda: fetch(db, ids[3]).suggested_price is not None),
+    ]
+
+    failed = False
+    try:
+        for name, updates, status, verify in checks:
+            response = client.patch('/products', json={'updates': updates})
+            ok = response.status_code == status and verify()
+            failed = failed or not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name:<32} HTTP {response.status_code} (expected {status})")
+    finally:
+        cleanup(db)
+        db.close()
+
+    print("\nResult: " + ("FAIL" if failed else "OK"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
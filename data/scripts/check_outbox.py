@@ -0,0 +1,159 @@
+"""
+TrinketHub - Outbox Delivery Check
+Exercises the order outbox end to end with an in-process handler, no broker:
+creates orders, moves them through status changes and cancellations, then
+drains order_events with several concurrent workers while one handler fails
+on the first delivery of some events.
+
+Checks that every transition produced exactly one event (in order, per
+order), that every event reached the handler at least once, that failed
+deliveries were retried, and that nothing is left pending. Prints delivery
+throughput and lag.
+
+Creates its own rows (names start with "outbox-check-") and deletes them
+afterwards. Refuses to run if other pending events exist, since its handler
+would consume them. Exits with status 1 on any failure.
+
+Run with: python data/scripts/check_outbox.py [--orders 200] [--workers 4] [--batch-size 100]
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from config.database import SessionLocal
+from modules.auth.models import User
+from modules.products.models import Product
+from modules.orders.models import OrderEvent
+from modules.orders.services import OrderService
+from modules.orders.outbox import OutboxProcessor
+
+PREFIX = 'outbox-check-'
+# Transitions applied to each order after it is created
+FLOWS = [
+    ['processing', 'shipped', 'delivered'],
+    ['processing', 'cancel'],
+    ['cancel'],
+]
+
+
+def setup(db):
+    user = User(username=f'{PREFIX}user', email=f'{PREFIX}user@example.com', password_hash='x')
+    product = Product(name=f'{PREFIX}product', price=10, stock_quantity=1_000_000, is_active=True)
+    db.add_all([user, product])
+    db.commit()
+    return user.user_id, product.product_id
+
+
+def cleanup(db):
+    params = {'p': PREFIX + '%'}
+    db.execute(text(
+        "DELETE FROM order_items WHERE order_id IN (SELECT order_id FROM orders WHERE user_id IN "
+        "(SELECT user_id FROM users WHERE username LIKE :p))"), params)
+    db.execute(text("DELETE FROM orders WHERE user_id IN (SELECT user_id FROM users WHERE username LIKE :p)"), params)
+    db.execute(text("DELETE FROM products WHERE name LIKE :p"), params)
+    db.execute(text("DELETE FROM users WHERE username LIKE :p"), params)
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4, help='concurrent outbox workers (threads)')
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("TrinketHub - Outbox Delivery Check")
+    print("=" * 50)
+
+    db = SessionLocal()
+    cleanup(db)
+    if db.query(OrderEvent).filter(OrderEvent.status == 'pending').count():
+        print("Other pending order events exist; run this against a test database.")
+        sys.exit(1)
+
+    processor = OutboxProcessor()
+    received = defaultdict(list)        # order_id -> [(event_id, to_status)]
+    deliveries = defaultdict(int)       # event_id -> times handled
+    failed_once = set()
+    lock = threading.Lock()
+
+    @processor.handler('*')
+    def collect(_db, event):
+        with lock:
+            deliveries[event['event_id']] += 1
+            # Every 7th event fails on its first delivery, to exercise retries
+            if event['event_id'] % 7 == 0 and event['event_id'] not in failed_once:
+                failed_once.add(event['event_id'])
+                raise RuntimeError("simulated handler failure")
+            received[event['order_id']].append((event['event_id'], event['to_status']))
+
+    failed = False
+    try:
+        user_id, product_id = setup(db)
+        expected = {}
+        start = time.perf_counter()
+        for i in range(args.orders):
+            order = OrderService.create_order(db, user_id, [{'product_id': product_id, 'quantity': 1}])
+            statuses = ['pending']
+            for step in FLOWS[i % len(FLOWS)]:
+                if step == 'cancel':
+                    OrderService.cancel_order(db, order.order_id)
+                    statuses.append('cancelled')
+                else:
+                    OrderService.update_order_status(db, order.order_id, step)
+                    statuses.append(step)
+            expected[order.order_id] = statuses
+        print(f"\nWrote {args.orders} orders and {sum(map(len, expected.values()))} transitions "
+              f"in {time.perf_counter() - start:.2f}s")
+        print(f"Backlog before draining: {OutboxProcessor.lag(db)}")
+
+        def worker(_):
+            session = SessionLocal()
+            try:
+                return processor.drain(session, batch_size=args.batch_size)
+            finally:
+                session.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(worker, range(args.workers)))
+        # Retries are backed off; make them due now rather than waiting
+        db.execute(text("UPDATE order_events SET available_at = now() WHERE status = 'pending'"))
+        db.commit()
+        processor.drain(db, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+
+        events = sum(map(len, expected.values()))
+        stats = processor.stats()
+        print(f"Drained with {args.workers} workers in {elapsed:.2f}s "
+              f"({events / elapsed:.0f} events/s)")
+        print(f"Processor stats: {stats}")
+        lag = OutboxProcessor.lag(db)
+        print(f"Backlog after draining:  {lag}\n")
+
+        checks = {
+            'one event per transition, in order': all(
+                [status for _, status in sorted(received[order_id])] == statuses
+                for order_id, statuses in expected.items()
+            ),
+            'every event delivered':              sum(map(len, received.values())) == events,
+            'failed deliveries retried':          stats['retried'] == len(failed_once) > 0,
+            'nothing left pending':               lag['pending'] == 0 and lag['failed'] == 0,
+        }
+        for name, ok in checks.items():
+            failed = failed or not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name}")
+    finally:
+        cleanup(db)
+        db.close()
+
+    print("\nResult: " + ("FAIL" if failed else "OK"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
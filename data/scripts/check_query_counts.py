@@ -0,0 +1,120 @@
+"""
+TrinketHub - Order Query Count Check
+Guards the order endpoints against N+1 regressions: seeds 10 orders of 5
+items each, calls every order read (and checkout) through the Flask test
+client, and fails if any makes more round trips than its budget. The
+budgets don't depend on how many orders or items there are.
+
+Also shows what the old lazy-loading path (Order.to_dict() walking
+order_items -> product) costs on the same data, for comparison.
+
+Creates its own rows (names start with "query-count-") and deletes them
+afterwards. Needs a database with the schema loaded. Exits with status 1
+on any failure, so it can run in CI.
+
+Run with: python data/scripts/check_query_counts.py
+"""
+import sys
+from sqlalchemy import text
+from config.database import SessionLocal, count_queries
+from modules.auth.models import User
+from modules.orders.models import Order
+from modules.products.models import Product
+from modules.orders.services import OrderService
+from app import app
+
+PREFIX = 'query-count-'
+ORDERS = 10
+ITEMS_PER_ORDER = 5
+
+# endpoint -> max round trips
+BUDGETS = {
+    'GET /orders/<id>':       3,   # version probe, order, items + product summaries
+    'GET /orders':            2,   # order page, all items of the page
+    'GET /orders/user/<id>':  2,
+    'PUT /<id>/status':       5,   # lock, update, outbox event, reload order, items
+    'POST /orders':           6,   # take stock, insert order, insert items, outbox event, reload order, items
+    'PATCH /orders/status':   6,   # lock orders, UPDATE per target status (2), cancelled items, stock, events
+}
+
+
+def setup(db):
+    user = User(username=f'{PREFIX}user', email=f'{PREFIX}user@example.com', password_hash='x')
+    products = [Product(name=f'{PREFIX}{i}', price=5, stock_quantity=1000, is_active=True)
+                for i in range(ORDERS * ITEMS_PER_ORDER)]
+    db.add(user)
+    db.add_all(products)
+    db.commit()
+    user_id = user.user_id
+    product_ids = [product.product_id for product in products]
+    order_ids = []
+    for start in range(0, len(product_ids), ITEMS_PER_ORDER):
+        items = [{'product_id': product_id, 'quantity': 1}
+                 for product_id in product_ids[start:start + ITEMS_PER_ORDER]]
+        order_ids.append(OrderService.create_order(db, user_id, items).order_id)
+    db.expunge_all()
+    return user_id, items, order_ids
+
+
+def cleanup(db):
+    params = {'p': PREFIX + '%'}
+    db.execute(text(
+        "DELETE FROM order_items WHERE order_id IN (SELECT order_id FROM orders WHERE user_id IN "
+        "(SELECT user_id FROM users WHERE username LIKE :p))"), params)
+    db.execute(text("DELETE FROM orders WHERE user_id IN (SELECT user_id FROM users WHERE username LIKE :p)"), params)
+    db.execute(text("DELETE FROM products WHERE name LIKE :p"), params)
+    db.execute(text("DELETE FROM users WHERE username LIKE :p"), params)
+    db.commit()
+
+
+def lazy_loading_cost(db, user_id):
+    """Round trips for ORDERS orders serialized the old way (lazy items, lazy products)"""
+    with count_queries() as queries:
+        orders = db.query(Order).filter(Order.user_id == user_id).limit(ORDERS).all()
+        [order.to_dict() for order in orders]
+    db.expunge_all()
+    return queries.count
+
+
+def main():
+    print("=" * 50)
+    print("TrinketHub - Order Query Count Check")
+    print("=" * 50)
+
+    db = SessionLocal()
+    cleanup(db)
+    user_id, items, order_ids = setup(db)
+    client = app.test_client()
+    calls = {
+        'GET /orders/<id>':      lambda: client.get(f'/orders/{order_ids[0]}'),
+        'GET /orders':           lambda: client.get(f'/orders?limit={ORDERS}'),
+        'GET /orders/user/<id>': lambda: client.get(f'/orders/user/{user_id}?limit={ORDERS}'),
+        'PUT /<id>/status':      lambda: client.put(f'/{order_ids[1]}/status', json={'status': 'processing'}),
+        'POST /orders':          lambda: client.post('/orders', json={'user_id': user_id, 'items': items}),
+        'PATCH /orders/status':  lambda: client.patch('/orders/status', json={'updates': [
+            {'order_id': order_id, 'status': 'processing' if i % 2 else 'cancelled'}
+            for i, order_id in enumerate(order_ids[2:])
+        ]}),
+    }
+
+    failed = False
+    try:
+        print(f"\n{ORDERS} orders x {ITEMS_PER_ORDER} items")
+        print(f"Lazy-loading to_dict() path : {lazy_loading_cost(db, user_id)} queries\n")
+        for name, call in calls.items():
+            with count_queries() as queries:
+                response = call()
+            ok = response.status_code < 400 and queries.count <= BUDGETS[name]
+            failed = failed or not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name:<24} {queries.count:>3} queries "
+                  f"(budget {BUDGETS[name]}, HTTP {response.status_code})")
+    finally:
+        cleanup(db)
+        db.close()
+
+    print("\nResult: " + ("FAIL" if failed else "OK"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+TrinketHub - Bulk User Provisioning
+Creates user accounts from a CSV or NDJSON file (e.g. sellers migrated from
+another marketplace) with UserService.bulk_create_users: one uniqueness
+query and one INSERT per batch, passwords hashed across a process pool.
+
+Each record needs username, email and either password (hashed here) or
+password_hash (an existing bcrypt hash, kept as is); first_name and
+last_name are optional. Rows that are invalid or whose email or username is
+already taken are skipped; --report writes every one of them as NDJSON.
+
+bcrypt is the slow part: 100k passwords at cost 12 (~250 ms each) take
+about 50 minutes on 8 cores. --rounds 10 provisions 4x faster, and each
+account is re-hashed at BCRYPT_ROUNDS the first time its owner logs in.
+
+Run with: python data/scripts/provision_users.py sellers.csv [--workers 8] [--rounds 10] [--report conflicts.ndjson]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from config.database import SessionLocal
+from modules.models import configure_mappers
+from modules.auth.hashing import password_hasher
+from modules.auth.services import UserService, PROVISION_BATCH_SIZE
+from modules.common.streaming import iter_records, detect_format
+
+
+def main():
+    configure_mappers()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='CSV or NDJSON file ("-" for stdin)')
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='default: from the file extension')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='hashing processes')
+    parser.add_argument('--rounds', type=int, default=password_hasher.rounds, help='bcrypt cost factor')
+    parser.add_argument('--batch-size', type=int, default=PROVISION_BATCH_SIZE)
+    parser.add_argument('--report', help='write every skipped row to this NDJSON file')
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None and args.path != '-':
+        fmt = 'csv' if args.path.lower().endswith('.csv') else 'ndjson'
+    fmt = detect_format(fmt, None)
+
+    print("=" * 50)
+    print("TrinketHub - Bulk User Provisioning")
+    print("=" * 50)
+    print(f"\n{args.path} ({fmt}), {args.workers} hashing processes, cost {args.rounds}")
+
+    stream = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            report = UserService.bulk_create_users(
+                db, iter_records(stream, fmt), executor=executor, rounds=args.rounds,
+                batch_size=args.batch_size, max_errors=None if args.report else 20,
+            )
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        if stream is not sys.stdin.buffer:
+            stream.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"\nInserted : {report['inserted']}")
+    print(f"Skipped  : {report['failed']} ({report['conflicts']} already registered)")
+    print(f"Time     : {elapsed:.1f}s ({report['inserted'] / elapsed:.0f} users/s)")
+    if args.report:
+        with open(args.report, 'w') as out:
+            for error in report['errors']:
+                out.write(json.dumps(error) + '\n')
+        print(f"Report   : {args.report}")
+    else:
+        for error in report['errors']:
+            print(f"  row {error['row']}: {'; '.join(error['errors'])}")
+        if report['errors_truncated']:
+            print("  ... (use --report for every skipped row)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+TrinketHub - Outbox Worker
+Delivers pending order_events (see modules/orders/outbox.py) to the
+handlers registered in this process, in batches. Run as many workers as
+needed: each claims its batch with SKIP LOCKED.
+
+Drain once:      python data/scripts/run_outbox_worker.py
+Keep running:    python data/scripts/run_outbox_worker.py --loop --interval 1
+Print events:    python data/scripts/run_outbox_worker.py --loop --echo
+"""
+import argparse
+import json
+import time
+from config.database import SessionLocal
+from modules.models import configure_mappers
+from modules.orders.outbox import outbox_processor, OUTBOX_BATCH_SIZE
+# Importing a module registers its handlers with outbox_processor
+import modules.analytics.sales  # noqa: F401  (cancellations -> sales rollup dirty days)
+
+
+def echo(db, event):
+    print(f"  event {event['event_id']}: {event['event_type']} order {event['order_id']} "
+          f"{event['from_status']} -> {event['to_status']}")
+
+
+def run_once(args) -> int:
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        handled = outbox_processor.drain(db, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        if handled or not args.loop:
+            print(f"  outbox: {handled} events in {elapsed:.2f}s | lag {json.dumps(outbox_processor.lag(db))}")
+        return handled
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def main():
+    configure_mappers()
+    parser = argparse.ArgumentParser(description="Deliver pending order events to handlers")
+    parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+    parser.add_argument('--loop', action='store_true', help='keep polling every --interval seconds when idle')
+    parser.add_argument('--interval', type=float, default=1.0)
+    parser.add_argument('--echo', action='store_true', help='print every event delivered')
+    args = parser.parse_args()
+
+    if args.echo:
+        outbox_processor.register('*', echo)
+    while True:
+        run_once(args)
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+    print(f"  totals: {json.dumps(outbox_processor.stats())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+TrinketHub - Rollup Runner
+Folds new events into the pre-aggregated analytics tables.
+Each run only reads what arrived since the last one, so it is cheap to run often.
+
+Run once:        python data/scripts/run_rollups.py trending
+Keep running:    python data/scripts/run_rollups.py all --loop --interval 60
+Rebuild sales history: python data/scripts/backfill_sales.py
+"""
+import argparse
+import time
+from config.database import SessionLocal
+from modules.models import configure_mappers
+from modules.analytics.trending import TrendingService
+from modules.analytics.sales import SalesRollupService
+
+
+def run_trending(args):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        folded = TrendingService.run_rollup(db)
+        elapsed = time.perf_counter() - start
+        print(f"  trending: {folded} in {elapsed:.2f}s")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def run_sales(args):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        folded = SalesRollupService.run_rollup(db)
+        elapsed = time.perf_counter() - start
+        print(f"  sales: {folded} in {elapsed:.2f}s")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+ROLLUPS = {
+    'trending': run_trending,
+    'sales': run_sales,
+}
+
+
+def main():
+    configure_mappers()
+    parser = argparse.ArgumentParser(description="Run incremental analytics rollups")
+    parser.add_argument('rollup', choices=[*ROLLUPS, 'all'])
+    parser.add_argument('--loop', action='store_true', help='keep running every --interval seconds')
+    parser.add_argument('--interval', type=float, default=60)
+    args = parser.parse_args()
+
+    names = list(ROLLUPS) if args.rollup == 'all' else [args.rollup]
+    while True:
+        for name in names:
+            ROLLUPS[name](args)
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
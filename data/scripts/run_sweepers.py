@@ -0,0 +1,105 @@
+"""
+TrinketHub - Sweeper Runner
+Deletes expired rows in small batches. Rows still locked by a live request
+are skipped (FOR UPDATE SKIP LOCKED), so sweeping never blocks checkout.
+Expired reservations are also released by checkout itself when they stand
+in the way of a sale, so the interval only bounds how long listings show
+lapsed holds as unavailable.
+
+Run once:        python data/scripts/run_sweepers.py reservations
+Keep running:    python data/scripts/run_sweepers.py all --loop --interval 300
+"""
+import argparse
+import time
+from config.database import SessionLocal
+from modules.models import configure_mappers
+from modules.orders.idempotency import IdempotencyService
+from modules.orders.outbox import OutboxProcessor
+from modules.products.reservations import ReservationService
+from modules.auth import tokens
+
+
+def run_idempotency(args):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        deleted = IdempotencyService.sweep_expired(db, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"  idempotency: {deleted} expired keys deleted in {elapsed:.2f}s")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def run_reservations(args):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        released = ReservationService.sweep_expired(db, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"  reservations: {released} expired holds released in {elapsed:.2f}s")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def run_outbox(args):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        deleted = OutboxProcessor.sweep_delivered(db, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"  outbox: {deleted} delivered events deleted in {elapsed:.2f}s")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def run_tokens(args):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        deleted = tokens.sweep_expired(db, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"  tokens: {deleted} expired revocations deleted in {elapsed:.2f}s")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+SWEEPERS = {
+    'idempotency': run_idempotency,
+    'reservations': run_reservations,
+    'outbox': run_outbox,
+    'tokens': run_tokens,
+}
+
+
+def main():
+    configure_mappers()
+    parser = argparse.ArgumentParser(description="Delete expired rows")
+    parser.add_argument('sweeper', choices=[*SWEEPERS, 'all'])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--loop', action='store_true', help='keep running every --interval seconds')
+    parser.add_argument('--interval', type=float, default=300)
+    args = parser.parse_args()
+
+    names = list(SWEEPERS) if args.sweeper == 'all' else [args.sweeper]
+    while True:
+        for name in names:
+            SWEEPERS[name](args)
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
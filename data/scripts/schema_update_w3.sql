@@ -0,0 +1,232 @@
+-- ============================================================
+-- TrinketHub - Week 3 Schema Updates
+-- Search and performance work on the catalog
+-- Run AFTER schema.sql and schema_update_w2.sql:
+--   psql trinket_db < data/scripts/schema_update_w3.sql
+-- ============================================================
+
+
+-- ============================================================
+-- PRODUCT FULL-TEXT SEARCH
+-- Generated tsvector kept in sync by Postgres on every write.
+-- Weights: name = A, brand = B, description = C
+-- (ts_rank_cd scores A matches highest)
+-- ============================================================
+ALTER TABLE products
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(brand, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING GIN (search_vector);
+
+
+-- ============================================================
+-- KEYSET PAGINATION INDEXES
+-- List endpoints page with WHERE (sort_col, pk) > (:last_value, :last_pk)
+-- ORDER BY sort_col, pk LIMIT n. One (sort column, primary key) index per
+-- listing order lets every page start with an index seek, so page N costs
+-- the same as page 1. Btree indexes scan backwards, so the same index
+-- serves both the ascending and descending sort.
+-- ============================================================
+CREATE INDEX IF NOT EXISTS idx_products_active_created ON products(created_at, product_id) WHERE is_active;
+CREATE INDEX IF NOT EXISTS idx_products_active_price   ON products(price, product_id)      WHERE is_active;
+CREATE INDEX IF NOT EXISTS idx_orders_date_id          ON orders(order_date, order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_user_date_id     ON orders(user_id, order_date, order_id);
+CREATE INDEX IF NOT EXISTS idx_users_created_id        ON users(created_at, user_id);
+
+
+-- ============================================================
+-- INCREMENTAL CATALOG EXPORT
+-- GET /api/products/export?updated_since=... reads products in
+-- (updated_at, product_id) order from this index.
+-- ============================================================
+CREATE INDEX IF NOT EXISTS idx_products_updated_id ON products(updated_at, product_id);
+
+
+-- ============================================================
+-- ROLLUP STATE
+-- High-water marks for incremental rollup jobs
+-- (data/scripts/run_rollups.py). One row per rollup.
+-- ============================================================
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name        VARCHAR(100) PRIMARY KEY,
+    position    BIGINT NOT NULL DEFAULT 0,   -- last source id folded in
+    position_at TIMESTAMP,                   -- time marker (e.g. trending epoch)
+    updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+
+-- ============================================================
+-- TRENDING (time-decayed popularity)
+-- Scores are stored relative to the trending epoch, so ranking
+-- by score is an index scan. See modules/analytics/trending.py
+-- ============================================================
+CREATE TABLE IF NOT EXISTS product_popularity (
+    product_id  INT PRIMARY KEY REFERENCES products(product_id) ON DELETE CASCADE,
+    category_id INT,
+    score       DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_product_popularity_score          ON product_popularity(score);
+CREATE INDEX IF NOT EXISTS idx_product_popularity_category_score ON product_popularity(category_id, score);
+
+CREATE TABLE IF NOT EXISTS category_popularity (
+    category_id INT PRIMARY KEY,
+    score       DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_category_popularity_score ON category_popularity(score);
+
+
+-- ============================================================
+-- FUZZY NAME SEARCH (pg_trgm)
+-- GET /api/product/search?fuzzy=1 uses this GiST trigram index for a
+-- nearest-neighbour scan (ORDER BY name <->> query LIMIT n).
+-- Skipped with a notice if pg_trgm cannot be installed; the API
+-- then falls back to an in-process trigram index.
+-- ============================================================
+DO $$
+BEGIN
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS idx_products_name_trgm
+        ON products USING gist (name gist_trgm_ops) WHERE is_active;
+EXCEPTION WHEN OTHERS THEN
+    RAISE NOTICE 'pg_trgm unavailable (%), fuzzy search will use the in-process index', SQLERRM;
+END $$;
+
+
+-- ============================================================
+-- IDEMPOTENCY KEYS
+-- POST /api/orders with an Idempotency-Key header claims the key
+-- in the order's transaction; retries replay the stored response.
+-- Expired rows are deleted by data/scripts/run_sweepers.py.
+-- ============================================================
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id      INT NOT NULL,
+    key          VARCHAR(255) NOT NULL,
+    request_hash VARCHAR(64) NOT NULL,
+    order_id     INT REFERENCES orders(order_id) ON DELETE CASCADE,
+    status_code  INT,
+    response     TEXT,
+    created_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at   TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, key)
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_at);
+
+
+-- ============================================================
+-- STOCK RESERVATIONS
+-- Time-limited holds while a buyer pays. Held units are counted
+-- in products.reserved_quantity, so available stock is
+-- stock_quantity - reserved_quantity on the product row.
+-- Expired holds are released by data/scripts/run_sweepers.py.
+-- ============================================================
+ALTER TABLE products
+    ADD COLUMN IF NOT EXISTS reserved_quantity INT NOT NULL DEFAULT 0;
+
+-- Held units must exist, whichever path writes stock_quantity.
+-- NOT VALID: enforced for new writes without scanning existing rows.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ck_products_stock_covers_reserved') THEN
+        ALTER TABLE products ADD CONSTRAINT ck_products_stock_covers_reserved
+            CHECK (stock_quantity >= reserved_quantity) NOT VALID;
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    reservation_id SERIAL PRIMARY KEY,
+    product_id     INT NOT NULL REFERENCES products(product_id) ON DELETE CASCADE,
+    user_id        INT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    quantity       INT NOT NULL CHECK (quantity > 0),
+    created_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at     TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_expires ON stock_reservations(expires_at);
+CREATE INDEX IF NOT EXISTS idx_stock_reservations_user    ON stock_reservations(user_id);
+
+
+-- ============================================================
+-- ORDER EVENTS (transactional outbox)
+-- Written in the same transaction as each order status change and
+-- delivered by data/scripts/run_outbox_worker.py (SKIP LOCKED, so
+-- several workers can run). Delivered rows are deleted after
+-- OUTBOX_RETENTION_DAYS by data/scripts/run_sweepers.py.
+-- ============================================================
+CREATE TABLE IF NOT EXISTS order_events (
+    event_id     BIGSERIAL PRIMARY KEY,
+    order_id     INT NOT NULL REFERENCES orders(order_id) ON DELETE CASCADE,
+    event_type   VARCHAR(50) NOT NULL,
+    from_status  VARCHAR(50),
+    to_status    VARCHAR(50),
+    payload      TEXT NOT NULL,
+    status       VARCHAR(20) NOT NULL DEFAULT 'pending',   -- pending, done, failed
+    attempts     INT NOT NULL DEFAULT 0,
+    last_error   TEXT,
+    created_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    available_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_order_events_pending   ON order_events(available_at, event_id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_order_events_order     ON order_events(order_id);
+CREATE INDEX IF NOT EXISTS idx_order_events_processed ON order_events(processed_at) WHERE status = 'done';
+
+
+-- ============================================================
+-- SALES ROLLUPS
+-- Revenue, units and orders per day and dimension ('all',
+-- 'category', 'condition', 'rarity'), excluding cancelled orders.
+-- Folded in from a high-water mark on orders.order_date
+-- (rollup_state 'sales:orders'); days with cancellations are queued
+-- in sales_dirty_days and recomputed. See modules/analytics/sales.py
+-- ============================================================
+CREATE TABLE IF NOT EXISTS sales_daily (
+    dimension  VARCHAR(20)  NOT NULL,
+    day        DATE         NOT NULL,
+    value      VARCHAR(100) NOT NULL DEFAULT '',
+    orders     INT          NOT NULL DEFAULT 0,
+    units      INT          NOT NULL DEFAULT 0,
+    revenue    NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (dimension, day, value)
+);
+
+CREATE TABLE IF NOT EXISTS sales_dirty_days (
+    day       DATE PRIMARY KEY,
+    marked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+
+-- ============================================================
+-- REVOKED ACCESS TOKENS
+-- Tokens logged out before they expired, by jti. Workers keep an
+-- in-memory copy, refreshed from revoked_at (modules/auth/tokens.py).
+-- Rows past expires_at are deleted by data/scripts/run_sweepers.py.
+-- ============================================================
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    jti        VARCHAR(32) PRIMARY KEY,
+    user_id    INT NOT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    revoked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON revoked_tokens(revoked_at);
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires    ON revoked_tokens(expires_at);
+
+
+-- ============================================================
+-- NOT NULL SORT COLUMNS
+-- Keyset pagination compares (sort column, id) row values; a NULL
+-- there compares as neither before nor after a cursor, so those rows
+-- never appeared in a page. Rows missing a timestamp get the oldest
+-- one possible and sort last under "newest" (modules/common/pagination.py).
+-- ============================================================
+UPDATE users    SET created_at = TIMESTAMP '1970-01-01' WHERE created_at IS NULL;
+UPDATE products SET created_at = COALESCE(updated_at, TIMESTAMP '1970-01-01') WHERE created_at IS NULL;
+UPDATE orders   SET order_date = TIMESTAMP '1970-01-01' WHERE order_date IS NULL;
+ALTER TABLE users    ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE products ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE orders   ALTER COLUMN order_date SET NOT NULL;
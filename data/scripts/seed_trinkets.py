@@ -4,6 +4,7 @@ Populates the database with realistic trinket listings for testing.
 Run with: python data/scripts/seed_trinkets.py
 """
 from config.database import SessionLocal, init_db
+from modules.models import configure_mappers
 from modules.products.models import Product
 from modules.auth.models import User
 import random
@@ -347,6 +348,7 @@ def seed_trinkets(db):
 
 
 def main():
+    configure_mappers()
     print("=" * 50)
     print("TrinketHub - Seed Data Script")
     print("=" * 50)
@@ -0,0 +1,132 @@
+"""
+TrinketHub - Checkout Concurrency Stress Test
+Fires parallel checkouts at the same few products and checks nothing is
+oversold: successful orders must never take more units than were in stock,
+stock must never go negative, and order_items must add up to what was sold.
+
+Each checkout buys one unit of every stressed product, listed in a random
+order, so multi-item orders also exercise lock ordering (a deadlock shows
+up as an error).
+
+Creates its own users and products (names start with "stress-checkout-")
+and deletes them afterwards. Needs a database with the schema loaded.
+Exits with status 1 if an oversell is detected.
+
+Run with: python data/scripts/stress_checkout.py [--workers 16] [--attempts 200] [--stock 1] [--products 1]
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from config.database import SessionLocal
+from modules.auth.models import User
+from modules.products.models import Product
+from modules.orders.services import OrderService
+
+PREFIX = 'stress-checkout-'
+
+
+def setup(db, workers, products, stock):
+    users = [User(username=f'{PREFIX}{i}', email=f'{PREFIX}{i}@example.com', password_hash='x')
+             for i in range(workers)]
+    items = [Product(name=f'{PREFIX}{i}', price=25, stock_quantity=stock, is_active=True)
+             for i in range(products)]
+    db.add_all(users + items)
+    db.commit()
+    return [user.user_id for user in users], [product.product_id for product in items]
+
+
+def cleanup(db):
+    params = {'p': PREFIX + '%'}
+    db.execute(text(
+        "DELETE FROM order_items WHERE order_id IN (SELECT order_id FROM orders WHERE user_id IN "
+        "(SELECT user_id FROM users WHERE username LIKE :p))"), params)
+    db.execute(text("DELETE FROM orders WHERE user_id IN (SELECT user_id FROM users WHERE username LIKE :p)"), params)
+    db.execute(text("DELETE FROM products WHERE name LIKE :p"), params)
+    db.execute(text("DELETE FROM users WHERE username LIKE :p"), params)
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=16, help='concurrent buyers (threads)')
+    parser.add_argument('--attempts', type=int, default=200, help='total checkout attempts')
+    parser.add_argument('--stock', type=int, default=1, help='starting stock of each product')
+    parser.add_argument('--products', type=int, default=1, help='products per order')
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("TrinketHub - Checkout Concurrency Stress Test")
+    print("=" * 50)
+
+    db = SessionLocal()
+    cleanup(db)
+    user_ids, product_ids = setup(db, args.workers, args.products, args.stock)
+    outcomes = {'ok': 0, 'sold_out': 0, 'error': 0}
+    errors = []
+    lock = threading.Lock()
+    start_line = threading.Barrier(args.workers)
+
+    def buyer(worker):
+        start_line.wait()
+        session = SessionLocal()
+        try:
+            for attempt in range(worker, args.attempts, args.workers):
+                items = [{'product_id': product_id, 'quantity': 1} for product_id in product_ids]
+                random.shuffle(items)
+                try:
+                    OrderService.create_order(session, user_ids[worker], items)
+                    outcome = 'ok'
+                except ValueError:
+                    outcome = 'sold_out'
+                except Exception as e:
+                    session.rollback()
+                    outcome = 'error'
+                    with lock:
+                        errors.append(repr(e))
+                with lock:
+                    outcomes[outcome] += 1
+        finally:
+            session.close()
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            list(pool.map(buyer, range(args.workers)))
+        elapsed = time.perf_counter() - started
+
+        stock = dict(db.query(Product.product_id, Product.stock_quantity)
+                     .filter(Product.product_id.in_(product_ids)).all())
+        sold = dict(db.execute(text(
+            "SELECT product_id, COALESCE(SUM(quantity), 0) FROM order_items "
+            "WHERE product_id = ANY(:ids) GROUP BY product_id"), {'ids': product_ids}).all())
+
+        print(f"\nAttempts       : {args.attempts} from {args.workers} workers")
+        print(f"Orders placed  : {outcomes['ok']}")
+        print(f"Sold out       : {outcomes['sold_out']}")
+        print(f"Errors         : {outcomes['error']}")
+        print(f"Elapsed        : {elapsed:.2f} s ({args.attempts / elapsed:,.0f} checkouts/s)")
+
+        oversold = False
+        for product_id in product_ids:
+            units_sold = sold.get(product_id, 0)
+            if units_sold > args.stock or stock[product_id] < 0 or units_sold + stock[product_id] != args.stock:
+                oversold = True
+                print(f"OVERSOLD product {product_id}: stock {args.stock}, sold {units_sold}, left {stock[product_id]}")
+        if outcomes['ok'] > args.stock:
+            oversold = True
+            print(f"OVERSOLD: {outcomes['ok']} orders for {args.stock} units")
+        for error in errors[:5]:
+            print(f"  error: {error}")
+        print("\nResult         : " + ("FAIL - oversell detected" if oversold else "OK - no oversells"))
+    finally:
+        cleanup(db)
+        db.close()
+    sys.exit(1 if oversold else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""
+Gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+
+Threaded workers, so each process serves several requests at once. Password
+hashing runs on a bounded per-process pool (modules/auth/hashing.py); its
+503 backpressure only works when a process has more request threads than
+hash slots, which sync workers never do.
+"""
+import os
+
+bind = f"{os.getenv('API_HOST', '0.0.0.0')}:{os.getenv('API_PORT', 5000)}"
+worker_class = 'gthread'
+# WEB_CONCURRENCY is also read by hashing.py to size each worker's hashing pool
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = 60
@@ -0,0 +1,109 @@
+"""
+Analytics rollup models
+Pre-aggregated tables kept up to date incrementally by the rollup jobs
+(data/scripts/run_rollups.py), so read endpoints never scan raw events.
+"""
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Numeric, Date, DateTime, ForeignKey, Index, PrimaryKeyConstraint
+from datetime import datetime
+from config.database import Base
+
+
+class RollupState(Base):
+    """
+    Progress marker for one incremental rollup ("high-water mark").
+    position    - last source primary key already folded in (e.g. interaction_id)
+    position_at - timestamp marker, for rollups that track time instead of ids
+    """
+    __tablename__ = 'rollup_state'
+
+    name = Column(String(100), primary_key=True)
+    position = Column(BigInteger, nullable=False, default=0)
+    position_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'position': self.position,
+            'position_at': self.position_at.isoformat() if self.position_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def __repr__(self):
+        return f"<RollupState(name='{self.name}', position={self.position})>"
+
+
+class ProductPopularity(Base):
+    """
+    Time-decayed popularity per product (views, saves, purchases).
+
+    score is stored relative to the rollup epoch (see modules/analytics/trending.py):
+    an event at time t adds weight * 2^((t - epoch) / half_life). Ordering by the
+    stored score is the same as ordering by the decayed score at any moment,
+    so the trending list is a plain index scan.
+    """
+    __tablename__ = 'product_popularity'
+    __table_args__ = (
+        Index('idx_product_popularity_score', 'score'),
+        Index('idx_product_popularity_category_score', 'category_id', 'score'),
+    )
+
+    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), primary_key=True)
+    category_id = Column(Integer)
+    score = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ProductPopularity(product_id={self.product_id}, score={self.score})>"
+
+
+class CategoryPopularity(Base):
+    """Time-decayed popularity per category, same scoring as ProductPopularity"""
+    __tablename__ = 'category_popularity'
+    __table_args__ = (
+        Index('idx_category_popularity_score', 'score'),
+    )
+
+    category_id = Column(Integer, primary_key=True)
+    score = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CategoryPopularity(category_id={self.category_id}, score={self.score})>"
+
+
+class SalesDaily(Base):
+    """
+    Sales per day and dimension (see modules/analytics/sales.py), excluding
+    cancelled orders. dimension is 'all' (value '') or one of 'category',
+    'condition', 'rarity' with the product's value ('' when unset).
+    orders counts the orders with at least one item in the group, so
+    average order value for a range is sum(revenue) / sum(orders).
+    """
+    __tablename__ = 'sales_daily'
+    __table_args__ = (
+        # Range reads are "one dimension, a span of days"
+        PrimaryKeyConstraint('dimension', 'day', 'value'),
+    )
+
+    dimension = Column(String(20), nullable=False)
+    day = Column(Date, nullable=False)
+    value = Column(String(100), nullable=False, default='')
+    orders = Column(Integer, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SalesDaily(dimension='{self.dimension}', day={self.day}, value='{self.value}', revenue={self.revenue})>"
+
+
+class SalesDirtyDay(Base):
+    """A day whose sales_daily rows must be recomputed (an order on it was cancelled)"""
+    __tablename__ = 'sales_dirty_days'
+
+    day = Column(Date, primary_key=True)
+    marked_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<SalesDirtyDay(day={self.day})>"
@@ -0,0 +1,52 @@
+from flask import Blueprint, request, jsonify
+from datetime import date, datetime, timedelta
+from modules.analytics.sales import SalesAnalyticsService, GROUP_BYS
+from config.database import SessionLocal
+
+#Create a Blueprint for analytics
+analytics_bp = Blueprint('analytics', __name__)
+
+DEFAULT_RANGE_DAYS = 30
+
+
+def _parse_day(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+@analytics_bp.route('/analytics/sales', methods=['GET'])
+def get_sales():
+    """
+    Revenue dashboard figures, summed from the daily sales rollups
+    Endpoint: GET /api/analytics/sales?from=2024-01-01&to=2024-01-31&group_by=category
+
+    Query Parameters:
+    from, to (YYYY-MM-DD, inclusive, optional): default the last 30 days
+    group_by (optional, default: day): total, day, category, condition, rarity
+
+    Cancelled orders are excluded. Orders placed after "as_of" are not in the
+    figures yet (see data/scripts/run_rollups.py sales).
+
+    Returns:
+        200: { "from", "to", "group_by", "as_of",
+               "results": [{"day"|"category"|..., "orders", "units", "revenue", "average_order_value"}] }
+        400: Invalid dates or group_by
+    """
+    try:
+        day_to = _parse_day(request.args['to']) if request.args.get('to') else datetime.utcnow().date()
+        day_from = (_parse_day(request.args['from']) if request.args.get('from')
+                    else day_to - timedelta(days=DEFAULT_RANGE_DAYS - 1))
+    except ValueError:
+        return jsonify({"error": "from and to must be dates (YYYY-MM-DD)"}), 400
+    group_by = request.args.get('group_by', 'day')
+    if group_by not in GROUP_BYS:
+        return jsonify({"error": f"group_by must be one of: {', '.join(GROUP_BYS)}"}), 400
+
+    db = SessionLocal()
+    try:
+        return jsonify(SalesAnalyticsService.get_sales(db, day_from, day_to, group_by)), 200
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        db.close()
@@ -0,0 +1,312 @@
+"""
+Sales analytics - daily rollups of revenue, units and orders
+
+How it works:
+- sales_daily holds one row per (dimension, day, value): 'all' for store
+  totals, plus per category, condition and rarity. Any date range is then a
+  SUM over at most (days x values) small rows, never a scan of orders.
+- run_rollup() folds in orders placed since a high-water mark on order_date
+  (rollup_state 'sales:orders'), adding to the day rows. Orders younger than
+  SETTLE_SECONDS are left for the next pass, since order_date is set before
+  the order commits. Each window commits with its watermark, so nothing is
+  counted twice.
+- An order can still commit after the watermark passed its order_date (a
+  slow transaction, a retried request). So every pass also recomputes,
+  from scratch, the days covering the last SALES_RECHECK_HOURS before the
+  watermark, which counts such orders once they commit. Orders committing
+  even later than that are only picked up by backfill().
+- Cancelling (or un-cancelling) an order marks its day dirty through an
+  outbox handler (modules/orders/outbox.py); run_rollup() then recomputes
+  those days from scratch up to the watermark. This needs the outbox worker
+  (data/scripts/run_outbox_worker.py) running; without it, only
+  cancellations inside the recheck window are corrected.
+- backfill() rebuilds a range of days in parallel chunks, e.g. after a bug
+  fix or when products were recategorized (rows keep the product's
+  attributes as of when they were folded).
+
+Folds and dirty-day rebuilds lock the state row exclusively; backfill chunks
+hold it shared, so they run side by side but never race the watermark.
+
+Run passes with: python data/scripts/run_rollups.py sales
+Backfill with:   python data/scripts/backfill_sales.py --from 2024-01-01
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import text, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from config.database import SessionLocal
+from modules.analytics.models import RollupState, SalesDaily, SalesDirtyDay
+from modules.orders.outbox import outbox_processor
+from modules.products.categories import CategoryService
+
+SALES_STATE = 'sales:orders'
+DIMENSIONS = ('all', 'category', 'condition', 'rarity')
+GROUP_BYS = ('total', 'day', 'category', 'condition', 'rarity')
+# Orders younger than this are left for the next pass (order_date is set before commit)
+SETTLE_SECONDS = 60
+# Largest slice of order_date folded in one transaction
+FOLD_WINDOW = timedelta(hours=int(os.getenv('SALES_FOLD_WINDOW_HOURS', 24)))
+# Days overlapping this much time before the watermark are recomputed on every pass
+RECHECK_WINDOW = timedelta(hours=float(os.getenv('SALES_RECHECK_HOURS', 24)))
+BACKFILL_CHUNK_DAYS = 31
+MAX_RANGE_DAYS = 3660
+
+# Every non-cancelled order item in the window, once per dimension
+_AGGREGATE_SQL = """
+SELECT o.order_date::date AS day, d.dimension, d.value,
+       count(DISTINCT o.order_id) AS orders,
+       sum(oi.quantity) AS units,
+       sum(oi.price * oi.quantity) AS revenue
+FROM orders o
+JOIN order_items oi ON oi.order_id = o.order_id
+JOIN products p ON p.product_id = oi.product_id
+CROSS JOIN LATERAL (VALUES
+    ('all', ''),
+    ('category', COALESCE(p.category_id::text, '')),
+    ('condition', COALESCE(p.condition, '')),
+    ('rarity', COALESCE(p.rarity, ''))
+) AS d(dimension, value)
+WHERE o.status IS DISTINCT FROM 'cancelled'
+  AND {window}
+GROUP BY 1, 2, 3
+"""
+
+_FOLD_SQL = text("""
+WITH agg AS (""" + _AGGREGATE_SQL.format(window="o.order_date > :after AND o.order_date <= :upto") + """),
+upsert AS (
+    INSERT INTO sales_daily (dimension, day, value, orders, units, revenue, updated_at)
+    SELECT dimension, day, value, orders, units, revenue, now() AT TIME ZONE 'utc' FROM agg
+    ON CONFLICT (dimension, day, value) DO UPDATE
+        SET orders = sales_daily.orders + EXCLUDED.orders,
+            units = sales_daily.units + EXCLUDED.units,
+            revenue = sales_daily.revenue + EXCLUDED.revenue,
+            updated_at = EXCLUDED.updated_at
+)
+SELECT COALESCE(sum(orders) FILTER (WHERE dimension = 'all'), 0) AS orders FROM agg
+""")
+
+_CLEAR_DAYS_SQL = text("""
+DELETE FROM sales_daily
+WHERE dimension = ANY(:dimensions) AND day >= :day_from AND day < :day_to
+""")
+
+_REBUILD_DAYS_SQL = text("""
+WITH agg AS (""" + _AGGREGATE_SQL.format(
+    window="o.order_date >= :day_from AND o.order_date < :day_to AND o.order_date <= :upto") + """),
+ins AS (
+    INSERT INTO sales_daily (dimension, day, value, orders, units, revenue, updated_at)
+    SELECT dimension, day, value, orders, units, revenue, now() AT TIME ZONE 'utc' FROM agg
+)
+SELECT COALESCE(sum(orders) FILTER (WHERE dimension = 'all'), 0) AS orders FROM agg
+""")
+
+
+# Registered in every process that imports this module, but only processes that
+# drain the outbox run it: data/scripts/run_outbox_worker.py imports this module
+# for that reason. The API only records events, so registering there is a no-op.
+@outbox_processor.handler('*')
+def mark_cancelled_day_dirty(db: Session, event: dict):
+    """Outbox handler: an order entered or left 'cancelled', so its day must be recomputed"""
+    if 'cancelled' not in (event['from_status'], event['to_status']):
+        return
+    order_date = event['payload'].get('order_date')
+    if not order_date:
+        return
+    db.execute(
+        insert(SalesDirtyDay)
+        .values(day=datetime.fromisoformat(order_date).date(), marked_at=datetime.utcnow())
+        .on_conflict_do_nothing()
+    )
+
+
+class SalesRollupService:
+
+    @staticmethod
+    def _get_state(db: Session, shared: bool = False) -> RollupState:
+        """The sales watermark row, locked (FOR UPDATE, or FOR SHARE if shared)"""
+        query = db.query(RollupState).filter(RollupState.name == SALES_STATE).with_for_update(read=shared)
+        state = query.first()
+        if state is None:
+            db.execute(
+                insert(RollupState)
+                .values(name=SALES_STATE, position=0, position_at=None, updated_at=datetime.utcnow())
+                .on_conflict_do_nothing()
+            )
+            state = query.populate_existing().first()
+        return state
+
+    @staticmethod
+    def _rebuild_days(db: Session, day_from: date, day_to: date, upto: datetime) -> int:
+        """Recompute sales_daily for [day_from, day_to) from orders up to the watermark (no commit)"""
+        params = {'dimensions': list(DIMENSIONS), 'day_from': day_from, 'day_to': day_to, 'upto': upto}
+        db.execute(_CLEAR_DAYS_SQL, params)
+        db.query(SalesDirtyDay).filter(SalesDirtyDay.day >= day_from, SalesDirtyDay.day < day_to) \
+            .delete(synchronize_session=False)
+        return int(db.execute(_REBUILD_DAYS_SQL, params).scalar())
+
+    @staticmethod
+    def run_rollup(db: Session, now: datetime = None) -> Dict[str, int]:
+        """
+        Fold orders placed since the watermark into sales_daily (one transaction
+        per FOLD_WINDOW of order_date), recompute the days in RECHECK_WINDOW
+        before the watermark (late commits), then the days marked dirty.
+        Returns {"orders": folded, "rechecked_days": n, "dirty_days": recomputed}.
+        """
+        result = {'orders': 0, 'rechecked_days': 0, 'dirty_days': 0}
+        settled = (now or datetime.utcnow()) - timedelta(seconds=SETTLE_SECONDS)
+        while True:
+            state = SalesRollupService._get_state(db)
+            after = state.position_at
+            if after is None:
+                first = db.execute(text("SELECT min(order_date) FROM orders")).scalar()
+                if first is None:
+                    db.commit()
+                    break
+                after = first - timedelta(microseconds=1)
+            if after >= settled:
+                db.commit()
+                break
+            upto = min(after + FOLD_WINDOW, settled)
+            result['orders'] += int(db.execute(_FOLD_SQL, {'after': after, 'upto': upto}).scalar())
+            state.position_at = upto
+            db.commit()
+
+        state = SalesRollupService._get_state(db)
+        if state.position_at is not None and RECHECK_WINDOW:
+            day_from = (state.position_at - RECHECK_WINDOW).date()
+            day_to = state.position_at.date() + timedelta(days=1)
+            SalesRollupService._rebuild_days(db, day_from, day_to, state.position_at)
+            result['rechecked_days'] = (day_to - day_from).days
+        db.commit()
+
+        while True:
+            state = SalesRollupService._get_state(db)
+            day = (
+                db.query(SalesDirtyDay.day)
+                .order_by(SalesDirtyDay.day)
+                .with_for_update(skip_locked=True)
+                .limit(1)
+                .scalar()
+            )
+            if day is None or state.position_at is None:
+                db.commit()
+                break
+            SalesRollupService._rebuild_days(db, day, day + timedelta(days=1), state.position_at)
+            db.commit()
+            result['dirty_days'] += 1
+        return result
+
+    @staticmethod
+    def _backfill_chunk(day_from: date, day_to: date) -> int:
+        db = SessionLocal()
+        try:
+            state = SalesRollupService._get_state(db, shared=True)
+            orders = SalesRollupService._rebuild_days(db, day_from, day_to, state.position_at)
+            db.commit()
+            return orders
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def backfill(db: Session, day_from: Optional[date] = None, day_to: Optional[date] = None,
+                 workers: int = 4, chunk_days: int = BACKFILL_CHUNK_DAYS, now: datetime = None) -> Dict[str, int]:
+        """
+        Rebuild sales_daily for [day_from, day_to) (default: all history) in
+        chunks of chunk_days, `workers` at a time, each in its own session.
+        On a fresh install this also sets the watermark, so run_rollup()
+        carries on from where the backfill stopped.
+        Returns {"days": rebuilt, "chunks": n, "orders": counted}.
+        """
+        state = SalesRollupService._get_state(db)
+        if state.position_at is None:
+            state.position_at = (now or datetime.utcnow()) - timedelta(seconds=SETTLE_SECONDS)
+        watermark = state.position_at
+        first = db.execute(text("SELECT min(order_date) FROM orders")).scalar()
+        db.commit()
+
+        day_from = day_from or (first.date() if first else watermark.date())
+        day_to = min(day_to or watermark.date() + timedelta(days=1), watermark.date() + timedelta(days=1))
+        chunks = []
+        start = day_from
+        while start < day_to:
+            end = min(start + timedelta(days=chunk_days), day_to)
+            chunks.append((start, end))
+            start = end
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            counts = list(pool.map(lambda chunk: SalesRollupService._backfill_chunk(*chunk), chunks))
+        return {
+            'days': max((day_to - day_from).days, 0),
+            'chunks': len(chunks),
+            'orders': sum(counts),
+        }
+
+
+class SalesAnalyticsService:
+
+    @staticmethod
+    def get_sales(db: Session, day_from: date, day_to: date, group_by: str = 'day') -> dict:
+        """
+        Revenue, units, orders and average order value for [day_from, day_to],
+        summed from sales_daily. group_by: total, day, category, condition, rarity.
+        """
+        if group_by not in GROUP_BYS:
+            raise ValueError(f"group_by must be one of: {', '.join(GROUP_BYS)}")
+        if day_to < day_from:
+            raise ValueError("'to' must not be before 'from'")
+        if (day_to - day_from).days > MAX_RANGE_DAYS:
+            raise ValueError(f"Date range is limited to {MAX_RANGE_DAYS} days")
+
+        dimension = 'all' if group_by in ('total', 'day') else group_by
+        key = {'total': None, 'day': SalesDaily.day}.get(group_by, SalesDaily.value)
+        columns = [
+            func.sum(SalesDaily.orders).label('orders'),
+            func.sum(SalesDaily.units).label('units'),
+            func.sum(SalesDaily.revenue).label('revenue'),
+        ]
+        query = db.query(*([key] if key is not None else []), *columns).filter(
+            SalesDaily.dimension == dimension,
+            SalesDaily.day >= day_from,
+            SalesDaily.day <= day_to,
+        )
+        if key is not None:
+            query = query.group_by(key)
+            query = query.order_by(key if group_by == 'day' else func.sum(SalesDaily.revenue).desc())
+
+        tree = CategoryService.get_tree(db) if group_by == 'category' else None
+        rows = []
+        for row in query.all():
+            orders = int(row.orders or 0)
+            revenue = float(row.revenue or 0)
+            entry = {}
+            if group_by == 'day':
+                entry['day'] = row.day.isoformat()
+            elif key is not None:
+                value = row.value or None
+                entry[group_by] = value
+                if tree is not None:
+                    entry[group_by] = int(value) if value else None
+                    entry['name'] = tree.categories.get(entry[group_by], {}).get('name')
+            entry.update({
+                'orders': orders,
+                'units': int(row.units or 0),
+                'revenue': round(revenue, 2),
+                'average_order_value': round(revenue / orders, 2) if orders else None,
+            })
+            rows.append(entry)
+
+        watermark = db.query(RollupState.position_at).filter(RollupState.name == SALES_STATE).scalar()
+        return {
+            'from': day_from.isoformat(),
+            'to': day_to.isoformat(),
+            'group_by': group_by,
+            'results': rows,
+            # Orders placed after this are not counted yet
+            'as_of': watermark.isoformat() if watermark else None,
+        }
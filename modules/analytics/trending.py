@@ -0,0 +1,221 @@
+"""
+Trending products - incremental, time-decayed popularity rollups
+
+How it works:
+- Each pass reads only the views/saves (user_product_interactions) and
+  purchases (order_items) added since the last pass, using their primary
+  keys as a watermark stored in rollup_state.
+- Events are scored weight * 2^((event_time - epoch) / half_life) and added
+  to product_popularity / category_popularity. Scores never need to be
+  decayed in place: ordering by the stored score equals ordering by the
+  decayed score, so GET /products/trending is an index scan of K rows.
+- The exponent grows with time, so once it gets large the epoch is moved
+  forward and all scores are scaled down once ("rebase").
+
+Run passes with: python data/scripts/run_rollups.py trending
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Dict
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from modules.analytics.models import RollupState, ProductPopularity, CategoryPopularity
+from modules.products.models import Product
+from modules.products.services import PRODUCT_LIST_COLUMNS, product_list_encoder
+from modules.common.cache import TTLCache
+
+HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 72))
+HALF_LIFE_SECONDS = HALF_LIFE_HOURS * 3600
+
+# How much each event counts toward popularity
+INTERACTION_WEIGHTS = {'view': 1.0, 'click': 1.0, 'save': 3.0}
+PURCHASE_WEIGHT = 10.0   # per unit bought (from order_items)
+
+# Events younger than this are left for the next pass, so rows from transactions
+# that commit slightly out of id order are not skipped by the watermark
+SETTLE_SECONDS = 60
+BATCH_SIZE = 50_000
+# Rebase once scores reach 2^REBASE_EXPONENT (doubles overflow around 2^1024)
+REBASE_EXPONENT = 400
+# After a rebase, products whose score decayed below this are dropped
+MIN_SCORE = 1e-3
+
+MAX_TRENDING = 100
+EPOCH_STATE = 'trending:epoch'
+INTERACTIONS_STATE = 'trending:interactions'
+ORDER_ITEMS_STATE = 'trending:order_items'
+
+# Encoded trending lists, keyed by (category_id, limit); refreshed at most once a minute
+trending_cache = TTLCache(maxsize=256, ttl=float(os.getenv('TRENDING_CACHE_TTL', 60)))
+
+
+def _weight_case(column: str) -> str:
+    branches = ' '.join(f"WHEN '{kind}' THEN {weight}" for kind, weight in INTERACTION_WEIGHTS.items())
+    return f"CASE {column} {branches} ELSE 0 END"
+
+
+# One statement per source: pick the next settled batch after the watermark,
+# score it, and fold it into both popularity tables. Returns the batch's last id.
+_SCORE = "power(2.0, extract(epoch FROM {ts} - :epoch) / :half_life)"
+_FOLD_SQL = """
+WITH blocker AS (
+    SELECT min({id}) AS id FROM {table}
+    WHERE {id} > :last_id AND {ts} >= :settled_before
+),
+batch AS (
+    SELECT {id} AS id, product_id, {weight} * """ + _SCORE + """ AS score
+    FROM {table}
+    WHERE {id} > :last_id
+      AND {id} < COALESCE((SELECT id FROM blocker), 9223372036854775807)
+    ORDER BY {id}
+    LIMIT :batch_size
+),
+per_product AS (
+    SELECT b.product_id, p.category_id, SUM(b.score) AS score
+    FROM batch b JOIN products p ON p.product_id = b.product_id
+    GROUP BY b.product_id, p.category_id
+    HAVING SUM(b.score) > 0
+),
+products_upsert AS (
+    INSERT INTO product_popularity (product_id, category_id, score, updated_at)
+    SELECT product_id, category_id, score, now() AT TIME ZONE 'utc' FROM per_product
+    ON CONFLICT (product_id) DO UPDATE
+        SET score = product_popularity.score + EXCLUDED.score,
+            category_id = EXCLUDED.category_id,
+            updated_at = EXCLUDED.updated_at
+),
+categories_upsert AS (
+    INSERT INTO category_popularity (category_id, score, updated_at)
+    SELECT category_id, SUM(score), now() AT TIME ZONE 'utc' FROM per_product
+    WHERE category_id IS NOT NULL
+    GROUP BY category_id
+    ON CONFLICT (category_id) DO UPDATE
+        SET score = category_popularity.score + EXCLUDED.score,
+            updated_at = EXCLUDED.updated_at
+)
+SELECT max(id) AS last_id, count(*) AS events FROM batch
+"""
+
+_SOURCES = {
+    INTERACTIONS_STATE: text(_FOLD_SQL.format(
+        table='user_product_interactions', id='interaction_id', ts='interaction_timestamp',
+        weight=_weight_case('interaction_type'),
+    )),
+    ORDER_ITEMS_STATE: text(_FOLD_SQL.format(
+        table='order_items', id='order_item_id', ts='created_at',
+        weight=f"{PURCHASE_WEIGHT} * quantity",
+    )),
+}
+
+
+class TrendingService:
+
+    @staticmethod
+    def _get_state(db: Session, name: str, lock: bool = False) -> RollupState:
+        query = db.query(RollupState).filter(RollupState.name == name)
+        if lock:
+            query = query.with_for_update()
+        state = query.first()
+        if state is None:
+            db.execute(text(
+                "INSERT INTO rollup_state (name, position, position_at, updated_at) "
+                "VALUES (:name, 0, :now, :now) ON CONFLICT (name) DO NOTHING"
+            ), {'name': name, 'now': datetime.utcnow()})
+            state = query.populate_existing().first()
+        return state
+
+    @staticmethod
+    def _rebase(db: Session, epoch_state: RollupState, now: datetime):
+        """Move the epoch to now, scaling every stored score down by the same factor"""
+        factor = 2.0 ** (-(now - epoch_state.position_at).total_seconds() / HALF_LIFE_SECONDS)
+        for model in (ProductPopularity, CategoryPopularity):
+            db.query(model).update({model.score: model.score * factor}, synchronize_session=False)
+            db.query(model).filter(model.score < MIN_SCORE).delete(synchronize_session=False)
+        epoch_state.position_at = now
+
+    @staticmethod
+    def run_rollup(db: Session, batch_size: int = BATCH_SIZE, now: datetime = None) -> Dict[str, int]:
+        """
+        Fold every settled event since the watermarks into the popularity tables.
+        Each batch commits together with its watermark, so a crash never double
+        counts or skips events. Concurrent runners queue on the epoch row lock.
+        Returns the number of events folded in per source.
+        """
+        folded = {name: 0 for name in _SOURCES}
+        for name, statement in _SOURCES.items():
+            while True:
+                now_ = now or datetime.utcnow()
+                epoch_state = TrendingService._get_state(db, EPOCH_STATE, lock=True)
+                if (now_ - epoch_state.position_at).total_seconds() / HALF_LIFE_SECONDS > REBASE_EXPONENT:
+                    TrendingService._rebase(db, epoch_state, now_)
+                state = TrendingService._get_state(db, name, lock=True)
+
+                row = db.execute(statement, {
+                    'last_id': state.position,
+                    'settled_before': now_ - timedelta(seconds=SETTLE_SECONDS),
+                    'epoch': epoch_state.position_at,
+                    'half_life': HALF_LIFE_SECONDS,
+                    'batch_size': batch_size,
+                }).one()
+                if row.events:
+                    state.position = row.last_id
+                db.commit()
+
+                folded[name] += row.events
+                if row.events < batch_size:
+                    break
+        return folded
+
+    @staticmethod
+    def _decay_factor(db: Session) -> float:
+        """Multiply a stored score by this to get today's decayed score"""
+        epoch = db.query(RollupState.position_at).filter(RollupState.name == EPOCH_STATE).scalar()
+        if epoch is None:
+            return 1.0
+        return 2.0 ** (-(datetime.utcnow() - epoch).total_seconds() / HALF_LIFE_SECONDS)
+
+    @staticmethod
+    def get_trending_json(db: Session, category_id: Optional[int] = None, limit: int = 20) -> str:
+        """
+        Top `limit` active products by popularity as a JSON array (product list
+        fields plus "trending_score"), optionally within one category.
+        Served from trending_cache; a miss reads the top rows off the score index.
+        """
+        limit = max(1, min(limit, MAX_TRENDING))
+        cache_key = (category_id, limit)
+        cached = trending_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        query = (
+            db.query(*PRODUCT_LIST_COLUMNS, ProductPopularity.score)
+            .join(ProductPopularity, ProductPopularity.product_id == Product.product_id)
+            .filter(Product.is_active == True)
+        )
+        if category_id is not None:
+            query = query.filter(ProductPopularity.category_id == category_id)
+        rows = query.order_by(ProductPopularity.score.desc()).limit(limit).all()
+
+        factor = TrendingService._decay_factor(db)
+        encoded = '[' + ','.join([
+            product_list_encoder.encode(row, trending_score=repr(round(row.score * factor, 4)))
+            for row in rows
+        ]) + ']'
+        trending_cache.set(cache_key, encoded)
+        return encoded
+
+    @staticmethod
+    def get_trending_categories(db: Session, limit: int = 10) -> list:
+        """Top categories by decayed popularity: [{"category_id": 11, "trending_score": 42.5}, ...]"""
+        limit = max(1, min(limit, MAX_TRENDING))
+        rows = (
+            db.query(CategoryPopularity.category_id, CategoryPopularity.score)
+            .order_by(CategoryPopularity.score.desc())
+            .limit(limit)
+            .all()
+        )
+        factor = TrendingService._decay_factor(db)
+        return [
+            {'category_id': row.category_id, 'trending_score': round(row.score * factor, 4)}
+            for row in rows
+        ]
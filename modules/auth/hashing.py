@@ -0,0 +1,146 @@
+"""
+Password hashing on a bounded pool
+
+bcrypt is deliberately slow (~250 ms at cost 12), and it releases the GIL
+while it runs. Hashes therefore run on a small thread pool per process:
+- at most PASSWORD_HASH_WORKERS hashes run at once in a process, so a login
+  storm can't occupy every request thread and starve the other endpoints;
+- at most PASSWORD_HASH_QUEUE_LIMIT more may wait. Beyond that, callers get
+  PasswordHasherBusy immediately (the API answers 503 + Retry-After) instead
+  of piling up behind the queue. A hash that doesn't finish within
+  HASH_TIMEOUT_SECONDS also raises PasswordHasherBusy; its slot is freed only
+  when the hash really ends, so the bound holds.
+
+The request thread still waits for its own hash. The bound only helps if a
+process serves several requests at once: run gunicorn with threaded workers
+(gunicorn.conf.py sets worker_class = "gthread"). With sync workers each
+process handles one request at a time, so the queue can never fill.
+The pool is per process; the default size, cpu_count / WEB_CONCURRENCY
+(gunicorn's worker count), keeps the machine-wide number of concurrent
+hashes at about one per CPU.
+
+The cost factor is BCRYPT_ROUNDS. Hashes made with another cost still
+verify; needs_rehash() tells login to re-hash them at the current cost.
+PASSWORD_HASH_WORKERS=0 hashes inline on the calling thread (scripts, tests).
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+WEB_WORKERS = int(os.getenv('WEB_CONCURRENCY', 1))
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 1) // max(WEB_WORKERS, 1))))
+HASH_QUEUE_LIMIT = int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT', 2 * max(HASH_WORKERS, 1)))
+HASH_TIMEOUT_SECONDS = 30
+# Checked against when the user doesn't exist, so unknown emails take as long as
+# wrong passwords; one per cost factor, made on first use
+_dummy_hashes = {}
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hashes queued; retry shortly"""
+
+
+def _hash(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _verify(password: bytes, hashed: bytes) -> bool:
+    try:
+        return bcrypt.checkpw(password, hashed)
+    except ValueError:      # not a bcrypt hash
+        return False
+
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    """Hash on the calling thread; a top-level function so process pools can run it"""
+    return _hash(password.encode('utf-8'), rounds).decode('utf-8')
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    """The cost factor of a "$2b$12$..." hash (None if it isn't one)"""
+    parts = (hashed or '').split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT,
+                 rounds: int = BCRYPT_ROUNDS):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.configure(workers, queue_limit, rounds)
+
+    def configure(self, workers: int = None, queue_limit: int = None, rounds: int = None):
+        """(Re)size the pool or change the cost; hashes already running finish on the old pool"""
+        self.workers = self.workers if workers is None else workers
+        self.queue_limit = self.queue_limit if queue_limit is None else queue_limit
+        self.rounds = self.rounds if rounds is None else rounds
+        old, self._executor = self._executor, None
+        if self.workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_limit) if self.workers > 0 else None
+        self._stats_lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        if old is not None:
+            old.shutdown(wait=False)
+
+    def _run(self, func, *args):
+        executor, slots = self._executor, self._slots
+        if executor is None:
+            return func(*args)
+        if not slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise PasswordHasherBusy("Too many password checks in progress, try again shortly")
+        try:
+            future = executor.submit(func, *args)
+        except Exception:
+            slots.release()
+            raise
+        # The slot is held until the hash itself ends, even if we stop waiting for it
+        future.add_done_callback(lambda _: self._finished(slots))
+        try:
+            return future.result(timeout=HASH_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            with self._stats_lock:
+                self.rejected += 1
+            raise PasswordHasherBusy("Password check timed out, try again shortly")
+
+    def _finished(self, slots: threading.BoundedSemaphore):
+        slots.release()
+        with self._stats_lock:
+            self.completed += 1
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password.encode('utf-8'), self.rounds).decode('utf-8')
+
+    def verify(self, password: str, hashed: Optional[str]) -> bool:
+        """Check a password; with hashed=None, burn a comparable amount of time and return False"""
+        if hashed is None:
+            dummy = _dummy_hashes.get(self.rounds)
+            if dummy is None:
+                dummy = _dummy_hashes[self.rounds] = self._run(_hash, b'dummy-password', self.rounds)
+            self._run(_verify, password.encode('utf-8'), dummy)
+            return False
+        return self._run(_verify, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        return hash_cost(hashed) != self.rounds
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                'workers': self.workers,
+                'queue_limit': self.queue_limit,
+                'rounds': self.rounds,
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+
+password_hasher = PasswordHasher()
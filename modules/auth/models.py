@@ -1,14 +1,17 @@
 """
 User model and schemas
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from config.database import Base
-import bcrypt
+from modules.auth.hashing import password_hasher
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        Index('idx_users_created_id', 'created_at', 'user_id'),
+    )
     
     user_id = Column(Integer, primary_key=True, index=True)
     username = Column(String(100), unique=True, nullable=False, index=True)
@@ -16,7 +19,7 @@ class User(Base):
     password_hash = Column(String(255), nullable=False)
     first_name = Column(String(100))
     last_name = Column(String(100))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
     
@@ -26,12 +29,16 @@ class User(Base):
     interactions = relationship("UserProductInteraction", back_populates="user", cascade="all, delete-orphan")
     
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        """Hash and set password (on the bounded hashing pool, see modules/auth/hashing.py)"""
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Verify password"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        """Verify password (on the bounded hashing pool)"""
+        return password_hasher.verify(password, self.password_hash)
+    
+    def password_needs_rehash(self):
+        """True if the stored hash uses a different cost than BCRYPT_ROUNDS"""
+        return password_hasher.needs_rehash(self.password_hash)
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -46,4 +53,25 @@ class User(Base):
         }
     
     def __repr__(self):
-        return f"<User(id={self.user_id}, username='{self.username}', email='{self.email}')>"
\ No newline at end of file
+        return f"<User(id={self.user_id}, username='{self.username}', email='{self.email}')>"
+
+
+class RevokedToken(Base):
+    """
+    An access token revoked before it expired (logout), by its jti claim.
+    Each worker keeps these in memory (see modules/auth/tokens.py); rows past
+    expires_at are deleted by data/scripts/run_sweepers.py.
+    """
+    __tablename__ = 'revoked_tokens'
+    __table_args__ = (
+        Index('idx_revoked_tokens_revoked_at', 'revoked_at'),
+        Index('idx_revoked_tokens_expires', 'expires_at'),
+    )
+
+    jti = Column(String(32), primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    expires_at = Column(DateTime, nullable=False)     # the token's exp; no need to keep it after that
+    revoked_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<RevokedToken(jti='{self.jti}', user_id={self.user_id})>"
@@ -1,9 +1,12 @@
 """
 User API routes
 """
-from flask import Blueprint, request, jsonify
+from datetime import datetime
+from flask import Blueprint, request, jsonify, g
 from config.database import SessionLocal
 from modules.auth.services import UserService
+from modules.auth.hashing import PasswordHasherBusy
+from modules.auth.tokens import require_auth, issue_token, revoke_token, ACCESS_TOKEN_MINUTES
 user_bp = Blueprint('users', __name__, url_prefix = '/api/users')
 
 @user_bp.route('/', methods = ['POST'])
@@ -36,8 +39,12 @@ def create_user():
             last_name=data.get('last_name')
         )
 
-        return jsonify ({user.to_dict()}), 201
+        return jsonify (user.to_dict()), 201
     
+    except PasswordHasherBusy as busy:
+        db.rollback()
+        return jsonify({'error': str(busy)}), 503, {'Retry-After': '1'}
+
     except Exception as e:
         db.rollback()
         return jsonify({'error': str(e)}), 500
@@ -54,23 +61,37 @@ def get_user(user_id):
         if not user:
             return jsonify ({'error': 'User not Found'}), 404
 
-        return jsonify ({user.to_dict()}), 200
+        return jsonify (user.to_dict()), 200
     finally:
         db.close()
 
 @user_bp.route('/', methods=['GET'])
 def get_all_users():
+    """
+    Get users one page at a time (keyset pagination)
+    GET /api/users/?limit=100&sort=newest&cursor=<next_cursor>
+
+    Returns:
+    200: { "users": [...], "next_cursor": "..." }  (next_cursor is null on the last page)
+    400: Invalid cursor, sort or limit
+    """
     db = SessionLocal()
     try:
-        skip = request.args.get('skip', 0, type=int)
+        cursor = request.args.get('cursor')
         limit = request.args.get('limit',100, type=int)
-
-        users = UserService.get_all_users(db,skip, limit)
-        return jsonify ([users.to_dict() for user in users]), 200
+        sort = request.args.get('sort')
+
+        users, next_cursor = UserService.get_all_users(db, cursor, limit, sort)
+        return jsonify({
+            'users': [user.to_dict() for user in users],
+            'next_cursor': next_cursor
+        }), 200
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
     finally:
         db.close()
 
-@user_bp.routes('/<int:user_id>', methods=['PUT'])
+@user_bp.route('/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
     db = SessionLocal()
     try:
@@ -86,7 +107,7 @@ def update_user(user_id):
     finally:
         db.close()
 
-@user_bp.routes('/<int:user_id', methods=['DELETE'])
+@user_bp.route('/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
     db = SessionLocal()
     try:
@@ -102,6 +123,16 @@ def delete_user(user_id):
 
 @user_bp.route('/login', methods=['POST'])
 def login():
+    """
+    Log in with email and password
+    POST /api/users/login
+
+    Returns:
+    200: the user, plus "access_token" (send as "Authorization: Bearer <token>"),
+         "token_type" and "expires_in" (seconds)
+    401: Invalid credentials
+    503: Too many logins in progress (Retry-After)
+    """
     db = SessionLocal()
     try:
         data = request.get_json()
@@ -112,8 +143,56 @@ def login():
         user = UserService.authenticate_user(db, data['email'],data['password'])
         if not user:
             return jsonify({'error': 'Invalid Credentials'}),401
-        return jsonify (user.to_dict()), 200
+        token, _ = issue_token(user)
+        return jsonify ({
+            **user.to_dict(),
+            'access_token': token,
+            'token_type': 'Bearer',
+            'expires_in': int(ACCESS_TOKEN_MINUTES * 60),
+        }), 200
+    except PasswordHasherBusy as busy:
+        db.rollback()
+        return jsonify({'error': str(busy)}), 503, {'Retry-After': '1'}
     finally:
         db.close()
 
         
+
+@user_bp.route('/me', methods=['GET'])
+@require_auth
+def me():
+    """
+    Who the bearer token belongs to, read from the token (no database lookup)
+    GET /api/users/me
+
+    Returns:
+    200: { "user_id", "username", "expires_at" }
+    401: Missing, invalid, expired or revoked token
+    """
+    claims = g.token_claims
+    return jsonify({
+        'user_id': g.user_id,
+        'username': claims.get('username'),
+        'expires_at': datetime.utcfromtimestamp(claims['exp']).isoformat(),
+    }), 200
+
+@user_bp.route('/logout', methods=['POST'])
+@require_auth
+def logout():
+    """
+    Revoke the bearer token
+    POST /api/users/logout
+
+    Returns:
+    200: Logged out
+    401: Missing, invalid, expired or revoked token
+    """
+    db = SessionLocal()
+    try:
+        revoke_token(db, g.token_claims)
+        return jsonify({'message': 'Logged out'}), 200
+    except Exception as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 500
+    finally:
+        db.close()
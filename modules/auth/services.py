@@ -2,8 +2,25 @@
 User service - business logic for user operations
 """
 from sqlalchemy.orm import Session
+from sqlalchemy import select, or_
+from sqlalchemy.dialects.postgresql import insert
+from concurrent.futures import Executor
+from functools import partial
 from modules.auth.models import User
-from typing import Optional, List
+from modules.auth.hashing import password_hasher, hash_password, hash_cost
+from modules.common.pagination import SortSpec, paginate, get_sort
+from typing import Optional, List, Tuple, Iterable, Dict
+from datetime import datetime
+
+USER_SORTS = {
+    'newest': SortSpec('newest', User.created_at, User.user_id, descending=True),
+    'oldest': SortSpec('oldest', User.created_at, User.user_id),
+}
+DEFAULT_USER_SORT = 'newest'
+
+PROVISION_BATCH_SIZE = 1000
+MAX_PROVISION_ERRORS = 1000   # cap the per-row report unless the caller asks for all of it
+PROVISION_FIELDS = {'username': 100, 'email': 255, 'first_name': 100, 'last_name': 100}   # max lengths
 
 class UserService:
     
@@ -37,8 +54,10 @@ class UserService:
         return db.query(User).filter(User.username == username).first()
     
     @staticmethod
-    def get_all_users(db: Session, skip: int = 0, limit: int = 100) -> List[User]:
-        return db.query(User).offset(skip).limit(limit).all()
+    def get_all_users(db: Session, cursor: str = None, limit: int = 100,
+                      sort: str = None) -> Tuple[List[User], Optional[str]]:
+        """Get users one keyset page at a time, returns (users, next_cursor)"""
+        return paginate(db.query(User), get_sort(USER_SORTS, sort, DEFAULT_USER_SORT), cursor, limit)
     
     @staticmethod
     def update_user(db: Session, user_id: int, **kwargs) -> Optional[User]:
@@ -66,8 +85,202 @@ class UserService:
     
     @staticmethod
     def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
-        """Authenticate user with email and password"""
+        """
+        Authenticate user with email and password.
+        A hash made with an older cost factor is replaced with one at the
+        current BCRYPT_ROUNDS while the plain password is at hand.
+        Raises PasswordHasherBusy if the hashing pool is saturated.
+        """
         user = UserService.get_user_by_email(db, email)
-        if not user or not user.check_password(password):
+        if not user:
+            password_hasher.verify(password, None)   # same timing as a wrong password
             return None
-        return user
\ No newline at end of file
+        if not user.check_password(password):
+            return None
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.commit()
+        return user
+
+    @staticmethod
+    def parse_provision_row(record: dict) -> Tuple[Optional[dict], List[str]]:
+        """
+        Turn one provisioning record into users column values plus either a
+        plain "password" or an existing bcrypt "password_hash" (kept as is).
+        Returns (values, errors); values is None when there are errors.
+        """
+        row_values = {}
+        errors = []
+        for field, max_length in PROVISION_FIELDS.items():
+            raw = record.get(field)
+            value = raw.strip() if isinstance(raw, str) else raw
+            if value is None or value == '':
+                continue
+            if not isinstance(value, str) or len(value) > max_length:
+                errors.append(f"Invalid {field}: must be text of at most {max_length} characters")
+                continue
+            row_values[field] = value
+        for field in ('username', 'email'):
+            if field not in row_values and not any(e.startswith(f"Invalid {field}:") for e in errors):
+                errors.append(f"Missing required field: {field}")
+        if 'email' in row_values and '@' not in row_values['email']:
+            errors.append("Invalid email: must contain @")
+
+        password, password_hash = record.get('password'), record.get('password_hash')
+        if password_hash:
+            if not isinstance(password_hash, str) or hash_cost(password_hash) is None:
+                errors.append("Invalid password_hash: must be a bcrypt hash")
+            row_values['password_hash'] = password_hash
+        elif isinstance(password, str) and password:
+            row_values['password'] = password
+        else:
+            errors.append("Missing required field: password (or password_hash)")
+
+        if errors:
+            return None, errors
+        for field in PROVISION_FIELDS:
+            row_values.setdefault(field, None)
+        return row_values, []
+
+    @staticmethod
+    def _report_provision_error(report: dict, row_number: int, errors: List[str], max_errors: Optional[int]):
+        report['failed'] += 1
+        if max_errors is None or len(report['errors']) < max_errors:
+            report['errors'].append({'row': row_number, 'errors': errors})
+        else:
+            report['errors_truncated'] = True
+
+    @staticmethod
+    def _claim_provision_batch(db: Session, batch: List[Tuple[int, dict]], seen: Dict[str, set],
+                               report: dict, max_errors: Optional[int]) -> List[Tuple[int, dict]]:
+        """
+        Drop rows whose email or username is already registered (one query for
+        the whole batch) or appeared earlier in this run; returns the rest.
+        """
+        emails = [row_values['email'] for _, row_values in batch]
+        usernames = [row_values['username'] for _, row_values in batch]
+        taken = db.execute(
+            select(User.email, User.username)
+            .where(or_(User.email.in_(emails), User.username.in_(usernames)))
+        ).all()
+        db.rollback()
+        taken_emails = {row.email for row in taken} | seen['email']
+        taken_usernames = {row.username for row in taken} | seen['username']
+
+        claimed = []
+        for row_number, row_values in batch:
+            errors = []
+            if row_values['email'] in taken_emails:
+                errors.append(f"Email already registered: {row_values['email']}")
+            if row_values['username'] in taken_usernames:
+                errors.append(f"Username already used: {row_values['username']}")
+            # Later rows in this batch must see this one too, not just earlier batches
+            taken_emails.add(row_values['email'])
+            taken_usernames.add(row_values['username'])
+            seen['email'].add(row_values['email'])
+            seen['username'].add(row_values['username'])
+            if errors:
+                report['conflicts'] += 1
+                UserService._report_provision_error(report, row_number, errors, max_errors)
+                continue
+            claimed.append((row_number, row_values))
+        return claimed
+
+    @staticmethod
+    def _insert_provision_batch(db: Session, batch: List[Tuple[int, dict]], hashes: Iterable[str],
+                                report: dict, max_errors: Optional[int]):
+        """
+        INSERT ... ON CONFLICT DO NOTHING the whole batch in one statement and
+        commit. Rows that lost a race with a concurrent signup come back
+        missing from RETURNING and are reported as conflicts.
+        """
+        rows = []
+        for (row_number, row_values), hashed in zip(batch, hashes):
+            rows.append({
+                'username': row_values['username'],
+                'email': row_values['email'],
+                'first_name': row_values['first_name'],
+                'last_name': row_values['last_name'],
+                'password_hash': row_values.get('password_hash') or hashed,
+                'created_at': datetime.utcnow(),
+                'updated_at': datetime.utcnow(),
+                'is_active': True,
+            })
+        if not rows:
+            return
+        inserted = set(db.execute(
+            insert(User.__table__).on_conflict_do_nothing().returning(User.email), rows
+        ).scalars())
+        db.commit()
+        report['inserted'] += len(inserted)
+        for row_number, row_values in batch:
+            if row_values['email'] not in inserted:
+                report['conflicts'] += 1
+                UserService._report_provision_error(
+                    report, row_number, ["Email or username registered while provisioning"], max_errors)
+
+    @staticmethod
+    def bulk_create_users(db: Session, records: Iterable[Tuple[int, Optional[dict], Optional[str]]],
+                          executor: Optional[Executor] = None, rounds: int = None,
+                          batch_size: int = PROVISION_BATCH_SIZE,
+                          max_errors: Optional[int] = MAX_PROVISION_ERRORS) -> dict:
+        """
+        Create users from a stream of (row_number, record, parse_error) tuples,
+        as produced by modules.common.streaming.iter_records.
+
+        Per batch: one query checks every email and username, plain passwords
+        are hashed on `executor` (e.g. a ProcessPoolExecutor; inline if None)
+        at `rounds` (default BCRYPT_ROUNDS), and the rows go in with one
+        INSERT ... ON CONFLICT DO NOTHING + commit. The next batch's hashes
+        are computed while the current one is inserted. Conflicting or
+        invalid rows are skipped and reported.
+
+        Returns:
+        {
+            "inserted": 99980,
+            "failed": 20,
+            "conflicts": 15,
+            "errors": [{"row": 17, "errors": ["Email already registered: ..."]}, ...],
+            "errors_truncated": false
+        }
+        """
+        rounds = password_hasher.rounds if rounds is None else rounds
+        hash_one = partial(hash_password, rounds=rounds)
+        report = {'inserted': 0, 'failed': 0, 'conflicts': 0, 'errors': [], 'errors_truncated': False}
+        seen = {'email': set(), 'username': set()}
+        pending = None   # (claimed rows, hashes in progress) of the previous batch
+
+        def start_batch(batch):
+            claimed = UserService._claim_provision_batch(db, batch, seen, report, max_errors)
+            passwords = [row_values['password'] for _, row_values in claimed if 'password_hash' not in row_values]
+            if executor is None:
+                hashed = map(hash_one, passwords)
+            else:
+                hashed = executor.map(hash_one, passwords, chunksize=max(1, len(passwords) // 64))
+            hashed = iter(hashed)
+            hashes = (None if 'password_hash' in row_values else next(hashed) for _, row_values in claimed)
+            return claimed, hashes
+
+        batch = []
+        for row_number, record, parse_error in records:
+            if parse_error:
+                UserService._report_provision_error(report, row_number, [parse_error], max_errors)
+                continue
+            row_values, errors = UserService.parse_provision_row(record)
+            if errors:
+                UserService._report_provision_error(report, row_number, errors, max_errors)
+                continue
+            batch.append((row_number, row_values))
+            if len(batch) >= batch_size:
+                started = start_batch(batch)
+                if pending:
+                    UserService._insert_provision_batch(db, *pending, report, max_errors)
+                pending, batch = started, []
+        if batch:
+            started = start_batch(batch)
+            if pending:
+                UserService._insert_provision_batch(db, *pending, report, max_errors)
+            pending = started
+        if pending:
+            UserService._insert_provision_batch(db, *pending, report, max_errors)
+        return report
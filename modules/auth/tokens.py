@@ -0,0 +1,254 @@
+"""
+Stateless access tokens (JWT, HS256)
+
+POST /api/users/login returns a signed token carrying the user id (sub),
+username, expiry (exp) and a random id (jti). Routes wrapped in
+@require_auth accept "Authorization: Bearer <token>" and read the caller
+from flask.g.user_id / g.token_claims, without a database lookup:
+
+- Verified tokens are kept in an LRU (verified_token_cache) keyed by the
+  whole token, so a token seen recently skips the HMAC and JSON decoding;
+  a hit only re-checks exp and the revocation list. (Keying by the
+  signature alone would let a forged payload reuse a cached signature.)
+- Logout revokes a token by jti: a row in revoked_tokens, so every worker
+  learns about it, and an entry in this worker's RevocationList at once.
+  Other workers pick it up within TOKEN_REVOCATION_REFRESH_SECONDS. The
+  list only holds unexpired tokens, so it stays small; lookups are a dict
+  membership test.
+
+Tokens can't be revoked for a user as a whole; keep ACCESS_TOKEN_MINUTES short.
+"""
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Dict, Optional, Tuple
+import jwt
+from flask import g, jsonify, request
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from config.database import SessionLocal
+from modules.auth.models import RevokedToken
+from modules.common.cache import TTLCache
+
+# Only used with FLASK_ENV=development; anyone can forge tokens signed with it
+DEV_SECRET_KEY = 'dev-secret-key-change-in-production'
+JWT_ALGORITHM = 'HS256'
+ACCESS_TOKEN_MINUTES = float(os.getenv('ACCESS_TOKEN_MINUTES', 60))
+# Re-read this much before the watermark on every refresh, so revocations
+# committed slightly out of revoked_at order are not missed
+REVOCATION_OVERLAP = timedelta(seconds=5)
+
+# Verified token -> claims. An entry is ~1 KB, so 10k entries is ~10 MB per worker.
+# The TTL is only a bound on memory held by idle tokens; exp is checked on every hit.
+verified_token_cache = TTLCache(
+    maxsize=int(os.getenv('TOKEN_CACHE_SIZE', 10_000)),
+    ttl=float(os.getenv('TOKEN_CACHE_TTL', 300)),
+)
+
+
+class InvalidToken(Exception):
+    """Missing, malformed, expired or revoked access token"""
+
+
+class RevocationList:
+    """
+    jti -> exp (epoch seconds) of revoked, unexpired tokens, mirrored from
+    revoked_tokens. Membership checks never touch the database; at most once
+    per refresh_interval one request folds in rows revoked since the last look.
+    """
+    refresh_interval = float(os.getenv('TOKEN_REVOCATION_REFRESH_SECONDS', 5))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._revoked: Dict[str, float] = {}
+        self._watermark: Optional[datetime] = None
+        self._last_refresh = None   # time.monotonic() of the last refresh
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def add(self, jti: str, exp: float):
+        self._revoked[jti] = exp
+
+    def ensure_fresh(self):
+        """Refresh if the last refresh is older than refresh_interval (cheap to call per request)"""
+        if self._last_refresh is not None and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        if self._last_refresh is not None:
+            # Another request is already refreshing: keep serving the current list
+            if not self._lock.acquire(blocking=False):
+                return
+        else:
+            self._lock.acquire()
+        try:
+            if self._last_refresh is not None and time.monotonic() - self._last_refresh < self.refresh_interval:
+                return
+            db = SessionLocal()
+            try:
+                self.refresh(db)
+            except Exception:
+                if self._last_refresh is None:
+                    raise   # never loaded: refuse tokens rather than accept revoked ones
+                self._last_refresh = time.monotonic()   # keep the stale list, retry next interval
+            finally:
+                db.close()
+        finally:
+            self._lock.release()
+
+    def refresh(self, db: Session) -> int:
+        """Fold in revocations since the watermark and drop expired ones; returns rows read"""
+        now = datetime.utcnow()
+        query = db.query(RevokedToken.jti, RevokedToken.expires_at, RevokedToken.revoked_at) \
+            .filter(RevokedToken.expires_at > now)
+        if self._watermark is not None:
+            query = query.filter(RevokedToken.revoked_at > self._watermark - REVOCATION_OVERLAP)
+        rows = query.all()
+        db.rollback()
+        for row in rows:
+            self._revoked[row.jti] = _epoch(row.expires_at)
+            if self._watermark is None or row.revoked_at > self._watermark:
+                self._watermark = row.revoked_at
+        if self._watermark is None:
+            self._watermark = now
+        cutoff = time.time()
+        for jti in [jti for jti, exp in self._revoked.items() if exp <= cutoff]:
+            self._revoked.pop(jti, None)
+        self._last_refresh = time.monotonic()
+        return len(rows)
+
+    def clear(self):
+        with self._lock:
+            self._revoked.clear()
+            self._watermark = None
+            self._last_refresh = None
+
+
+revocation_list = RevocationList()
+_signing_key: Optional[str] = None
+
+
+def signing_key() -> str:
+    """
+    JWT_SECRET_KEY, else SECRET_KEY. Read on first use rather than at import,
+    so a .env loaded by app.py counts. Raises RuntimeError when neither is set,
+    unless FLASK_ENV=development allows the public DEV_SECRET_KEY.
+    """
+    global _signing_key
+    if _signing_key is None:
+        key = os.getenv('JWT_SECRET_KEY') or os.getenv('SECRET_KEY')
+        if not key:
+            if os.getenv('FLASK_ENV') != 'development':
+                raise RuntimeError("Set JWT_SECRET_KEY or SECRET_KEY to sign access tokens "
+                                   "(FLASK_ENV=development allows the built-in dev key)")
+            key = DEV_SECRET_KEY
+        _signing_key = key
+    return _signing_key
+
+
+def _epoch(value: datetime) -> float:
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+
+def issue_token(user, minutes: float = None) -> Tuple[str, dict]:
+    """A signed access token for `user`, and its claims"""
+    now = int(time.time())
+    claims = {
+        'sub': str(user.user_id),
+        'username': user.username,
+        'iat': now,
+        'exp': now + int((ACCESS_TOKEN_MINUTES if minutes is None else minutes) * 60),
+        'jti': secrets.token_hex(8),
+    }
+    return jwt.encode(claims, signing_key(), algorithm=JWT_ALGORITHM), claims
+
+
+def verify_token(token: str) -> dict:
+    """Claims of a valid, unexpired, unrevoked token; raises InvalidToken otherwise"""
+    revocation_list.ensure_fresh()
+    claims = verified_token_cache.get(token)
+    if claims is None:
+        try:
+            claims = jwt.decode(token, signing_key(), algorithms=[JWT_ALGORITHM],
+                                options={'require': ['sub', 'exp', 'jti']})
+        except jwt.ExpiredSignatureError:
+            raise InvalidToken("Token has expired")
+        except jwt.InvalidTokenError:
+            raise InvalidToken("Invalid token")
+        verified_token_cache.set(token, claims)
+    elif claims['exp'] <= time.time():
+        verified_token_cache.delete(token)
+        raise InvalidToken("Token has expired")
+    if claims['jti'] in revocation_list:
+        raise InvalidToken("Token has been revoked")
+    return claims
+
+
+def revoke_token(db: Session, claims: dict):
+    """Revoke a verified token everywhere (commits)"""
+    db.execute(
+        insert(RevokedToken)
+        .values(
+            jti=claims['jti'],
+            user_id=int(claims['sub']),
+            expires_at=datetime.utcfromtimestamp(claims['exp']),
+            revoked_at=datetime.utcnow(),
+        )
+        .on_conflict_do_nothing()
+    )
+    db.commit()
+    revocation_list.add(claims['jti'], claims['exp'])
+
+
+def sweep_expired(db: Session, batch_size: int = 1000) -> int:
+    """Delete revoked_tokens rows whose token has expired anyway; returns rows deleted"""
+    total = 0
+    while True:
+        expired = (
+            select(RevokedToken.jti)
+            .where(RevokedToken.expires_at <= datetime.utcnow())
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        deleted = db.execute(delete(RevokedToken).where(RevokedToken.jti.in_(expired))).rowcount
+        db.commit()
+        total += deleted
+        if deleted < batch_size:
+            return total
+
+
+def require_auth(view):
+    """
+    Route decorator: 401 unless the request carries a valid bearer token.
+    Sets g.user_id and g.token_claims for the view.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not token.strip():
+            return _unauthorized("Missing bearer token")
+        try:
+            claims = verify_token(token.strip())
+        except InvalidToken as e:
+            return _unauthorized(str(e))
+        g.token_claims = claims
+        g.user_id = int(claims['sub'])
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _unauthorized(message: str):
+    return jsonify({'error': message}), 401, {'WWW-Authenticate': 'Bearer'}
+
+
+def stats() -> dict:
+    return {
+        'verified_cache': verified_token_cache.stats(),
+        'revoked': len(revocation_list),
+    }
@@ -0,0 +1,66 @@
+"""
+HTTP conditional GET helpers (ETag / Last-Modified).
+
+A client that already holds a response sends back its validators
+(If-None-Match / If-Modified-Since). When the resource's version has not
+changed we answer 304 Not Modified with no body, which skips both the
+bandwidth and the work of loading and serializing the resource.
+
+Endpoints should compute the version with a cheap probe (one or two
+columns) before doing any real work, and only then call is_not_modified().
+"""
+import hashlib
+from datetime import datetime, timezone
+from typing import Optional
+from flask import request, Response
+
+
+def make_etag(*parts) -> str:
+    """Short opaque tag for a resource version built from its identifying values"""
+    return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=12).hexdigest()
+
+
+def list_etag(rows, *attrs, extra=None) -> str:
+    """
+    Tag for a page of results: a hash over each row's id and version columns.
+    Used as a weak ETag; it changes whenever a row on the page is added, removed
+    or updated, but it says nothing about byte-for-byte equality.
+    """
+    digest = hashlib.blake2b(digest_size=12)
+    for row in rows:
+        digest.update(repr(tuple(getattr(row, attr) for attr in attrs)).encode('utf-8'))
+    digest.update(repr(extra).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _http_time(value: datetime) -> datetime:
+    """Naive datetimes in our tables are UTC; HTTP dates have whole-second precision"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+
+def is_not_modified(etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    True if the client's cached copy is still current.
+    If-None-Match wins over If-Modified-Since when both are sent (RFC 9110).
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return _http_time(last_modified) <= request.if_modified_since
+    return False
+
+
+def with_validators(response: Response, etag: str, last_modified: Optional[datetime] = None,
+                    weak: bool = False) -> Response:
+    """Attach ETag (and Last-Modified) to a response"""
+    response.set_etag(etag, weak=weak)
+    if last_modified is not None:
+        response.last_modified = _http_time(last_modified)
+    return response
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None, weak: bool = False) -> Response:
+    """Empty 304 response carrying the same validators as the full one"""
+    return with_validators(Response(status=304), etag, last_modified, weak)
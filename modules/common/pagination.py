@@ -0,0 +1,124 @@
+"""
+Keyset (cursor) pagination shared by the list endpoints.
+
+OFFSET pagination makes Postgres walk and throw away every skipped row, so
+page 1000 costs 1000x page 1. Keyset pagination instead remembers where the
+last page ended (sort value + primary key) and asks for rows strictly after
+it, which an index on (sort column, primary key) answers directly.
+
+Cursors are opaque to clients: base64url-encoded JSON of
+[sort name, last sort value, last primary key].
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional, List, Tuple, Any
+from sqlalchemy import tuple_
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a client sends a cursor we did not issue (or for another sort)"""
+
+
+class SortSpec:
+    """
+    One stable sort order for a list endpoint.
+
+    column:      the column clients sort by (e.g. Product.price); must be NOT
+                 NULL, since (NULL, key) compares as neither before nor after
+    key_column:  the primary key, used as a tie-breaker so the order is total
+    descending:  True for "highest/newest first"
+    """
+
+    def __init__(self, name: str, column, key_column, descending: bool = False):
+        self.name = name
+        self.column = column
+        self.key_column = key_column
+        self.descending = descending
+
+    def order_by(self) -> list:
+        if self.descending:
+            return [self.column.desc(), self.key_column.desc()]
+        return [self.column.asc(), self.key_column.asc()]
+
+    def after(self, value, key):
+        """Filter clause selecting rows that come after (value, key) in this order"""
+        position = tuple_(self.column, self.key_column)
+        if self.descending:
+            return position < tuple_(value, key)
+        return position > tuple_(value, key)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'dec': str(value)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'dec' in value:
+            return Decimal(value['dec'])
+        raise InvalidCursorError("Invalid cursor")
+    return value
+
+
+def encode_cursor(sort: SortSpec, value, key) -> str:
+    payload = json.dumps([sort.name, _encode_value(value), key], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: SortSpec) -> Tuple[Any, Any]:
+    """Return (sort value, primary key) stored in the cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        name, value, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        value = _decode_value(value)
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidCursorError("Invalid cursor")
+    if name != sort.name:
+        raise InvalidCursorError(f"Cursor was issued for sort '{name}', not '{sort.name}'")
+    # A tampered cursor must not reach the query with the wrong types (a 500, not a 400)
+    if not isinstance(value, sort.column.type.python_type) or type(key) is not int:
+        raise InvalidCursorError("Invalid cursor")
+    return value, key
+
+
+def get_sort(sorts: dict, name: Optional[str], default: str) -> SortSpec:
+    """Look up a sort by name, raising ValueError for unknown names"""
+    name = name or default
+    if name not in sorts:
+        raise ValueError(f"Invalid sort: {name}. Must be one of {', '.join(sorts)}")
+    return sorts[name]
+
+
+def paginate(query, sort: SortSpec, cursor: Optional[str] = None, limit: int = 100) -> Tuple[List, Optional[str]]:
+    """
+    Apply keyset pagination to a query.
+
+    Fetches limit + 1 rows so we know whether another page exists without a COUNT.
+    Works for ORM entities and Core rows alike, as long as the sort and key
+    columns are present on each result under their column names.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    if cursor:
+        value, key = decode_cursor(cursor, sort)
+        query = query.filter(sort.after(value, key))
+
+    rows = query.order_by(*sort.order_by()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, getattr(last, sort.column.key), getattr(last, sort.key_column.key))
+    return rows, next_cursor
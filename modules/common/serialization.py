@@ -0,0 +1,126 @@
+"""
+Allocation-light JSON encoding for list endpoints.
+
+The ORM path (load Product objects, call to_dict(), then jsonify) builds a
+model instance, a dict and a tree of converted values for every row before
+any JSON is written. RowEncoder skips all of that: it is compiled once per
+column list, picks a converter per column type up front, and turns each
+Core row (tuple) straight into a JSON object string.
+"""
+import json
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Iterable, Optional
+from flask import Response
+from sqlalchemy import Numeric, Float, Integer, Boolean, DateTime, Date
+
+_encode_str = json.encoder.encode_basestring_ascii   # C-accelerated, what json.dumps uses
+
+
+def _encode_decimal(value: Decimal) -> str:
+    # Matches to_dict(), which sends Numeric columns as floats
+    return float.__repr__(float(value))
+
+
+def _encode_datetime(value) -> str:
+    return '"' + value.isoformat() + '"'
+
+
+def _encode_bool(value) -> str:
+    return 'true' if value else 'false'
+
+
+def _encode_any(value) -> str:
+    if isinstance(value, Decimal):
+        return _encode_decimal(value)
+    if isinstance(value, (datetime, date)):
+        return _encode_datetime(value)
+    return dumps(value)
+
+
+def _converter_for(column):
+    """Pick the cheapest JSON converter for a column from its SQL type"""
+    column_type = getattr(column, 'type', None)
+    if isinstance(column_type, Boolean):
+        return _encode_bool
+    if isinstance(column_type, Integer):
+        return int.__repr__
+    if isinstance(column_type, (Numeric, Float)):
+        return _encode_decimal
+    if isinstance(column_type, (DateTime, Date)):
+        return _encode_datetime
+    python_type = None
+    try:
+        python_type = column_type.python_type
+    except (AttributeError, NotImplementedError):
+        pass
+    if python_type is str:
+        return _encode_str
+    return _encode_any
+
+
+class RowEncoder:
+    """
+    Encodes rows selected with a fixed column list into JSON object strings.
+
+        encoder = RowEncoder([Product.product_id, Product.name, Product.price])
+        rows = db.execute(select(Product.product_id, Product.name, Product.price)).all()
+        encoder.encode_many(rows)  # -> '[{"product_id":1,"name":"...","price":4.5},...]'
+
+    Rows are read by position, so they must come from a select of exactly
+    these columns, in this order. Keys default to each column's name.
+    """
+
+    def __init__(self, columns, names: Optional[Iterable[str]] = None):
+        self.columns = list(columns)
+        names = list(names) if names is not None else [column.key for column in self.columns]
+        self._fields = [
+            (_encode_str(name) + ':', index, _converter_for(column))
+            for index, (name, column) in enumerate(zip(names, self.columns))
+        ]
+
+    def encode(self, row, **raw_fields) -> str:
+        """
+        Encode one row as a JSON object string.
+        raw_fields are appended as-is; values must already be JSON text,
+        e.g. encode(order, items='[...]') for a nested list.
+        """
+        parts = [
+            prefix + ('null' if row[index] is None else convert(row[index]))
+            for prefix, index, convert in self._fields
+        ]
+        for name, raw in raw_fields.items():
+            parts.append(_encode_str(name) + ':' + raw)
+        return '{' + ','.join(parts) + '}'
+
+    def encode_many(self, rows) -> str:
+        """Encode rows as a JSON array string"""
+        encode = self.encode
+        return '[' + ','.join([encode(row) for row in rows]) + ']'
+
+
+def dumps(value) -> str:
+    """Compact json.dumps for small payloads embedded next to encoded rows"""
+    return json.dumps(value, separators=(',', ':'), default=_encode_any_default)
+
+
+def _encode_any_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def json_page_response(key: str, items_json: str, next_cursor: Optional[str],
+                       status: int = 200, **raw_fields) -> Response:
+    """
+    Build a {"<key>": [...], "next_cursor": ..., **raw_fields} response around an
+    already encoded JSON array, without re-parsing it through jsonify.
+    raw_fields values must already be JSON text (see dumps()).
+    """
+    parts = [_encode_str(key) + ':' + items_json,
+             '"next_cursor":' + ('null' if next_cursor is None else _encode_str(next_cursor))]
+    for name, raw in raw_fields.items():
+        parts.append(_encode_str(name) + ':' + raw)
+    return Response('{' + ','.join(parts) + '}', status=status, mimetype='application/json')
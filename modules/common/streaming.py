@@ -0,0 +1,80 @@
+"""
+Streaming readers for bulk uploads (CSV / NDJSON).
+
+Both readers pull the request body a chunk at a time, so an upload of any
+size is processed with constant memory. gzip_chunks() does the same for
+streamed responses.
+"""
+import csv
+import io
+import json
+import zlib
+from typing import Iterator, Iterable, Tuple, Optional
+
+SUPPORTED_FORMATS = ('csv', 'ndjson')
+
+
+def detect_format(fmt: Optional[str], content_type: Optional[str]) -> str:
+    """
+    Pick the upload format from an explicit ?format= value or the Content-Type header.
+    Raises ValueError when neither identifies a supported format.
+    """
+    if fmt:
+        fmt = fmt.lower()
+    elif content_type:
+        content_type = content_type.lower()
+        if 'csv' in content_type:
+            fmt = 'csv'
+        elif 'ndjson' in content_type or 'jsonlines' in content_type or 'x-json-stream' in content_type:
+            fmt = 'ndjson'
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported upload format. Use one of {', '.join(SUPPORTED_FORMATS)}")
+    return fmt
+
+
+def _text_stream(stream) -> io.TextIOWrapper:
+    if not isinstance(stream, io.BufferedIOBase):
+        stream = io.BufferedReader(stream)
+    return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+
+def iter_records(stream, fmt: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Yield (row_number, record, parse_error) for every record in a binary stream.
+    row_number is 1-based and counts data records (a CSV header is not a row).
+    Exactly one of record / parse_error is set.
+    """
+    text = _text_stream(stream)
+    if fmt == 'csv':
+        for row_number, record in enumerate(csv.DictReader(text), start=1):
+            if None in record:
+                yield row_number, None, "Row has more columns than the header"
+                continue
+            yield row_number, record, None
+        return
+
+    row_number = 0
+    for line in text:
+        line = line.strip()
+        if not line:
+            continue
+        row_number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield row_number, None, "Each line must be a JSON object"
+            continue
+        yield row_number, record, None
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip a stream of byte chunks on the fly, yielding compressed chunks as they fill"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # 16+ = gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,27 @@
+"""
+Model registry
+
+Relationships name their targets as strings ("Review", "TrinketCategory"),
+which SQLAlchemy resolves the first time mappers are configured: on the
+first query, or when loader options are built. Every class named must be
+imported by then, so this module imports all the model modules, and
+configure_mappers() is called by app.py at startup and by services that
+build loader options at import time.
+"""
+from sqlalchemy import orm
+from modules.auth import models as auth_models
+from modules.products import models as products_models
+from modules.orders import models as orders_models
+from modules.reviews import models as reviews_models
+from modules.price_intelligence import models as price_intelligence_models
+from modules.analytics import models as analytics_models
+
+MODEL_MODULES = (
+    auth_models, products_models, orders_models, reviews_models,
+    price_intelligence_models, analytics_models,
+)
+
+
+def configure_mappers():
+    """Resolve every relationship now; raises if a model references an unknown class"""
+    orm.configure_mappers()
@@ -0,0 +1,128 @@
+"""
+Idempotency keys for POST /orders
+
+Clients retry checkouts on timeouts. When a request carries an
+Idempotency-Key header, the key is claimed with
+
+    INSERT INTO idempotency_keys ... ON CONFLICT (user_id, key) DO NOTHING
+
+in the SAME transaction that creates the order, so:
+- a retry after success finds the key and gets the stored response back,
+  without the order logic running again;
+- a concurrent duplicate blocks on the unique index until the first request
+  commits (then replays its response) or rolls back (then runs itself);
+- if the order fails, the key is rolled back with it and a retry runs anew.
+
+Keys are scoped per user and expire after IDEMPOTENCY_TTL_HOURS; an expired
+key can be claimed again and the sweeper deletes old rows.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select, delete, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from modules.orders.models import IdempotencyKey
+
+IDEMPOTENCY_TTL = timedelta(hours=float(os.getenv('IDEMPOTENCY_TTL_HOURS', 24)))
+MAX_KEY_LENGTH = 255
+SWEEP_BATCH_SIZE = 5000
+
+
+class IdempotencyKeyMismatch(ValueError):
+    """The key was already used for a different request body"""
+
+
+def request_fingerprint(payload) -> str:
+    """sha256 of the canonical JSON of a request body"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class IdempotencyService:
+
+    @staticmethod
+    def claim(db: Session, user_id: int, key: str, request_hash: str) -> Optional[IdempotencyKey]:
+        """
+        Claim `key` for this request inside the current transaction.
+        Returns None if claimed (go ahead, then call record_order before committing),
+        or the committed row of an earlier request with the same key to replay.
+        Blocks while another transaction holds an uncommitted claim on the key.
+        Raises IdempotencyKeyMismatch if that earlier request had a different body.
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ValueError(f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+        now = datetime.utcnow()
+        table = IdempotencyKey.__table__
+        stmt = insert(table).values(
+            user_id=user_id, key=key, request_hash=request_hash,
+            created_at=now, expires_at=now + IDEMPOTENCY_TTL,
+        )
+        # An expired key is free again: take it over instead of replaying it
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.key],
+            set_={
+                'request_hash': stmt.excluded.request_hash,
+                'order_id': None, 'status_code': None, 'response': None,
+                'created_at': stmt.excluded.created_at,
+                'expires_at': stmt.excluded.expires_at,
+            },
+            where=table.c.expires_at < now,
+        ).returning(table.c.user_id)
+        if db.execute(stmt).first() is not None:
+            return None
+
+        existing = db.execute(
+            select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        ).scalar_one()
+        if existing.request_hash != request_hash:
+            raise IdempotencyKeyMismatch("Idempotency-Key was already used with a different request")
+        return existing
+
+    @staticmethod
+    def record_order(db: Session, user_id: int, key: str, order_id: int):
+        """Link the claimed key to the order it created (before the order commits)"""
+        db.execute(
+            IdempotencyKey.__table__.update()
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .values(order_id=order_id)
+        )
+
+    @staticmethod
+    def record_response(db: Session, user_id: int, key: str, status_code: int, body: str):
+        """
+        Store the response returned for the key so replays return exactly that.
+        Best effort: the order is already committed, and without a stored
+        response a replay renders the order again from order_id.
+        """
+        try:
+            db.execute(
+                IdempotencyKey.__table__.update()
+                .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+                .values(status_code=status_code, response=body)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+
+    @staticmethod
+    def sweep_expired(db: Session, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+        """Delete expired keys in batches (SKIP LOCKED: never waits on live checkouts); returns rows deleted"""
+        total = 0
+        while True:
+            expired = (
+                select(IdempotencyKey.user_id, IdempotencyKey.key)
+                .where(IdempotencyKey.expires_at < datetime.utcnow())
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            deleted = db.execute(
+                delete(IdempotencyKey)
+                .where(tuple_(IdempotencyKey.user_id, IdempotencyKey.key).in_(expired))
+            ).rowcount
+            db.commit()
+            total += deleted
+            if deleted < batch_size:
+                return total
@@ -1,20 +1,35 @@
 """
 Order and OrderItem models
 """
-from sqlalchemy import Column, Integer, String, Numeric, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Numeric, Text, DateTime, ForeignKey, Index, PrimaryKeyConstraint, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from config.database import Base
 
+ORDER_STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+# Fulfilment flow: status -> statuses it may move to
+ALLOWED_TRANSITIONS = {
+    'pending':    {'processing', 'cancelled'},
+    'processing': {'shipped', 'cancelled'},
+    'shipped':    {'delivered'},
+    'delivered':  set(),
+    'cancelled':  set(),
+}
+
 class Order(Base):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Keyset pagination for the all-orders and per-user listings
+        Index('idx_orders_date_id', 'order_date', 'order_id'),
+        Index('idx_orders_user_date_id', 'user_id', 'order_date', 'order_id'),
+    )
     
     order_id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False)
     total_amount = Column(Numeric(10, 2), nullable=False)
     status = Column(String(50), default='pending')
     shipping_address = Column(Text)
-    order_date = Column(DateTime, default=datetime.utcnow)
+    order_date = Column(DateTime, default=datetime.utcnow, nullable=False)
     shipped_date = Column(DateTime)
     delivered_date = Column(DateTime)
     
@@ -27,7 +42,7 @@ class Order(Base):
         return {
             'order_id': self.order_id,
             'user_id': self.user_id,
-            'total_amount': float(self.total_amount) if self.total_amount else None,
+            'total_amount': float(self.total_amount) if self.total_amount is not None else None,
             'status': self.status,
             'shipping_address': self.shipping_address,
             'order_date': self.order_date.isoformat() if self.order_date else None,
@@ -60,9 +75,80 @@ class OrderItem(Base):
             'order_id': self.order_id,
             'product_id': self.product_id,
             'quantity': self.quantity,
-            'price': float(self.price) if self.price else None,
-            'product': self.product.to_dict() if self.product else None
+            'price': float(self.price) if self.price is not None else None,
+            'product': self.product.to_summary_dict() if self.product else None
         }
     
     def __repr__(self):
-        return f"<OrderItem(id={self.order_item_id}, order_id={self.order_id}, product_id={self.product_id})>"
\ No newline at end of file
+        return f"<OrderItem(id={self.order_item_id}, order_id={self.order_id}, product_id={self.product_id})>"
+
+
+class IdempotencyKey(Base):
+    """
+    One row per Idempotency-Key a client sent with POST /orders
+    (see modules/orders/idempotency.py). Rows expire after a TTL and are
+    deleted by data/scripts/run_sweepers.py.
+    """
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        PrimaryKeyConstraint('user_id', 'key'),
+        Index('idx_idempotency_keys_expires', 'expires_at'),
+    )
+
+    user_id = Column(Integer, nullable=False)
+    key = Column(String(255), nullable=False)
+    request_hash = Column(String(64), nullable=False)   # sha256 of the request body
+    order_id = Column(Integer, ForeignKey('orders.order_id', ondelete='CASCADE'))
+    status_code = Column(Integer)
+    response = Column(Text)                             # JSON body as first returned
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<IdempotencyKey(user_id={self.user_id}, key='{self.key}', order_id={self.order_id})>"
+
+
+class OrderEvent(Base):
+    """
+    Transactional outbox: one row per order status transition, written in the
+    same transaction as the change and delivered by modules/orders/outbox.py
+    """
+    __tablename__ = 'order_events'
+    __table_args__ = (
+        # The worker's queue: pending events in delivery order
+        Index('idx_order_events_pending', 'available_at', 'event_id', postgresql_where=text("status = 'pending'")),
+        Index('idx_order_events_order', 'order_id'),
+        # Retention sweep of delivered events
+        Index('idx_order_events_processed', 'processed_at', postgresql_where=text("status = 'done'")),
+    )
+
+    event_id = Column(BigInteger, primary_key=True)
+    order_id = Column(Integer, ForeignKey('orders.order_id', ondelete='CASCADE'), nullable=False)
+    event_type = Column(String(50), nullable=False)    # "order.created", "order.status_changed", "order.cancelled"
+    from_status = Column(String(50))
+    to_status = Column(String(50))
+    payload = Column(Text, nullable=False)             # JSON
+    status = Column(String(20), nullable=False, default='pending')   # pending, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    available_at = Column(DateTime, default=datetime.utcnow)   # retries are pushed back
+    processed_at = Column(DateTime)
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'event_id':     self.event_id,
+            'order_id':     self.order_id,
+            'event_type':   self.event_type,
+            'from_status':  self.from_status,
+            'to_status':    self.to_status,
+            'status':       self.status,
+            'attempts':     self.attempts,
+            'last_error':   self.last_error,
+            'created_at':   self.created_at.isoformat() if self.created_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None,
+        }
+
+    def __repr__(self):
+        return f"<OrderEvent(id={self.event_id}, order_id={self.order_id}, type='{self.event_type}', status='{self.status}')>"
@@ -0,0 +1,245 @@
+"""
+Transactional outbox for order events
+
+Every order status transition (creation, status change, cancellation) adds
+a row to order_events in the same transaction as the change itself, so an
+event exists if and only if the change committed. OutboxProcessor then
+delivers pending events to in-process handlers:
+
+- A batch is claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several
+  workers can drain the table without blocking on each other.
+- Each event runs its handlers inside a savepoint on the worker's session,
+  and is marked done in the same commit. Database work done by a handler
+  therefore commits exactly when its event is marked delivered.
+- A handler that raises rolls back its savepoint only. That event is retried
+  later with exponential backoff, and marked failed after MAX_ATTEMPTS.
+- If the worker dies before committing, the whole batch stays pending and is
+  delivered again: delivery is at-least-once, so handlers must be idempotent.
+  Events are delivered in event_id order within a batch; with several
+  workers, events of one order can be handled concurrently.
+
+Handlers are plain functions taking (db, event), registered per event type
+("*" for all) with outbox_processor.handler(...). No broker is involved.
+"""
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.orm import Session
+from modules.orders.models import OrderEvent
+
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 500))
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 10))
+MAX_BACKOFF_SECONDS = 300
+# Delivered events are kept this long, then deleted by run_sweepers.py
+OUTBOX_RETENTION = timedelta(days=float(os.getenv('OUTBOX_RETENTION_DAYS', 7)))
+# Window for the events/second figure in stats()
+THROUGHPUT_WINDOW_SECONDS = 60
+
+EVENT_COLUMNS = [
+    OrderEvent.event_id, OrderEvent.order_id, OrderEvent.event_type, OrderEvent.from_status,
+    OrderEvent.to_status, OrderEvent.payload, OrderEvent.attempts, OrderEvent.created_at,
+]
+
+Handler = Callable[[Session, dict], None]
+
+
+def order_event_values(order, event_type: str, from_status: Optional[str], to_status: str, **payload) -> dict:
+    """Column values for an order_events row; `order` is an Order or a row with the same fields"""
+    body = {
+        'user_id':      order.user_id,
+        'total_amount': float(order.total_amount) if order.total_amount is not None else None,
+        'order_date':   order.order_date.isoformat() if order.order_date else None,
+        **payload,
+    }
+    return {
+        'order_id':    order.order_id,
+        'event_type':  event_type,
+        'from_status': from_status,
+        'to_status':   to_status,
+        'payload':     json.dumps(body, default=str),
+    }
+
+
+def record_order_event(db: Session, order, event_type: str, from_status: Optional[str], **payload):
+    """
+    Add an outbox event for `order` to the current transaction (no commit).
+    The order must already have an order_id (flush first for new orders).
+    """
+    db.add(OrderEvent(**order_event_values(order, event_type, from_status, order.status, **payload)))
+
+
+class OutboxProcessor:
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._stats_lock = Lock()
+        self._recent = deque()          # (finished_at, events delivered) per batch
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+        self.batches = 0
+        self.last_batch_seconds = 0.0
+        self.last_delivery_lag_seconds = 0.0
+
+    # ------------------------------------------------------------------
+    # Handlers
+    # ------------------------------------------------------------------
+
+    def register(self, event_type: str, handler: Handler):
+        """Call handler(db, event) for every event of this type ("*" for all)"""
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def unregister(self, event_type: str, handler: Handler):
+        handlers = self._handlers.get(event_type, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def handler(self, event_type: str):
+        """Decorator form of register()"""
+        def decorator(func: Handler) -> Handler:
+            self.register(event_type, func)
+            return func
+        return decorator
+
+    def _dispatch(self, db: Session, event: dict):
+        for handler in self._handlers.get(event['event_type'], []) + self._handlers.get('*', []):
+            handler(db, event)
+
+    # ------------------------------------------------------------------
+    # Processing
+    # ------------------------------------------------------------------
+
+    def process_batch(self, db: Session, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+        """Deliver up to batch_size pending events in one transaction; returns events handled"""
+        start = time.perf_counter()
+        now = datetime.utcnow()
+        rows = db.execute(
+            select(*EVENT_COLUMNS)
+            .where(OrderEvent.status == 'pending', OrderEvent.available_at <= now)
+            .order_by(OrderEvent.available_at, OrderEvent.event_id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            db.rollback()
+            return 0
+
+        delivered, retried, dead = [], 0, 0
+        for row in rows:
+            event = dict(row._mapping)
+            event['payload'] = json.loads(event['payload'])
+            try:
+                with db.begin_nested():
+                    self._dispatch(db, event)
+            except Exception as e:
+                attempts = row.attempts + 1
+                values = {'attempts': attempts, 'last_error': repr(e)[:2000]}
+                if attempts >= MAX_ATTEMPTS:
+                    values['status'] = 'failed'
+                    dead += 1
+                else:
+                    values['available_at'] = now + timedelta(seconds=min(2 ** attempts, MAX_BACKOFF_SECONDS))
+                    retried += 1
+                db.execute(update(OrderEvent).where(OrderEvent.event_id == row.event_id).values(**values))
+            else:
+                delivered.append(row.event_id)
+
+        finished = datetime.utcnow()
+        if delivered:
+            db.execute(
+                update(OrderEvent)
+                .where(OrderEvent.event_id.in_(delivered))
+                .values(status='done', processed_at=finished, attempts=OrderEvent.attempts + 1)
+            )
+        db.commit()
+
+        elapsed = time.perf_counter() - start
+        delivered_ids = set(delivered)
+        oldest = min((row.created_at for row in rows if row.event_id in delivered_ids), default=None)
+        with self._stats_lock:
+            self.delivered += len(delivered)
+            self.retried += retried
+            self.dead += dead
+            self.batches += 1
+            self.last_batch_seconds = elapsed
+            if oldest is not None:
+                self.last_delivery_lag_seconds = (finished - oldest).total_seconds()
+            self._recent.append((time.monotonic(), len(delivered)))
+        return len(rows)
+
+    def drain(self, db: Session, batch_size: int = OUTBOX_BATCH_SIZE, max_batches: Optional[int] = None) -> int:
+        """Process batches until nothing is due (or max_batches); returns events handled"""
+        total = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            handled = self.process_batch(db, batch_size)
+            if not handled:
+                break
+            total += handled
+            batches += 1
+        return total
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def lag(db: Session) -> dict:
+        """Backlog: pending events and the age of the oldest one (uses the pending index)"""
+        pending, oldest = db.execute(
+            select(func.count(), func.min(OrderEvent.created_at)).where(OrderEvent.status == 'pending')
+        ).one()
+        failed = db.execute(select(func.count()).where(OrderEvent.status == 'failed')).scalar()
+        return {
+            'pending': pending,
+            'failed': failed,
+            'oldest_pending_age_seconds': (
+                round((datetime.utcnow() - oldest).total_seconds(), 3) if oldest else 0.0
+            ),
+        }
+
+    def stats(self) -> dict:
+        """Counters for this process, and delivered events/second over the last minute"""
+        with self._stats_lock:
+            cutoff = time.monotonic() - THROUGHPUT_WINDOW_SECONDS
+            while self._recent and self._recent[0][0] < cutoff:
+                self._recent.popleft()
+            recent = sum(count for _, count in self._recent)
+            return {
+                'delivered': self.delivered,
+                'retried': self.retried,
+                'failed': self.dead,
+                'batches': self.batches,
+                'events_per_second': round(recent / THROUGHPUT_WINDOW_SECONDS, 2),
+                'last_batch_ms': round(self.last_batch_seconds * 1000, 2),
+                'last_delivery_lag_seconds': round(self.last_delivery_lag_seconds, 3),
+            }
+
+    # ------------------------------------------------------------------
+    # Retention
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def sweep_delivered(db: Session, batch_size: int = 5000) -> int:
+        """Delete delivered events older than OUTBOX_RETENTION in batches; returns rows deleted"""
+        total = 0
+        while True:
+            old = (
+                select(OrderEvent.event_id)
+                .where(OrderEvent.status == 'done', OrderEvent.processed_at < datetime.utcnow() - OUTBOX_RETENTION)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            deleted = db.execute(delete(OrderEvent).where(OrderEvent.event_id.in_(old))).rowcount
+            db.commit()
+            total += deleted
+            if deleted < batch_size:
+                return total
+
+
+outbox_processor = OutboxProcessor()
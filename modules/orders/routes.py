@@ -1,6 +1,10 @@
-from flask import Blueprint, request, jsonify
-from modules.products.services import OrderService
-from config import SessionLocal
+from flask import Blueprint, Response, request, jsonify
+from modules.orders.services import OrderService
+from modules.orders.idempotency import IdempotencyService, IdempotencyKeyMismatch, request_fingerprint
+from modules.orders.outbox import OutboxProcessor, outbox_processor
+from modules.common.serialization import json_page_response
+from modules.common.http_cache import make_etag, list_etag, is_not_modified, not_modified, with_validators
+from config.database import SessionLocal
 
 #Create a Blueprint for orders
 orders_bp = Blueprint('orders', __name__)
@@ -27,31 +31,76 @@ def create_order():
         ],
         "shipping_address": "123 Main St, City, State 12345"  (optional)
     }
+    or, to buy what the user holds (see POST /api/products/<id>/reservations),
+    "reservation_ids": [3, 4] instead of "items".
+
+    Optional header Idempotency-Key: retrying with the same key (and body)
+    returns the first response, with Idempotency-Replayed: true, instead of
+    creating another order. Reusing a key with a different body is a 422.
     """
     db = SessionLocal()
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Body must be a JSON object"}), 400
 
-        required_fields = ['user_id', 'items']
+        from_reservations = 'reservation_ids' in data
+        required_fields = ['user_id', 'reservation_ids' if from_reservations else 'items']
         if not all(field in data for field in required_fields):
             return jsonify({"error": "Missing required fields"}), 400
+        # Validate before claiming the Idempotency-Key, so a bad body never reaches the database
+        if isinstance(data['user_id'], bool) or not isinstance(data['user_id'], int):
+            return jsonify({"error": "user_id must be an integer"}), 400
         #validate items
-        if not data['items'] or not isinstance(data['items'], list):
+        if not from_reservations and (not data['items'] or not isinstance(data['items'], list)):
             return jsonify({"error": "Items must be a non-empty list"}), 400
-        #db: Session, user_id: int, items: List[Dict], shipping_address: str = None) -> Optional[Order]
-        order = OrderService.create_order(
-            db,
-            user_id = data['user_id'],
-            items = data['items'],
-            shipping_address = data.get('shipping_address')
-        )
+        if from_reservations and (not data['reservation_ids'] or not isinstance(data['reservation_ids'], list) or
+                not all(isinstance(rid, int) and not isinstance(rid, bool) for rid in data['reservation_ids'])):
+            return jsonify({"error": "reservation_ids must be a non-empty list of ids"}), 400
+        idempotency_key = request.headers.get('Idempotency-Key')
+        before_commit = None
+        if idempotency_key is not None:
+            # Blocks while a duplicate of this request is still in flight
+            previous = IdempotencyService.claim(db, data['user_id'], idempotency_key, request_fingerprint(data))
+            if previous is not None:
+                return _replay_order(db, previous)
+            before_commit = lambda order: IdempotencyService.record_order(
+                db, data['user_id'], idempotency_key, order.order_id)
+
+        if from_reservations:
+            order = OrderService.create_order_from_reservations(
+                db,
+                user_id = data['user_id'],
+                reservation_ids = data['reservation_ids'],
+                shipping_address = data.get('shipping_address'),
+                before_commit = before_commit
+            )
+        else:
+            #db: Session, user_id: int, items: List[Dict], shipping_address: str = None) -> Optional[Order]
+            order = OrderService.create_order(
+                db,
+                user_id = data['user_id'],
+                items = data['items'],
+                shipping_address = data.get('shipping_address'),
+                before_commit = before_commit
+            )
         if not order:
             return jsonify({"error": "Failed to create order."}), 400
         
-        return jsonify({order._to_dict()}), 201
+        response = jsonify(order.to_dict())
+        if idempotency_key is not None:
+            IdempotencyService.record_response(
+                db, data['user_id'], idempotency_key, 201, response.get_data(as_text=True))
+        return response, 201
     
+    except IdempotencyKeyMismatch as mismatch:
+        db.rollback()
+        return jsonify({"error": str(mismatch)}), 422
+
     except ValueError as ve:
-         # ValueError is raised for business logic errors (e.g., insufficient stock)
+         # ValueError is raised for business logic errors (e.g., insufficient stock);
+         # roll back so a claimed Idempotency-Key goes with the failed order
+        db.rollback()
         return jsonify({"error": str(ve)}), 400
     
     except Exception as e:
@@ -61,43 +110,115 @@ def create_order():
     finally:
         db.close()
 
+def _replay_order(db, previous):
+    """The response first given for an idempotency key"""
+    if previous.response is not None:
+        response = Response(previous.response, status=previous.status_code, mimetype='application/json')
+    else:
+        # The order committed but its response wasn't stored yet: render it again
+        order = OrderService.get_order_by_id(db, previous.order_id)
+        if order is None:
+            return jsonify({"error": "Order not found."}), 404
+        response = jsonify(order.to_dict())
+        response.status_code = 201
+    response.headers['Idempotency-Replayed'] = 'true'
+    return response
+
 @orders_bp.route('/orders/<int:order_id>', methods=['GET'])
 def get_order(order_id):
     """
     Get order details by order ID
     
     Endpoint: GET /api/orders/<order_id>
+
+    Responses carry an ETag derived from the order status (and the products in it).
+    Send it back as If-None-Match and an unchanged order answers 304 with no body.
     """
     db = SessionLocal()
     try:
+       version = OrderService.get_order_version(db, order_id)
+       if version is None:
+           return jsonify({"error": "Order not found."}), 404
+       etag = make_etag('order', order_id, *version)
+       if is_not_modified(etag):
+           return not_modified(etag)
+
        order = OrderService.get_order_by_id(db, order_id)
        if not order:
            return jsonify({"error": "Order not found."}), 404
-       return jsonify(order.to_dict()), 200
+       return with_validators(jsonify(order.to_dict()), etag)
     
     finally:
         db.close()
 
-@orders_bp.route('/orders/<int:user_id>', methods=['GET'])
-def get_user_orders(user_id_):
+def _order_page_response(db, orders, next_cursor):
+    """
+    Page of orders with a weak ETag over their ids and status fields.
+    The ETag is checked before the items are loaded, so a 304 costs one query.
+    """
+    etag = list_etag(orders, 'order_id', 'status', 'shipped_date', 'delivered_date', extra=next_cursor)
+    if is_not_modified(etag):
+        return not_modified(etag, weak=True)
+    response = json_page_response("orders", OrderService.encode_orders(db, orders), next_cursor)
+    return with_validators(response, etag, weak=True)
+
+@orders_bp.route('/orders', methods=['GET'])
+def get_all_orders():
+    """
+    Get all orders, one page at a time (keyset pagination)
+    Endpoint: GET /api/orders?limit=10&sort=newest&cursor=<next_cursor>
+
+    Query Parameters:
+    limit: Number of records to return (default: 10)
+    sort: newest | oldest (default: newest)
+    cursor: next_cursor from the previous page (omit for the first page)
+
+    Returns:
+    200: { "orders": [...], "next_cursor": "..." }  (next_cursor is null on the last page)
+         each item embeds a product summary: product_id, name, image_url, condition, rarity
+         and the page carries a weak ETag (If-None-Match -> 304 when nothing changed)
+    400: Invalid cursor, sort or limit
+    """
+    db = SessionLocal()
+    try:
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', default=10, type=int)
+        sort = request.args.get('sort')
+
+        orders, next_cursor = OrderService.get_all_orders(db, cursor, limit, sort)
+        return _order_page_response(db, orders, next_cursor)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    finally:
+        db.close()
+
+@orders_bp.route('/orders/user/<int:user_id>', methods=['GET'])
+def get_user_orders(user_id):
     """
     Get all of the orders for a specific user by user ID
-    Endpoint: GET /api/orders/user/5?skip=0&limit=10
+    Endpoint: GET /api/orders/user/5?limit=10&cursor=<next_cursor>
 
     URL Parameters:
-    skip: Number of records to skeip (default: 0)
     limit: Number of records to return (default: 10)
+    sort: newest | oldest (default: newest)
+    cursor: next_cursor from the previous page (omit for the first page)
 
-
+    Returns:
+    200: { "orders": [...], "next_cursor": "..." }  (next_cursor is null on the last page)
+         each item embeds a product summary: product_id, name, image_url, condition, rarity
+         and the page carries a weak ETag (If-None-Match -> 304 when nothing changed)
+    400: Invalid cursor, sort or limit
     """
     db=SessionLocal()
     try:
-        skip = request.args.get('skip', default=0, type=int)
+        cursor = request.args.get('cursor')
         limit = request.args.get('limit', default= 10, type=int)
+        sort = request.args.get('sort')
 
-        #get all orders
-        orders = OrderService.get_all_orders(db,skip,limit)
-        return jsonify([order.to_dict() for order in orders]), 200
+        orders, next_cursor = OrderService.get_user_orders(db, user_id, cursor, limit, sort)
+        return _order_page_response(db, orders, next_cursor)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     finally:
         db.close()
 
@@ -112,11 +233,12 @@ def update_order_status(order_id):
         "status": "shipped"
     }
     valid status values: pending,processing, shipped, delivered, cancelled
-
+    Only the moves in ALLOWED_TRANSITIONS are accepted (same rules as
+    PATCH /api/orders/status); cancelling restores stock.
     
     Returns:
     200: Updated order details
-    400: Missing status field
+    400: Missing or unknown status, or a transition that isn't allowed
     404: Order not found
     """
     db = SessionLocal()
@@ -130,12 +252,60 @@ def update_order_status(order_id):
         
         return jsonify(order.to_dict()), 200
     
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         db.rollback()
         return jsonify({"error": "An error occurred while updating the order status."}), 500
     finally:
         db.close()
 
+@orders_bp.route('/orders/status', methods=['PATCH'])
+def bulk_update_order_status():
+    """
+    Change the status of many orders at once (e.g. a batch leaving the warehouse)
+    Endpoint: PATCH /api/orders/status
+
+    Expected JSON body:
+    {
+        "updates": [
+            {"order_id": 1, "status": "shipped"},
+            {"order_id": 2, "status": "cancelled"},
+            ...
+        ]
+    }
+    Allowed changes: pending -> processing -> shipped -> delivered, and
+    pending/processing -> cancelled (stock is restored). shipped_date and
+    delivered_date are set automatically.
+
+    Returns:
+        200: { "results": [{"order_id", "result": "updated"|"unchanged"|"rejected"|"not_found",
+                            "from_status", "to_status", "error"}],
+               "updated": n }
+             Orders that can't make their change are reported, the rest are applied.
+        400: Malformed body (nothing is written): { "error": ..., "details": [{"index": 3, "errors": [...]}] }
+        500: Server error
+    """
+    db = SessionLocal()
+    try:
+        data = request.get_json(silent=True)
+        updates = data.get('updates') if isinstance(data, dict) else None
+        if not isinstance(updates, list) or not updates:
+            return jsonify({"error": "Body must contain a non-empty 'updates' list"}), 400
+
+        results = OrderService.bulk_update_status(db, updates)
+        return jsonify({
+            "results": results,
+            "updated": sum(1 for result in results if result['result'] == 'updated'),
+        }), 200
+    except ValueError as ve:
+        return jsonify({"error": str(ve), "details": getattr(ve, 'errors', [])}), 400
+    except Exception:
+        db.rollback()
+        return jsonify({"error": "An error occurred while updating order statuses."}), 500
+    finally:
+        db.close()
+
 @orders_bp.route('/<int:order_id>/cancel', methods=['POST'])
 def cancel_order(order_id):
     """
@@ -147,6 +317,7 @@ def cancel_order(order_id):
     1. Check if order exists and is in a cancellable state (pending or processing)
     2. Restore stock for each item in the order
     3. Update order status to cancelled
+    4. Record an order.cancelled event in the outbox (same transaction)
     
     """
     db = SessionLocal()
@@ -166,3 +337,24 @@ def cancel_order(order_id):
         return jsonify({"error": "An error occurred while cancelling the order."}), 500
     finally:
         db.close()
+
+@orders_bp.route('/orders/events/stats', methods=['GET'])
+def get_outbox_stats():
+    """
+    Outbox backlog, plus delivery counters if this process runs a worker
+
+    GET /api/orders/events/stats
+
+    Returns:
+        200: { "lag": {"pending", "failed", "oldest_pending_age_seconds"}, "processor": {...} }
+    """
+    db = SessionLocal()
+    try:
+        return jsonify({
+            "lag": OutboxProcessor.lag(db),
+            "processor": outbox_processor.stats(),
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        db.close()
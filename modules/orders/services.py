@@ -1,107 +1,401 @@
 """
 Order service - business logic for order operations
 """
-from sqlalchemy.orm import Session
-from modules.orders.models import Order, OrderItem
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, select, update, insert
+from modules.models import configure_mappers
+from modules.orders.models import Order, OrderItem, OrderEvent, ORDER_STATUSES, ALLOWED_TRANSITIONS
+from modules.products.models import Product
 from modules.products.services import ProductService
-from typing import Optional, List, Dict
+from modules.products.reservations import ReservationService
+from modules.orders.outbox import record_order_event, order_event_values
+from modules.common.pagination import SortSpec, paginate, get_sort
+from modules.common.serialization import RowEncoder
+from typing import Optional, List, Dict, Tuple, Callable
+from datetime import datetime
+
+ORDER_SORTS = {
+    'newest': SortSpec('newest', Order.order_date, Order.order_id, descending=True),
+    'oldest': SortSpec('oldest', Order.order_date, Order.order_id),
+}
+DEFAULT_ORDER_SORT = 'newest'
+
+# Column projections for order listings: the order row, its items, and just the
+# product fields an order view shows (not the whole product)
+ORDER_LIST_COLUMNS = [
+    Order.order_id, Order.user_id, Order.total_amount, Order.status, Order.shipping_address,
+    Order.order_date, Order.shipped_date, Order.delivered_date,
+]
+ORDER_ITEM_COLUMNS = [
+    OrderItem.order_item_id, OrderItem.order_id, OrderItem.product_id, OrderItem.quantity, OrderItem.price,
+]
+ORDER_ITEM_PRODUCT_COLUMNS = [getattr(Product, field) for field in Product.SUMMARY_FIELDS]
+order_list_encoder = RowEncoder(ORDER_LIST_COLUMNS)
+order_item_encoder = RowEncoder(ORDER_ITEM_COLUMNS)
+order_item_product_encoder = RowEncoder(ORDER_ITEM_PRODUCT_COLUMNS)
+
+# Loader options for Order objects that will be serialized with to_dict():
+# items in one extra query, each with just its product summary joined in
+configure_mappers()   # the loader options below need every relationship resolved
+ORDER_EAGER_LOAD = (
+    selectinload(Order.order_items)
+    .joinedload(OrderItem.product)
+    .load_only(*ORDER_ITEM_PRODUCT_COLUMNS),
+)
+
+MAX_BULK_STATUS_UPDATES = 5000
 
 class OrderService:
     
+    @staticmethod
+    def merge_order_items(items: List[Dict]) -> Dict[int, int]:
+        """
+        Validate line items and merge repeated products:
+        [{'product_id': 5, 'quantity': 1}, {'product_id': 5, 'quantity': 2}] -> {5: 3}
+        Keeps the order products first appear in. Raises ValueError on bad items.
+        """
+        quantities: Dict[int, int] = {}
+        for item in items:
+            try:
+                product_id = int(item['product_id'])
+                quantity = int(item['quantity'])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Each item needs an integer product_id and quantity")
+            if quantity < 1:
+                raise ValueError(f"Quantity for product {product_id} must be at least 1")
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        return quantities
+
     @staticmethod
     def create_order(db: Session, user_id: int, items: List[Dict], 
-                    shipping_address: str = None) -> Optional[Order]:
+                    shipping_address: str = None,
+                    before_commit: Optional[Callable[[Order], None]] = None) -> Optional[Order]:
         """
         Create a new order with items
         items format: [{'product_id': 1, 'quantity': 2}, ...]
+
+        Stock is taken first with one conditional UPDATE (see
+        ProductService.take_stock), so the availability check and the decrement
+        are atomic and a single remaining unit can't be sold twice. The order
+        and its items go into the same transaction and one commit, so product
+        rows stay locked only for that short write.
+        Returns None if a product doesn't exist; raises ValueError (and writes
+        nothing) if one is inactive or short on stock.
+        before_commit(order), if given, runs after the order is flushed (so it
+        has an order_id) and its writes commit or roll back with the order.
+        """
+        quantities = OrderService.merge_order_items(items)
+
+        taken = ProductService.take_stock(db, quantities)
+        if len(taken) != len(quantities):
+            db.rollback()
+            return OrderService._explain_unavailable(db, quantities, taken)
+        return OrderService._place_order(db, user_id, quantities, taken, shipping_address, before_commit)
+
+    @staticmethod
+    def create_order_from_reservations(db: Session, user_id: int, reservation_ids: List[int],
+                                       shipping_address: str = None,
+                                       before_commit: Optional[Callable[[Order], None]] = None) -> Order:
+        """
+        Turn the user's stock reservations into an order in one transaction:
+        the reservations are deleted, the held units come off both stock and
+        reserved_quantity, and the order is written - or none of it happens.
+        Raises ValueError if any reservation is unknown, someone else's or expired.
         """
+        if (not reservation_ids or not isinstance(reservation_ids, list) or
+                not all(isinstance(rid, int) and not isinstance(rid, bool) for rid in reservation_ids)):
+            raise ValueError("reservation_ids must be a non-empty list of ids")
+        quantities = ReservationService.claim_for_order(db, user_id, reservation_ids)
+        if quantities is None:
+            db.rollback()
+            raise ValueError("Some reservations have expired or do not exist")
+        taken = ProductService.take_stock(db, quantities, reserved=True)
+        if len(taken) != len(quantities):
+            db.rollback()
+            raise ValueError("Some reserved products are no longer available")
+        return OrderService._place_order(db, user_id, quantities, taken, shipping_address, before_commit)
+
+    @staticmethod
+    def _place_order(db: Session, user_id: int, quantities: Dict[int, int], taken: Dict[int, tuple],
+                     shipping_address: Optional[str], before_commit: Optional[Callable[[Order], None]]) -> Order:
+        """Write the order for stock already taken in this transaction, commit, and reload it"""
         total_amount = 0
-        order_items = []
-        
-        # Validate and calculate total
-        for item in items:
-            product = ProductService.get_product_by_id(db, item['product_id'])
-            if not product:
-                return None
-            
-            if product.stock_quantity < item['quantity']:
-                raise ValueError(f"Insufficient stock for product {product.name}")
-            
-            item_price = product.price * item['quantity']
-            total_amount += item_price
-            
-            order_items.append({
-                'product_id': product.product_id,
-                'quantity': item['quantity'],
-                'price': product.price
-            })
-        
-        # Create order
         order = Order(
             user_id=user_id,
-            total_amount=total_amount,
             shipping_address=shipping_address,
             status='pending'
         )
-        
+        for product_id, quantity in quantities.items():
+            _, price = taken[product_id]
+            total_amount += price * quantity
+            order.order_items.append(OrderItem(product_id=product_id, quantity=quantity, price=price))
+        order.total_amount = total_amount
+
         db.add(order)
-        db.flush()  # Get order_id without committing
-        
-        # Create order items and update stock
-        for item_data in order_items:
-            order_item = OrderItem(
-                order_id=order.order_id,
-                product_id=item_data['product_id'],
-                quantity=item_data['quantity'],
-                price=item_data['price']
-            )
-            db.add(order_item)
-            
-            # Update product stock
-            ProductService.update_stock(db, item_data['product_id'], -item_data['quantity'])
-        
-        db.commit()
-        db.refresh(order)
-        return order
+        try:
+            db.flush()
+            order_id = order.order_id
+            record_order_event(db, order, 'order.created', None, items=[
+                {'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()
+            ])
+            if before_commit is not None:
+                before_commit(order)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        for product_id in quantities:
+            ProductService.invalidate_cached_product(product_id)
+        # Reload for the response: the commit expired everything
+        return OrderService.get_order_by_id(db, order_id)
+
+    @staticmethod
+    def _explain_unavailable(db: Session, quantities: Dict[int, int], taken: Dict[int, tuple]) -> None:
+        """After a failed take_stock: None if a product doesn't exist, else ValueError saying why"""
+        missing = [product_id for product_id in quantities if product_id not in taken]
+        products = {
+            row.product_id: row
+            for row in db.query(Product.product_id, Product.name, Product.is_active, Product.stock_quantity)
+            .filter(Product.product_id.in_(missing))
+        }
+        for product_id in missing:
+            product = products.get(product_id)
+            if product is None:
+                return None
+            if not product.is_active:
+                raise ValueError(f"Product {product.name} is no longer available")
+            raise ValueError(f"Insufficient stock for product {product.name}")
+        raise ValueError("Some products are unavailable")
     
     @staticmethod
     def get_order_by_id(db: Session, order_id: int) -> Optional[Order]:
-        """Get order by ID"""
-        return db.query(Order).filter(Order.order_id == order_id).first()
+        """Get order by ID, with its items and their product summaries loaded (two queries)"""
+        return db.query(Order).options(*ORDER_EAGER_LOAD).filter(Order.order_id == order_id).first()
     
     @staticmethod
-    def get_user_orders(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[Order]:
-        """Get all orders for a user"""
-        return db.query(Order).filter(Order.user_id == user_id).offset(skip).limit(limit).all()
+    def get_order_version(db: Session, order_id: int) -> Optional[tuple]:
+        """
+        Cheap version probe for conditional GETs, without loading the order.
+        The version is the order's status and fulfilment dates plus the newest
+        updated_at among its products (the response embeds product data).
+        Returns None if the order does not exist.
+        """
+        row = (
+            db.query(Order.status, Order.shipped_date, Order.delivered_date, func.max(Product.updated_at))
+            .outerjoin(OrderItem, OrderItem.order_id == Order.order_id)
+            .outerjoin(Product, Product.product_id == OrderItem.product_id)
+            .filter(Order.order_id == order_id)
+            .group_by(Order.order_id)
+            .first()
+        )
+        return tuple(row) if row is not None else None
+
+    @staticmethod
+    def get_user_orders(db: Session, user_id: int, cursor: str = None, limit: int = 100,
+                        sort: str = None) -> Tuple[List, Optional[str]]:
+        """
+        Get a user's orders one keyset page at a time
+        Returns (rows, next_cursor); rows are Core rows of ORDER_LIST_COLUMNS (see encode_orders)
+        """
+        query = db.query(*ORDER_LIST_COLUMNS).filter(Order.user_id == user_id)
+        return paginate(query, get_sort(ORDER_SORTS, sort, DEFAULT_ORDER_SORT), cursor, limit)
     
     @staticmethod
-    def get_all_orders(db: Session, skip: int = 0, limit: int = 100) -> List[Order]:
-        """Get all orders with pagination"""
-        return db.query(Order).offset(skip).limit(limit).all()
+    def get_all_orders(db: Session, cursor: str = None, limit: int = 100,
+                       sort: str = None) -> Tuple[List, Optional[str]]:
+        """
+        Get all orders one keyset page at a time
+        Returns (rows, next_cursor); rows are Core rows of ORDER_LIST_COLUMNS (see encode_orders)
+        """
+        query = db.query(*ORDER_LIST_COLUMNS)
+        return paginate(query, get_sort(ORDER_SORTS, sort, DEFAULT_ORDER_SORT), cursor, limit)
+
+    @staticmethod
+    def encode_orders(db: Session, order_rows: List) -> str:
+        """
+        Encode a page of order rows as a JSON array, items included.
+        All items for the page (with their product summary) come from one query,
+        so a page costs two queries however many orders and items it holds.
+        """
+        items_by_order = {row.order_id: [] for row in order_rows}
+        if items_by_order:
+            item_rows = (
+                db.query(*ORDER_ITEM_COLUMNS, *ORDER_ITEM_PRODUCT_COLUMNS)
+                .outerjoin(Product, Product.product_id == OrderItem.product_id)
+                .filter(OrderItem.order_id.in_(list(items_by_order)))
+                .order_by(OrderItem.order_item_id)
+                .all()
+            )
+            split = len(ORDER_ITEM_COLUMNS)
+            for row in item_rows:
+                product = row[split:]
+                items_by_order[row.order_id].append(order_item_encoder.encode(
+                    row,
+                    product='null' if product[0] is None else order_item_product_encoder.encode(product),
+                ))
+
+        return '[' + ','.join([
+            order_list_encoder.encode(row, items='[' + ','.join(items_by_order[row.order_id]) + ']')
+            for row in order_rows
+        ]) + ']'
     
     @staticmethod
     def update_order_status(db: Session, order_id: int, status: str) -> Optional[Order]:
-        """Update order status"""
-        order = db.query(Order).filter(Order.order_id == order_id).first()
-        if not order:
+        """
+        Update one order's status: a one-entry bulk_update_status, so the same
+        ALLOWED_TRANSITIONS apply, shipped_date / delivered_date are stamped,
+        cancelling restores stock, and the outbox event commits with it.
+        Returns None if the order doesn't exist; raises ValueError for an
+        unknown status or a transition that isn't allowed.
+        """
+        try:
+            result = OrderService.bulk_update_status(db, [{'order_id': order_id, 'status': status}])[0]
+        except ValueError as e:
+            errors = getattr(e, 'errors', None)
+            raise ValueError(errors[0]['errors'][0] if errors else str(e))
+        if result['result'] == 'not_found':
             return None
-        
-        order.status = status
-        db.commit()
-        db.refresh(order)
-        return order
+        if result['result'] == 'rejected':
+            raise ValueError(result['error'])
+        return OrderService.get_order_by_id(db, order_id)
     
     @staticmethod
     def cancel_order(db: Session, order_id: int) -> bool:
         """Cancel an order and restore stock"""
-        order = db.query(Order).filter(Order.order_id == order_id).first()
+        # Lock the order row so two concurrent cancels can't both restore its stock
+        order = db.query(Order).filter(Order.order_id == order_id).with_for_update().first()
         if not order or order.status not in ['pending', 'processing']:
+            db.rollback()
             return False
         
-        # Restore stock
+        # Restore stock in the same transaction as the status change
+        quantities: Dict[int, int] = {}
         for item in order.order_items:
-            ProductService.update_stock(db, item.product_id, item.quantity)
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+        ProductService.restore_stock(db, quantities)
         
-        order.status = 'cancelled'
+        from_status, order.status = order.status, 'cancelled'
+        record_order_event(db, order, 'order.cancelled', from_status, items=[
+            {'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()
+        ])
         db.commit()
-        return True
\ No newline at end of file
+        for product_id in quantities:
+            ProductService.invalidate_cached_product(product_id)
+        return True
+
+    @staticmethod
+    def bulk_update_status(db: Session, updates: List[Dict]) -> List[Dict]:
+        """
+        Move many orders to new statuses at once, e.g. a fulfilment batch:
+            [{"order_id": 1, "status": "shipped"}, {"order_id": 2, "status": "cancelled"}, ...]
+
+        Orders are locked (in order_id order), each change is checked against
+        ALLOWED_TRANSITIONS, and the valid ones are applied with one UPDATE per
+        target status, which also stamps shipped_date / delivered_date.
+        Cancelled orders get their stock back in one aggregated UPDATE. Every
+        transition gets its outbox event, and everything commits together.
+
+        Raises ValueError (writing nothing) if the request itself is malformed,
+        with per-entry errors in .errors.
+        Returns one result per entry, in request order:
+            {"order_id", "result": "updated" | "unchanged" | "rejected" | "not_found",
+             "from_status", "to_status", "error"}
+        """
+        if len(updates) > MAX_BULK_STATUS_UPDATES:
+            raise ValueError(f"Too many updates: {len(updates)}. Send at most {MAX_BULK_STATUS_UPDATES} per request")
+        wanted: Dict[int, str] = {}
+        errors = []
+        for index, entry in enumerate(updates):
+            order_id = entry.get('order_id') if isinstance(entry, dict) else None
+            status = entry.get('status') if isinstance(entry, dict) else None
+            entry_errors = []
+            if not isinstance(order_id, int) or isinstance(order_id, bool):
+                entry_errors.append("order_id must be an integer")
+            elif order_id in wanted:
+                entry_errors.append(f"order {order_id} appears more than once")
+            if status not in ORDER_STATUSES:
+                entry_errors.append(f"status must be one of: {', '.join(ORDER_STATUSES)}")
+            if entry_errors:
+                errors.append({'index': index, 'errors': entry_errors})
+            else:
+                wanted[order_id] = status
+        if errors:
+            error = ValueError("Invalid updates")
+            error.errors = errors
+            raise error
+
+        try:
+            orders = {
+                row.order_id: row
+                for row in db.execute(
+                    select(Order.order_id, Order.user_id, Order.status, Order.total_amount, Order.order_date)
+                    .where(Order.order_id.in_(wanted))
+                    .order_by(Order.order_id)
+                    .with_for_update()
+                )
+            }
+            results = {}
+            by_target: Dict[str, List[int]] = {}
+            for order_id, status in wanted.items():
+                order = orders.get(order_id)
+                result = {'order_id': order_id, 'from_status': order.status if order else None, 'to_status': status}
+                if order is None:
+                    result['result'] = 'not_found'
+                elif order.status == status:
+                    result['result'] = 'unchanged'
+                elif status not in ALLOWED_TRANSITIONS.get(order.status, ()):
+                    result['result'] = 'rejected'
+                    result['error'] = f"cannot change status from {order.status} to {status}"
+                else:
+                    result['result'] = 'updated'
+                    by_target.setdefault(status, []).append(order_id)
+                results[order_id] = result
+
+            now = datetime.utcnow()
+            for status, order_ids in by_target.items():
+                db.execute(
+                    update(Order)
+                    .where(Order.order_id.in_(order_ids))
+                    .values(
+                        status=status,
+                        shipped_date=now if status == 'shipped' else Order.shipped_date,
+                        delivered_date=now if status == 'delivered' else Order.delivered_date,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+
+            # Cancellations: all their items in one query, stock back in one UPDATE
+            items_by_order: Dict[int, Dict[int, int]] = {}
+            restored: Dict[int, int] = {}
+            cancelled = by_target.get('cancelled', [])
+            if cancelled:
+                for order_id, product_id, quantity in db.execute(
+                    select(OrderItem.order_id, OrderItem.product_id, func.sum(OrderItem.quantity))
+                    .where(OrderItem.order_id.in_(cancelled))
+                    .group_by(OrderItem.order_id, OrderItem.product_id)
+                ):
+                    items_by_order.setdefault(order_id, {})[product_id] = int(quantity)
+                    restored[product_id] = restored.get(product_id, 0) + int(quantity)
+                ProductService.restore_stock(db, restored)
+
+            events = []
+            for status, order_ids in by_target.items():
+                for order_id in order_ids:
+                    order = orders[order_id]
+                    if status == 'cancelled':
+                        events.append(order_event_values(order, 'order.cancelled', order.status, status, items=[
+                            {'product_id': product_id, 'quantity': quantity}
+                            for product_id, quantity in items_by_order.get(order_id, {}).items()
+                        ]))
+                    else:
+                        events.append(order_event_values(order, 'order.status_changed', order.status, status))
+            if events:
+                db.execute(insert(OrderEvent), events)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        for product_id in restored:
+            ProductService.invalidate_cached_product(product_id)
+        return [results[order_id] for order_id in wanted]
\ No newline at end of file
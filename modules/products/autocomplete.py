@@ -0,0 +1,308 @@
+"""
+Typeahead autocomplete over product names, brands and category names
+
+How it works:
+- Every suggestion is indexed under the start of each of its words, so
+  "char" matches "Charizard Holo" and "holo" matches it too. The
+  (term, suggestion key) pairs live in one sorted list; a prefix lookup is
+  two bisects plus a scan of the matching slice.
+- Short prefixes ("c", "ch") match huge slices, so their top-K is memoized
+  when the index is built and kept exact as weights change.
+- Weights: a product is 1 + its trending popularity (product_popularity);
+  a brand or category weighs the sum of its active products.
+- The index is built on first use and then refreshed incrementally from
+  products whose updated_at moved (see IncrementalProductIndex), plus
+  popularity rows that changed since the previous refresh.
+"""
+import os
+import re
+import heapq
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple
+from sqlalchemy.orm import Session
+from modules.products.models import Product, TrinketCategory
+from modules.products.indexing import IncrementalProductIndex, WATERMARK_OVERLAP
+from modules.analytics.models import ProductPopularity
+
+MAX_SUGGESTIONS = 10
+# Terms are truncated to this many characters; longer queries match on it too
+MAX_TERM_LENGTH = 40
+# Only the first few words of a long product name are indexed
+MAX_WORDS = 6
+# Prefixes matching more terms than this get their top-K memoized
+MEMO_MIN_MATCHES = 256
+MEMO_MAX_PREFIX = 4
+MEMO_DEPTH = 2 * MAX_SUGGESTIONS
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text: str) -> str:
+    """Lowercase, and keep only letters/digits separated by single spaces"""
+    return ' '.join(_WORD_RE.findall((text or '').lower()))[:MAX_TERM_LENGTH]
+
+
+def _terms_for(text: str) -> List[str]:
+    """The suffixes of the normalized text that start at a word boundary"""
+    words = normalize(text).split(' ')[:MAX_WORDS]
+    terms = []
+    for i, word in enumerate(words):
+        if word:
+            terms.append(' '.join(words[i:])[:MAX_TERM_LENGTH])
+    return list(dict.fromkeys(terms))
+
+
+class _Suggestion:
+    __slots__ = ('kind', 'id', 'text', 'terms', 'weight', 'members')
+
+    def __init__(self, kind, id, text):
+        self.kind = kind
+        self.id = id
+        self.text = text
+        self.terms = _terms_for(text)
+        self.weight = 0.0
+        self.members = 0    # brands/categories: active products counted in weight
+
+    def to_dict(self):
+        return {'type': self.kind, 'id': self.id, 'text': self.text}
+
+
+class AutocompleteIndex(IncrementalProductIndex):
+    columns = [
+        Product.product_id, Product.updated_at, Product.is_active,
+        Product.name, Product.brand, Product.category_id,
+    ]
+    refresh_interval = float(os.getenv('AUTOCOMPLETE_REFRESH_SECONDS', 30))
+
+    def __init__(self):
+        super().__init__()
+        self._reset()
+
+    def _reset(self):
+        self._terms: List[Tuple[str, tuple]] = []           # sorted (term, key)
+        self._entries: Dict[tuple, _Suggestion] = {}         # key -> suggestion
+        self._products: Dict[int, tuple] = {}                # product_id -> (brand key, category_id, weight)
+        self._popularity: Dict[int, float] = {}
+        self._popularity_watermark: Optional[datetime] = None
+        self._category_names: Dict[int, str] = {}
+        self._memo: Dict[str, List[tuple]] = {}
+        self._pending: List[Tuple[str, tuple]] = []          # terms to add during the initial build
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def suggest(self, query: str, limit: int = MAX_SUGGESTIONS) -> List[dict]:
+        """Top suggestions whose words start with the query, most popular first"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        with self._lock:
+            keys = self._memo.get(prefix)
+            if keys is None:
+                lo = bisect_left(self._terms, (prefix,))
+                hi = bisect_left(self._terms, (prefix + '\x7f',), lo)
+                keys = self._top_keys(lo, hi)
+                if hi - lo >= MEMO_MIN_MATCHES and len(prefix) <= MEMO_MAX_PREFIX:
+                    self._memo[prefix] = keys
+            return [self._entries[key].to_dict() for key in keys[:limit]]
+
+    def _rank(self, key: tuple, weight: Optional[float] = None) -> tuple:
+        if weight is None:
+            weight = self._entries[key].weight
+        return (weight, key[0] == 'product')
+
+    def _top_keys(self, lo: int, hi: int) -> List[tuple]:
+        # One suggestion can match through several of its words; count it once
+        keys = {key for _, key in self._terms[lo:hi]}
+        return heapq.nlargest(MEMO_DEPTH, keys, key=self._rank)
+
+    def _warm_memo(self):
+        """Memoize every short prefix that matches many terms (after a full build)"""
+        self._memo.clear()
+        terms = self._terms
+        for n in range(1, MEMO_MAX_PREFIX + 1):
+            lo = 0
+            while lo < len(terms):
+                prefix = terms[lo][0][:n]
+                hi = bisect_left(terms, (prefix + '\x7f',), lo)
+                if hi - lo >= MEMO_MIN_MATCHES and len(prefix) == n:
+                    self._memo[prefix] = self._top_keys(lo, hi)
+                lo = hi
+
+    # ------------------------------------------------------------------
+    # Maintenance (always under self._lock)
+    # ------------------------------------------------------------------
+
+    def _update_memo(self, entry: _Suggestion, key: tuple, old_weight: Optional[float], removed: bool = False):
+        """
+        Keep memoized top lists exact without rescanning. Each list holds the
+        best MEMO_DEPTH matches, and every match outside it ranks no higher
+        than the list's last element.
+        """
+        if not self._memo:
+            return
+        seen = set()
+        for term in entry.terms:
+            for n in range(1, min(len(term), MEMO_MAX_PREFIX) + 1):
+                prefix = term[:n]
+                keys = self._memo.get(prefix)
+                if keys is None or prefix in seen:
+                    continue
+                seen.add(prefix)
+                last = keys[-1]
+                floor = self._rank(last, old_weight if last == key else None)
+                if key in keys:
+                    if removed or self._rank(key) < floor:
+                        keys.remove(key)    # drops to (at most) the outside matches' rank
+                    else:
+                        keys.sort(key=self._rank, reverse=True)
+                elif not removed and self._rank(key) > floor:
+                    keys.append(key)
+                    keys.sort(key=self._rank, reverse=True)
+                    del keys[MEMO_DEPTH:]
+                if len(keys) < MAX_SUGGESTIONS:
+                    del self._memo[prefix]  # too few known-best left; rescan on next use
+
+    def _add_entry(self, key: tuple, text: str, weight: float, initial: bool) -> _Suggestion:
+        entry = _Suggestion(key[0], key[1], text)
+        entry.weight = weight
+        self._entries[key] = entry
+        for term in entry.terms:
+            if initial:
+                self._pending.append((term, key))
+            else:
+                insort(self._terms, (term, key))
+        self._update_memo(entry, key, None)
+        return entry
+
+    def _remove_entry(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        for term in entry.terms:
+            i = bisect_left(self._terms, (term, key))
+            if i < len(self._terms) and self._terms[i] == (term, key):
+                del self._terms[i]
+        self._update_memo(entry, key, entry.weight, removed=True)
+        del self._entries[key]
+
+    def _set_weight(self, key: tuple, weight: float):
+        entry = self._entries[key]
+        old_weight, entry.weight = entry.weight, weight
+        self._update_memo(entry, key, old_weight)
+
+    def _adjust_group(self, key: tuple, text: Optional[str], delta: float, members: int, initial: bool):
+        """Add a product's weight to (or remove it from) its brand or category suggestion"""
+        entry = self._entries.get(key)
+        if entry is None:
+            if members < 0 or not text:
+                return
+            entry = self._add_entry(key, text, 0.0, initial)
+        entry.members += members
+        if entry.members <= 0:
+            self._remove_entry(key)
+        else:
+            self._set_weight(key, entry.weight + delta)
+
+    def _unlink_product(self, product_id: int):
+        old = self._products.pop(product_id, None)
+        if old is None:
+            return
+        brand_key, category_id, weight = old
+        self._remove_entry(('product', product_id))
+        if brand_key is not None:
+            self._adjust_group(('brand', brand_key), None, -weight, -1, False)
+        if category_id is not None:
+            self._adjust_group(('category', category_id), None, -weight, -1, False)
+
+    def _link_product(self, product_id, name, brand, category_id, initial: bool):
+        weight = 1.0 + self._popularity.get(product_id, 0.0)
+        brand_key = normalize(brand) or None
+        self._products[product_id] = (brand_key, category_id, weight)
+        self._add_entry(('product', product_id), name, weight, initial)
+        if brand_key is not None:
+            self._adjust_group(('brand', brand_key), brand.strip(), weight, 1, initial)
+        if category_id is not None:
+            self._adjust_group(('category', category_id), self._category_names.get(category_id),
+                               weight, 1, initial)
+
+    def _apply_rows(self, rows, initial: bool):
+        for row in rows:
+            if not initial:
+                self._unlink_product(row.product_id)
+            if row.is_active:
+                self._link_product(row.product_id, row.name, row.brand, row.category_id, initial)
+        self.product_count = len(self._products)
+
+    def _finish_refresh(self, initial: bool):
+        if initial and self._pending:
+            self._terms.extend(self._pending)
+            self._terms.sort()
+            self._pending = []
+            self._warm_memo()
+
+    def refresh(self, db: Session, full: bool = False) -> int:
+        with self._lock:
+            if full:
+                # Start over, popularity and category names included
+                self._reset()
+                self._watermark = None
+                self._last_refresh = None
+            if not self.is_built:
+                # Category names and popularity are needed before the first products go in
+                self._load_categories(db)
+                self._load_popularity(db, initial=True)
+                return super().refresh(db)
+            count = super().refresh(db)
+            self._load_categories(db)
+            self._load_popularity(db, initial=False)
+            return count
+
+    def _load_categories(self, db: Session):
+        names = dict(db.query(TrinketCategory.category_id, TrinketCategory.name).all())
+        for category_id, name in names.items():
+            key = ('category', category_id)
+            entry = self._entries.get(key)
+            if entry is not None and entry.text != name:
+                # Renamed: re-index under the new name, keeping its weight
+                weight, members = entry.weight, entry.members
+                self._remove_entry(key)
+                self._add_entry(key, name, weight, False).members = members
+        self._category_names = names
+
+    def _load_popularity(self, db: Session, initial: bool):
+        query = db.query(ProductPopularity.product_id, ProductPopularity.score, ProductPopularity.updated_at)
+        if self._popularity_watermark is not None:
+            query = query.filter(ProductPopularity.updated_at > self._popularity_watermark - WATERMARK_OVERLAP)
+        for product_id, score, updated_at in query.yield_per(10_000):
+            self._popularity[product_id] = score or 0.0
+            if updated_at is not None and (self._popularity_watermark is None or updated_at > self._popularity_watermark):
+                self._popularity_watermark = updated_at
+            if initial or product_id not in self._products:
+                continue
+            brand_key, category_id, old_weight = self._products[product_id]
+            weight = 1.0 + (score or 0.0)
+            if weight == old_weight:
+                continue
+            self._products[product_id] = (brand_key, category_id, weight)
+            self._set_weight(('product', product_id), weight)
+            if brand_key is not None:
+                self._adjust_group(('brand', brand_key), None, weight - old_weight, 0, False)
+            if category_id is not None:
+                self._adjust_group(('category', category_id), None, weight - old_weight, 0, False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'products': len(self._products),
+                'suggestions': len(self._entries),
+                'terms': len(self._terms),
+                'memoized_prefixes': len(self._memo),
+                'watermark': self._watermark.isoformat() if self._watermark else None,
+            }
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,113 @@
+"""
+Category tree cache
+
+trinket_categories is self-referencing (parent_category_id), and it is small
+and rarely changes, so the whole tree is loaded in one query and kept in
+memory with its closure precomputed: every category maps to the ids of its
+entire subtree. Filtering on "Trading Cards" then becomes one
+`category_id IN (1, 11, 12, 13)` predicate instead of a recursive query.
+
+The tree is reloaded after CATEGORY_TREE_TTL seconds, or right away after
+CategoryService.invalidate() (call it after writing to trinket_categories).
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from modules.products.models import TrinketCategory
+from modules.common.cache import TTLCache
+
+CATEGORY_TREE_TTL = float(os.getenv('CATEGORY_TREE_TTL', 300))
+_TREE_KEY = 'tree'
+
+category_tree_cache = TTLCache(maxsize=1, ttl=CATEGORY_TREE_TTL)
+
+
+class CategoryTree:
+    """Immutable snapshot of trinket_categories with the closure precomputed"""
+
+    def __init__(self, rows):
+        self.categories: Dict[int, dict] = {}
+        self.children: Dict[Optional[int], List[int]] = {}
+        for row in rows:
+            self.categories[row.category_id] = {
+                'category_id':        row.category_id,
+                'name':               row.name,
+                'parent_category_id': row.parent_category_id,
+            }
+        for category_id, category in self.categories.items():
+            parent_id = category['parent_category_id']
+            if parent_id not in self.categories:
+                parent_id = None   # dangling parent: treat as top-level
+            self.children.setdefault(parent_id, []).append(category_id)
+        for ids in self.children.values():
+            ids.sort(key=lambda cid: self.categories[cid]['name'])
+
+        # Closure: category -> sorted ids of itself and every descendant.
+        # Walk from each root; ids never reached sit on a parent cycle.
+        self._subtrees: Dict[int, Tuple[int, ...]] = {}
+        for root_id in self.children.get(None, []):
+            self._collect(root_id)
+        for category_id in self.categories:
+            if category_id not in self._subtrees:
+                self._subtrees[category_id] = (category_id,)
+
+    def _collect(self, root_id: int):
+        # Iterative post-order walk, so deep trees can't hit the recursion limit
+        stack = [(root_id, False)]
+        while stack:
+            category_id, expanded = stack.pop()
+            kids = self.children.get(category_id, [])
+            if not expanded:
+                stack.append((category_id, True))
+                stack.extend((kid, False) for kid in kids if kid not in self._subtrees)
+                continue
+            ids = {category_id}
+            for kid in kids:
+                ids.update(self._subtrees.get(kid, ()))
+            self._subtrees[category_id] = tuple(sorted(ids))
+
+    def subtree_ids(self, category_id: int) -> Tuple[int, ...]:
+        """The category and all its descendants (just the id itself if unknown)"""
+        return self._subtrees.get(category_id, (category_id,))
+
+    def ancestors(self, category_id: int) -> List[int]:
+        """Parent, grandparent, ... up to the top-level category"""
+        chain = []
+        parent_id = self.categories.get(category_id, {}).get('parent_category_id')
+        while parent_id in self.categories and parent_id not in chain and parent_id != category_id:
+            chain.append(parent_id)
+            parent_id = self.categories[parent_id]['parent_category_id']
+        return chain
+
+    def to_nested(self, parent_id: Optional[int] = None) -> List[dict]:
+        """[{category_id, name, parent_category_id, children: [...]}] sorted by name"""
+        return [
+            {**self.categories[cid], 'children': self.to_nested(cid)}
+            for cid in self.children.get(parent_id, [])
+        ]
+
+
+class CategoryService:
+
+    @staticmethod
+    def get_tree(db: Session) -> CategoryTree:
+        """The cached tree, reloaded (one query) when expired or invalidated"""
+        tree = category_tree_cache.get(_TREE_KEY)
+        if tree is None:
+            rows = db.query(
+                TrinketCategory.category_id,
+                TrinketCategory.name,
+                TrinketCategory.parent_category_id,
+            ).all()
+            tree = CategoryTree(rows)
+            category_tree_cache.set(_TREE_KEY, tree)
+        return tree
+
+    @staticmethod
+    def invalidate():
+        """Drop the cached tree so the next read reloads it"""
+        category_tree_cache.clear()
+
+    @staticmethod
+    def subtree_ids(db: Session, category_id: int) -> Tuple[int, ...]:
+        return CategoryService.get_tree(db).subtree_ids(category_id)
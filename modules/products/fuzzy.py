@@ -0,0 +1,192 @@
+"""
+Typo-tolerant product name matching ("Charzard" -> "Charizard")
+
+With the pg_trgm extension installed, fuzzy search runs in Postgres against
+the GiST trigram index idx_products_name_trgm (see schema_update_w3.sql).
+Without it, TrigramIndex below gives the same behaviour in-process:
+
+- Names are split into words; each distinct word is indexed by its trigrams
+  (padded like pg_trgm: "  c", " ch", "cha", ...), so the trigram postings
+  cover the vocabulary, not every product.
+- A query word is compared with every vocabulary word sharing a trigram;
+  similarity = shared / (trigrams(a) + trigrams(b) - shared).
+- A product's score is the mean, over query words, of its best-matching
+  word's similarity. Candidates are taken from the most similar (then
+  rarest) words first and capped, so latency does not grow with the catalog.
+"""
+import os
+import re
+import math
+import heapq
+from itertools import islice
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from modules.products.models import Product
+from modules.products.indexing import IncrementalProductIndex
+
+SIMILARITY_THRESHOLD = float(os.getenv('FUZZY_SIMILARITY_THRESHOLD', 0.4))
+MAX_QUERY_WORDS = 5
+MAX_CANDIDATES = 1000
+MIN_QUERY_LENGTH = 3
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_has_pg_trgm: Optional[bool] = None
+
+
+def trigram_extension_available(db: Session) -> bool:
+    """Whether pg_trgm is installed (checked once per process)"""
+    global _has_pg_trgm
+    if _has_pg_trgm is None:
+        _has_pg_trgm = db.execute(
+            text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+        ).scalar()
+    return _has_pg_trgm
+
+
+def words_of(value: str) -> List[str]:
+    return _WORD_RE.findall((value or '').lower())
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex(IncrementalProductIndex):
+    columns = [Product.product_id, Product.updated_at, Product.is_active, Product.name]
+    refresh_interval = float(os.getenv('FUZZY_INDEX_REFRESH_SECONDS', 30))
+
+    def __init__(self):
+        super().__init__()
+        self._reset()
+
+    def _reset(self):
+        self._word_ids: Dict[str, int] = {}
+        self._words: List[Optional[str]] = []               # word id -> word (None once unused)
+        self._free_ids: List[int] = []
+        self._word_trigram_counts: List[int] = []
+        self._postings: Dict[str, Set[int]] = defaultdict(set)   # trigram -> word ids
+        self._word_products: Dict[int, Set[int]] = {}            # word id -> product ids
+        self._product_words: Dict[int, Tuple[int, ...]] = {}     # product id -> word ids
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _similar_words(self, word: str) -> Dict[int, float]:
+        # A word reaching the threshold shares at least ceil(threshold * n) of
+        # the query's n trigrams, so it must appear in one of the n - that + 1
+        # rarest postings. Only those are scanned; common trigrams ("  s")
+        # are then just membership checks for the candidates found.
+        grams = trigrams(word)
+        postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+        probe = len(grams) - math.ceil(SIMILARITY_THRESHOLD * len(grams)) + 1
+        shared: Dict[int, int] = defaultdict(int)
+        for posting in postings[:probe]:
+            for word_id in posting:
+                shared[word_id] += 1
+        for posting in postings[probe:]:
+            for word_id in shared:
+                if word_id in posting:
+                    shared[word_id] += 1
+        matches = {}
+        for word_id, count in shared.items():
+            similarity = count / (len(grams) + self._word_trigram_counts[word_id] - count)
+            if similarity >= SIMILARITY_THRESHOLD:
+                matches[word_id] = similarity
+        return matches
+
+    def search(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        """[(product_id, similarity)] best first, at most `limit` of them"""
+        query_words = [w for w in words_of(query) if len(w) >= 2][:MAX_QUERY_WORDS]
+        if not query_words or limit < 1:
+            return []
+        with self._lock:
+            per_word = [self._similar_words(w) for w in query_words]
+
+            # Gather candidates from the most similar vocabulary words first,
+            # rarest first among equals (they discriminate best)
+            ranked_words = sorted(
+                (-sim, len(self._word_products[word_id]), word_id)
+                for matches in per_word for word_id, sim in matches.items()
+            )
+            candidates: Set[int] = set()
+            for _, _, word_id in ranked_words:
+                room = MAX_CANDIDATES - len(candidates)
+                if room <= 0:
+                    break
+                candidates.update(islice(self._word_products[word_id], room))
+
+            scored = []
+            for product_id in candidates:
+                word_ids = self._product_words[product_id]
+                total = 0.0
+                for matches in per_word:
+                    total += max([matches.get(w, 0.0) for w in word_ids], default=0.0)
+                scored.append((total / len(per_word), -product_id))
+            return [(-neg_id, round(sim, 4)) for sim, neg_id in heapq.nlargest(limit, scored)]
+
+    # ------------------------------------------------------------------
+    # Maintenance (always under self._lock)
+    # ------------------------------------------------------------------
+
+    def _word_id(self, word: str) -> int:
+        word_id = self._word_ids.get(word)
+        if word_id is not None:
+            return word_id
+        grams = trigrams(word)
+        if self._free_ids:
+            word_id = self._free_ids.pop()
+            self._words[word_id] = word
+            self._word_trigram_counts[word_id] = len(grams)
+        else:
+            word_id = len(self._words)
+            self._words.append(word)
+            self._word_trigram_counts.append(len(grams))
+        self._word_ids[word] = word_id
+        self._word_products[word_id] = set()
+        for gram in grams:
+            self._postings[gram].add(word_id)
+        return word_id
+
+    def _drop_word(self, word_id: int):
+        word = self._words[word_id]
+        for gram in trigrams(word):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(word_id)
+                if not postings:
+                    del self._postings[gram]
+        del self._word_ids[word]
+        del self._word_products[word_id]
+        self._words[word_id] = None
+        self._free_ids.append(word_id)
+
+    def _apply_rows(self, rows, initial: bool):
+        for row in rows:
+            old = self._product_words.pop(row.product_id, ())
+            for word_id in old:
+                products = self._word_products[word_id]
+                products.discard(row.product_id)
+                if not products:
+                    self._drop_word(word_id)
+            if row.is_active:
+                word_ids = tuple({self._word_id(w) for w in words_of(row.name)})
+                self._product_words[row.product_id] = word_ids
+                for word_id in word_ids:
+                    self._word_products[word_id].add(row.product_id)
+        self.product_count = len(self._product_words)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'products': len(self._product_words),
+                'words': len(self._word_ids),
+                'trigrams': len(self._postings),
+                'watermark': self._watermark.isoformat() if self._watermark else None,
+            }
+
+
+trigram_index = TrigramIndex()
@@ -0,0 +1,97 @@
+"""
+Base class for in-memory indexes over the product catalog.
+
+Indexes (autocomplete, fuzzy matching, ...) are built once from the products
+table and then kept current incrementally: every refresh only reads rows whose
+updated_at moved past the index's watermark (served by idx_products_updated_id).
+Each index lives in the worker process that built it.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy.orm import Session
+from modules.products.models import Product
+
+# Re-read this much before the watermark on every refresh, so rows from
+# transactions that committed slightly out of updated_at order are not missed.
+# Applying a row twice is harmless: _apply_rows replaces a product's entries.
+WATERMARK_OVERLAP = timedelta(seconds=5)
+REFRESH_CHUNK_SIZE = 5000
+
+
+class IncrementalProductIndex:
+    """
+    Subclasses set `columns` (must include product_id, updated_at and is_active)
+    and implement _apply_rows(rows, initial).
+    """
+    columns = [Product.product_id, Product.updated_at, Product.is_active]
+    refresh_interval = 30.0   # seconds between checks for changed products
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._watermark: Optional[datetime] = None
+        self._last_refresh = None   # time.monotonic() of the last refresh
+        self.product_count = 0
+
+    @property
+    def is_built(self) -> bool:
+        return self._watermark is not None or self._last_refresh is not None
+
+    def ensure_fresh(self, db: Session):
+        """Refresh if the last refresh is older than refresh_interval (cheap to call per request)"""
+        if self._last_refresh is not None and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        if self.is_built:
+            # Another request is already refreshing: keep serving the current index
+            if not self._lock.acquire(blocking=False):
+                return
+        else:
+            self._lock.acquire()
+        try:
+            if self._last_refresh is not None and time.monotonic() - self._last_refresh < self.refresh_interval:
+                return   # another thread refreshed while we waited
+            self.refresh(db)
+        finally:
+            self._lock.release()
+
+    def refresh(self, db: Session, full: bool = False) -> int:
+        """
+        Fold products changed since the watermark into the index; returns rows read.
+        full=True rebuilds from every active product (calls _reset() first).
+        """
+        with self._lock:
+            if full:
+                self._reset()
+                self._watermark = None
+            initial = full or not self.is_built
+            query = db.query(*self.columns)
+            if initial:
+                # (Re)build: inactive products never need to be indexed
+                query = query.filter(Product.is_active == True)
+            elif self._watermark is not None:
+                query = query.filter(Product.updated_at > self._watermark - WATERMARK_OVERLAP)
+            result = db.execute(
+                query.order_by(Product.updated_at, Product.product_id).statement
+                .execution_options(yield_per=REFRESH_CHUNK_SIZE)
+            )
+            count = 0
+            for chunk in result.partitions():
+                self._apply_rows(chunk, initial)
+                for row in chunk:
+                    if row.updated_at is not None and (self._watermark is None or row.updated_at > self._watermark):
+                        self._watermark = row.updated_at
+                count += len(chunk)
+            self._finish_refresh(initial)
+            self._last_refresh = time.monotonic()
+            return count
+
+    def _apply_rows(self, rows, initial: bool):
+        raise NotImplementedError
+
+    def _reset(self):
+        """Forget everything indexed so far (needed for refresh(full=True))"""
+        raise NotImplementedError
+
+    def _finish_refresh(self, initial: bool):
+        """Hook called once after all changed rows were applied"""
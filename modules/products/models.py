@@ -1,8 +1,10 @@
 """
 Product model and schemas
 """
-from sqlalchemy import Column, Integer, String, Numeric, Text, Boolean, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Numeric, Text, Boolean, DateTime, Computed, Index, CheckConstraint, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred, column_property
+from sqlalchemy import func
 from datetime import datetime
 from config.database import Base
 from sqlalchemy import ForeignKey
@@ -10,8 +12,36 @@ from sqlalchemy import ForeignKey
 VALID_CONDITIONS = ['mint', 'near_mint', 'excellent', 'good', 'fair', 'poor']
 VALID_RARITIES   = ['common', 'uncommon', 'rare', 'ultra_rare']
 
+# Price bands for the storefront filter sidebar: (label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = [
+    ('under_25',   0,    25),
+    ('25_100',     25,   100),
+    ('100_500',    100,  500),
+    ('500_1000',   500,  1000),
+    ('1000_plus',  1000, None),
+]
+
+# Weighted full-text document: name (A) ranks above brand (B) above description (C).
+# Kept in sync by Postgres as a generated column, so writes never have to touch it.
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(brand, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+)
+
 class Product(Base):
     __tablename__ = 'products'
+    __table_args__ = (
+        Index('idx_products_search_vector', 'search_vector', postgresql_using='gin'),
+        # Keyset pagination: one (sort column, product_id) index per listing order
+        Index('idx_products_active_created', 'created_at', 'product_id', postgresql_where=text('is_active')),
+        Index('idx_products_active_price', 'price', 'product_id', postgresql_where=text('is_active')),
+        # Incremental catalog export (updated_since)
+        Index('idx_products_updated_id', 'updated_at', 'product_id'),
+        # idx_products_name_trgm (fuzzy search) needs pg_trgm, so it lives only in schema_update_w3.sql
+        # Held units must exist: backstop for every write path that sets stock
+        CheckConstraint('stock_quantity >= reserved_quantity', name='ck_products_stock_covers_reserved'),
+    )
     product_id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
     category_id = Column(Integer, ForeignKey("trinket_categories.category_id"), nullable=True)
@@ -19,6 +49,9 @@ class Product(Base):
     description = Column(Text)
     brand = Column(String(100))
     stock_quantity = Column(Integer, default=1)  # Usually 1 for trinkets
+    # Units held by active stock_reservations (see modules/products/reservations.py)
+    reserved_quantity = Column(Integer, nullable=False, default=0, server_default=text('0'))
+    available_quantity = column_property(func.greatest(stock_quantity - reserved_quantity, 0))
     image_url = Column(String(500))
     
     condition = Column(String(50))  # "mint", "used", "vintage", "damaged"
@@ -29,7 +62,7 @@ class Product(Base):
     rarity = Column(String(50))  # "common", "uncommon", "rare"
     authenticity_verified = Column(Boolean, default=False)  # For collectibles
 
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
 
@@ -39,6 +72,8 @@ class Product(Base):
     market_average = Column(Numeric(10, 2))
     last_market_check = Column(DateTime)
 
+    # Full-text search (deferred so normal loads don't drag the tsvector along)
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True)))
     
     
     # Relationships
@@ -53,10 +88,11 @@ class Product(Base):
             'product_id':    self.product_id,
             'name':          self.name,
             'category_id': self.category_id,
-            'price':         float(self.price) if self.price else None,
+            'price':         float(self.price) if self.price is not None else None,
             'description':   self.description,
             'brand':         self.brand,
             'stock_quantity': self.stock_quantity,
+            'available_quantity': self.available_quantity,
             'image_url':     self.image_url,
             'created_at':    self.created_at.isoformat() if self.created_at else None,
             'is_active':     self.is_active,
@@ -70,13 +106,19 @@ class Product(Base):
             'authenticity_verified':  self.authenticity_verified,
 
             # New: price intelligence (Week 2 will populate these)
-            'suggested_price':    float(self.suggested_price) if self.suggested_price else None,
+            'suggested_price':    float(self.suggested_price) if self.suggested_price is not None else None,
             'price_confidence':   self.price_confidence,
-            'market_average':     float(self.market_average) if self.market_average else None,
+            'market_average':     float(self.market_average) if self.market_average is not None else None,
             'last_market_check':  self.last_market_check.isoformat() if self.last_market_check else None,
         }
 
-    
+    # The product fields an order view shows (see Product.to_summary_dict)
+    SUMMARY_FIELDS = ('product_id', 'name', 'image_url', 'condition', 'rarity')
+
+    def to_summary_dict(self):
+        """Compact form embedded in order items"""
+        return {field: getattr(self, field) for field in self.SUMMARY_FIELDS}
+
 
     def __repr__(self):
         return (
@@ -84,4 +126,65 @@ class Product(Base):
             f"name='{self.name}', "
             f"condition='{self.condition}', "
             f"price={self.price})>"
-        )
\ No newline at end of file
+        )
+
+
+class TrinketCategory(Base):
+    """
+    Category tree: parent_category_id = NULL for top-level categories,
+    e.g. "Trading Cards" -> "Pokemon Cards"
+    """
+    __tablename__ = 'trinket_categories'
+
+    category_id = Column(Integer, primary_key=True)
+    name = Column(String(100), unique=True, nullable=False)
+    parent_category_id = Column(Integer, ForeignKey("trinket_categories.category_id"), nullable=True)
+    description = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'category_id':        self.category_id,
+            'name':               self.name,
+            'parent_category_id': self.parent_category_id,
+            'description':        self.description,
+            'created_at':         self.created_at.isoformat() if self.created_at else None,
+        }
+
+    def __repr__(self):
+        return f"<TrinketCategory(id={self.category_id}, name='{self.name}', parent={self.parent_category_id})>"
+
+
+class StockReservation(Base):
+    """
+    A time-limited hold on stock while a buyer pays. Held units are counted
+    in products.reserved_quantity; the row is deleted when the hold is
+    released, expires (sweeper) or becomes an order.
+    """
+    __tablename__ = 'stock_reservations'
+    __table_args__ = (
+        Index('idx_stock_reservations_expires', 'expires_at'),
+        Index('idx_stock_reservations_user', 'user_id'),
+    )
+
+    reservation_id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.product_id', ondelete='CASCADE'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'reservation_id': self.reservation_id,
+            'product_id':     self.product_id,
+            'user_id':        self.user_id,
+            'quantity':       self.quantity,
+            'created_at':     self.created_at.isoformat() if self.created_at else None,
+            'expires_at':     self.expires_at.isoformat() if self.expires_at else None,
+        }
+
+    def __repr__(self):
+        return f"<StockReservation(id={self.reservation_id}, product_id={self.product_id}, quantity={self.quantity})>"
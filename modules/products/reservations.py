@@ -0,0 +1,147 @@
+"""
+Time-limited stock reservations ("soft holds")
+
+A buyer can hold units of a product for a few minutes while paying. Held
+units are counted in products.reserved_quantity, so availability is just
+stock_quantity - reserved_quantity on the product row (no join, no sum over
+reservations), and take_stock won't sell held units to anyone else.
+
+A hold ends one of three ways, each one transaction that deletes the
+reservation row and moves the counter:
+- release():   the buyer gives it back
+- sweep_expired(): expired holds are deleted in batches; rows another
+  transaction is converting or releasing are skipped (SKIP LOCKED)
+- claim_for_order(): OrderService.create_order_from_reservations turns the
+  holds into an order, taking the stock in the same transaction
+
+Checkout doesn't wait for the sweeper: when take_stock or hold_stock comes up
+short, ProductService.release_expired_holds frees that product's expired
+holds in the same transaction and tries again. The sweeper only keeps the
+available counts shown in listings accurate for products nobody is buying.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session
+from modules.products.models import Product, StockReservation
+from modules.products.services import ProductService
+
+RESERVATION_MINUTES = float(os.getenv('RESERVATION_MINUTES', 15))
+MAX_RESERVATION_MINUTES = 60
+SWEEP_BATCH_SIZE = 1000
+
+
+def _sum_by_product(rows) -> Dict[int, int]:
+    quantities = defaultdict(int)
+    for product_id, quantity in rows:
+        quantities[product_id] += quantity
+    return dict(quantities)
+
+
+class ReservationService:
+
+    @staticmethod
+    def reserve(db: Session, user_id: int, product_id: int, quantity: int = 1,
+                minutes: float = None) -> Optional[StockReservation]:
+        """
+        Hold `quantity` units of a product for `minutes` (default RESERVATION_MINUTES).
+        Returns None if the product doesn't exist; raises ValueError (and holds
+        nothing) if it is inactive or doesn't have that many units available.
+        """
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1:
+            raise ValueError("quantity must be a positive integer")
+        minutes = RESERVATION_MINUTES if minutes is None else minutes
+        if not 0 < minutes <= MAX_RESERVATION_MINUTES:
+            raise ValueError(f"minutes must be between 0 and {MAX_RESERVATION_MINUTES}")
+
+        if not ProductService.hold_stock(db, product_id, quantity):
+            db.rollback()
+            product = db.query(Product.is_active).filter(Product.product_id == product_id).first()
+            if product is None:
+                return None
+            if not product.is_active:
+                raise ValueError(f"Product {product_id} is no longer available")
+            raise ValueError(f"Not enough stock available to reserve product {product_id}")
+
+        now = datetime.utcnow()
+        reservation = StockReservation(
+            product_id=product_id,
+            user_id=user_id,
+            quantity=quantity,
+            created_at=now,
+            expires_at=now + timedelta(minutes=minutes),
+        )
+        db.add(reservation)
+        try:
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        db.refresh(reservation)
+        ProductService.invalidate_cached_product(product_id)
+        return reservation
+
+    @staticmethod
+    def release(db: Session, reservation_id: int, user_id: int = None) -> bool:
+        """Give a hold back early. False if it doesn't exist (or already expired and was swept)"""
+        stmt = delete(StockReservation).where(StockReservation.reservation_id == reservation_id)
+        if user_id is not None:
+            stmt = stmt.where(StockReservation.user_id == user_id)
+        row = db.execute(stmt.returning(StockReservation.product_id, StockReservation.quantity)).first()
+        if row is None:
+            db.rollback()
+            return False
+        ProductService.release_held_stock(db, {row.product_id: row.quantity})
+        db.commit()
+        ProductService.invalidate_cached_product(row.product_id)
+        return True
+
+    @staticmethod
+    def claim_for_order(db: Session, user_id: int, reservation_ids: Iterable[int]) -> Optional[Dict[int, int]]:
+        """
+        Delete the user's unexpired reservations, returning {product_id: quantity}
+        to take with ProductService.take_stock(..., reserved=True).
+        Does not commit. Returns None (and deletes nothing once the caller rolls
+        back) unless every one of the reservations is still live.
+        """
+        reservation_ids = set(reservation_ids)
+        rows = db.execute(
+            delete(StockReservation)
+            .where(
+                StockReservation.reservation_id.in_(reservation_ids),
+                StockReservation.user_id == user_id,
+                StockReservation.expires_at > datetime.utcnow(),
+            )
+            .returning(StockReservation.product_id, StockReservation.quantity)
+        ).all()
+        if len(rows) != len(reservation_ids):
+            return None
+        return _sum_by_product(rows)
+
+    @staticmethod
+    def sweep_expired(db: Session, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+        """Release expired holds in batches, one transaction each; returns holds released"""
+        total = 0
+        while True:
+            expired = (
+                select(StockReservation.reservation_id)
+                .where(StockReservation.expires_at <= datetime.utcnow())
+                .order_by(StockReservation.expires_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            rows = db.execute(
+                delete(StockReservation)
+                .where(StockReservation.reservation_id.in_(expired))
+                .returning(StockReservation.product_id, StockReservation.quantity)
+            ).all()
+            quantities = _sum_by_product(rows)
+            ProductService.release_held_stock(db, quantities)
+            db.commit()
+            for product_id in quantities:
+                ProductService.invalidate_cached_product(product_id)
+            total += len(rows)
+            if len(rows) < batch_size:
+                return total
@@ -1,6 +1,19 @@
-from flask import Blueprint, request, jsonify
-from modules.products.services import ProductService, VALID_CONDITIONS, VALID_RARITIES
-from config import SessionLocal
+from flask import Blueprint, request, jsonify, Response
+from modules.products.services import (
+    ProductService, VALID_CONDITIONS, VALID_RARITIES, product_cache, facet_cache,
+    product_list_encoder, product_export_encoder,
+)
+from modules.common.streaming import iter_records, detect_format, gzip_chunks
+from modules.common.serialization import json_page_response, dumps
+from modules.common.http_cache import make_etag, list_etag, is_not_modified, not_modified, with_validators
+from modules.analytics.trending import TrendingService
+from modules.products.autocomplete import autocomplete_index, MAX_SUGGESTIONS
+from modules.products.fuzzy import trigram_index
+from modules.products.categories import CategoryService
+from modules.products.similar import SimilarProductService, similar_index
+from modules.products.reservations import ReservationService
+from datetime import datetime, timezone
+from config.database import SessionLocal
 
 #Create a Blueprint for products
 products_bp = Blueprint('products', __name__)
@@ -64,83 +77,366 @@ def create_product():
     finally:
         db.close()
 
+@products_bp.route('/products/import', methods=['POST'])
+def import_products():
+    """
+    Bulk-create products from a CSV or NDJSON upload
+    Endpoint: POST /api/products/import?format=csv
+
+    The body is the raw file (not multipart), streamed row by row, e.g.
+        curl -X POST --data-binary @listings.csv -H "Content-Type: text/csv" .../products/import
+
+    CSV: header row with product field names (name, price, category_id, condition, ...)
+    NDJSON: one JSON object per line with the same field names
+
+    Query Parameters:
+    format (str): csv | ndjson (optional if Content-Type is text/csv or application/x-ndjson)
+
+    Every row is validated (required fields, types, validate_trinket_fields);
+    bad rows are reported and skipped, good rows are inserted in batches.
+
+    Returns:
+        200: { "inserted": 980, "failed": 20, "errors": [{"row": 7, "errors": [...]}], "errors_truncated": false }
+        400: Unknown upload format
+        500: Server error
+    """
+    db = SessionLocal()
+    try:
+        fmt = detect_format(request.args.get('format'), request.content_type)
+        report = ProductService.bulk_import(db, iter_records(request.stream, fmt))
+        return jsonify(report), 200
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+    except Exception as e:
+        db.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        db.close()
+
+EXPORT_LINES_PER_CHUNK = 500
+
+def _parse_timestamp(value: str) -> datetime:
+    """Parse an ISO-8601 query parameter into the naive UTC datetimes the tables store"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+@products_bp.route('/products/export', methods=['GET'])
+def export_products():
+    """
+    Stream the catalog as NDJSON (one product JSON object per line)
+    Endpoint: GET /api/products/export?updated_since=2024-01-31T00:00:00Z
+
+    Rows come from a server-side cursor and are written out as they are read,
+    so memory use is the same for 100 products or 10 million.
+    Send "Accept-Encoding: gzip" to get the stream gzip-compressed.
+
+    Query Parameters:
+    updated_since (ISO-8601, optional): only products changed after this time,
+        including deactivated ones (is_active: false). Rows come in updated_at
+        order; use the last row's updated_at as the next updated_since.
+        Each export re-reads the 5 seconds before updated_since, so rows whose
+        transaction committed late are not missed: apply rows as upserts by
+        product_id, since some arrive twice.
+        Without it: every active product, in product_id order.
+
+    Returns:
+        200: application/x-ndjson stream
+        400: Invalid updated_since
+    """
+    updated_since = request.args.get('updated_since')
+    if updated_since:
+        try:
+            updated_since = _parse_timestamp(updated_since)
+        except ValueError:
+            return jsonify({"error": "updated_since must be an ISO-8601 timestamp"}), 400
+    else:
+        updated_since = None
+
+    def generate():
+        # The session lives as long as the response stream, not the view function
+        db = SessionLocal()
+        try:
+            lines = []
+            for row in ProductService.iter_export_rows(db, updated_since):
+                lines.append(product_export_encoder.encode(row))
+                if len(lines) >= EXPORT_LINES_PER_CHUNK:
+                    yield ('\n'.join(lines) + '\n').encode('utf-8')
+                    lines = []
+            if lines:
+                yield ('\n'.join(lines) + '\n').encode('utf-8')
+        finally:
+            db.close()
+
+    headers = {}
+    body = generate()
+    if request.accept_encodings['gzip']:
+        body = gzip_chunks(body)
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    return Response(body, mimetype='application/x-ndjson', headers=headers)
+
 @products_bp.route('/products/<int:product_id>', methods=['GET'])
 def get_product(product_id):
     """
     Gets a product by ID
     Endpoint: GET/api/products/<product_id>
+
+    Supports conditional GET: responses carry an ETag and Last-Modified derived
+    from the product's updated_at. Send them back as If-None-Match /
+    If-Modified-Since and an unchanged product answers 304 with no body.
     Returns:
     200: Product found
+    304: Product unchanged since the client's copy
     404: Product not found
     500: Server error
     """
     db = SessionLocal()
     try:
-        product = ProductService.get_product_by_id(db, product_id)
-        if product:
-            return jsonify(product.to_dict()), 200
-        else:
+        exists, updated_at = ProductService.get_product_version(db, product_id)
+        if not exists:
+            return jsonify({"error": "Product not found"}), 404
+        etag = make_etag('product', product_id, updated_at)
+        if is_not_modified(etag, updated_at):
+            return not_modified(etag, updated_at)
+
+        entry = ProductService.get_product_entry(db, product_id, version=updated_at)
+        if not entry:
             return jsonify({"error": "Product not found"}), 404
+        updated_at, product = entry
+        return with_validators(jsonify(product), make_etag('product', product_id, updated_at), updated_at)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     finally:
         db.close()
 
+def _product_filters_from_request():
+    """Read the catalog filter query parameters, dropping the ones not given"""
+    filters = {
+        'condition':   request.args.get('condition'),
+        'rarity':      request.args.get('rarity'),
+        'year_min':    request.args.get('year_min',  type=int),
+        'year_max':    request.args.get('year_max',  type=int),
+        'price_min':   request.args.get('price_min', type=float),
+        'price_max':   request.args.get('price_max', type=float),
+        'category_id': request.args.get('category_id', type=int),
+    }
+    return {key: value for key, value in filters.items() if value is not None}
+
 @products_bp.route('/products', methods=['GET'])
 def get_all_products():
     """
-    Gets all products with pagination
-    Endpoint: GET /api/products?skip=0&limit=10
+    Gets all products, one page at a time (keyset pagination)
+    Endpoint: GET /api/products?limit=10&sort=newest&cursor=<next_cursor>
     Query Parameters:
-    skip (int): Number of records to skip (default: 0)
     limit (int): Maximum number of records to return (default: 100)
+    sort (str): newest | price_asc | price_desc (default: newest)
+    cursor (str): next_cursor from the previous page (omit for the first page)
+    category_id (int): Only this category and its subcategories (optional)
+    Returns:
+    200: { "products": [...], "next_cursor": "..." }  (next_cursor is null on the last page)
+         with a weak ETag over the page's product ids and versions
+    304: Page unchanged (If-None-Match matched)
+    400: Invalid cursor, sort or limit
+    """
+    db = SessionLocal()
+    try:
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', 100, type=int)
+        sort = request.args.get('sort')
+
+        filters = _product_filters_from_request()
+        if filters:
+            products, next_cursor = ProductService.filter_products(
+                db, cursor=cursor, limit=limit, sort=sort, **filters
+            )
+        else:
+            products, next_cursor = ProductService.get_all_products(db, cursor, limit, sort)
+
+        etag = list_etag(products, 'product_id', 'updated_at', extra=next_cursor)
+        if is_not_modified(etag):
+            return not_modified(etag, weak=True)
+        response = json_page_response("products", product_list_encoder.encode_many(products), next_cursor)
+        return with_validators(response, etag, weak=True)
+    except ValueError as ve:
+        # Bad cursor / sort / limit
+        return jsonify({'error': str(ve)}), 400
+    finally:
+        db.close()
+@products_bp.route('/products/facets', methods=['GET'])
+def get_product_facets():
+    """
+    Filter sidebar counts plus the first page of matching products
+    Endpoint: GET /api/products/facets?condition=mint&price_max=100&limit=20
+
+    Accepts the same filters, sort, cursor and limit as GET /api/products.
+    Counts are computed under the filters already applied, e.g. with
+    condition=mint the rarity counts only include mint items.
+
     Returns:
-    200: List of products
+    200: {
+        "facets": {
+            "condition":   [{"value": "mint", "count": 12}, ...],
+            "rarity":      [...],
+            "category_id": [...],
+            "price_band":  [{"value": "25_100", "count": 40}, ...],
+            "decade":      [{"value": 1990, "count": 7}, ...]
+        },
+        "products": [...],
+        "next_cursor": "..."
+    }
+    400: Invalid cursor, sort or limit
     """
     db = SessionLocal()
     try:
-        skip = int(request.args.get('skip', 0))
-        limit = int(request.args.get('limit', 100))
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', 100, type=int)
+        sort = request.args.get('sort')
+        filters = _product_filters_from_request()
+
+        products, next_cursor = ProductService.filter_products(
+            db, cursor=cursor, limit=limit, sort=sort, **filters
+        )
+        facets = ProductService.get_facet_counts(db, **filters)
+        return json_page_response(
+            "products", product_list_encoder.encode_many(products), next_cursor,
+            facets=dumps(facets),
+        )
+    except ValueError as ve:
+        return jsonify({'error': str(ve)}), 400
+    finally:
+        db.close()
+
+@products_bp.route('/products/trending', methods=['GET'])
+def get_trending_products():
+    """
+    What's selling hot right now: active products ranked by time-decayed
+    popularity (views, saves and purchases; recent activity counts most).
+    Scores come from pre-computed rollups (data/scripts/run_rollups.py), so
+    this never scans interaction or order tables.
+
+    GET /api/products/trending?limit=20&category_id=11
 
-        condition = request.args.get('condition')
-        rarity    = request.args.get('rarity')
-        year_min  = request.args.get('year_min',  type=int)
-        year_max  = request.args.get('year_max',  type=int)
-        price_min = request.args.get('price_min', type=float)
-        price_max = request.args.get('price_max', type=float)
+    Query Parameters:
+    limit (int): How many products (default 20, max 100)
+    category_id (int): Only products in this category (optional)
+
+    Returns:
+        200: [ {...product fields..., "trending_score": 12.5}, ... ]
+    """
+    db = SessionLocal()
+    try:
+        limit = request.args.get('limit', 20, type=int)
         category_id = request.args.get('category_id', type=int)
+        body = TrendingService.get_trending_json(db, category_id, limit)
+        return Response(body, mimetype='application/json')
+    finally:
+        db.close()
 
-        if any([condition, rarity, year_min, year_max, price_min, price_max, category_id]):
-            products = ProductService.filter_products(
-                db, 
-                condition=condition,
-                rarity=rarity,
-                year_min=year_min,
-                year_max=year_max,
-                price_min=price_min,
-                price_max=price_max,
-                skip=skip,
-                limit=limit,
-                category_id=category_id
-            )
+@products_bp.route('/products/trending/categories', methods=['GET'])
+def get_trending_categories():
+    """
+    Categories ranked by time-decayed popularity
 
-        else:
-            products = ProductService.get_all_products(db, skip, limit)
+    GET /api/products/trending/categories?limit=10
 
-        return jsonify([product.to_dict() for product in products]), 200
+    Returns:
+        200: [ {"category_id": 11, "trending_score": 42.5}, ... ]
+    """
+    db = SessionLocal()
+    try:
+        limit = request.args.get('limit', 10, type=int)
+        return jsonify(TrendingService.get_trending_categories(db, limit)), 200
     finally:
         db.close()
+
+@products_bp.route('/products/autocomplete', methods=['GET'])
+def autocomplete_products():
+    """
+    Typeahead suggestions for the search box: products, brands and
+    categories whose words start with q, most popular first. Served from
+    an in-memory index, so it is cheap enough to call on every keystroke.
+
+    GET /api/products/autocomplete?q=chari&limit=10
+
+    Query Parameters:
+    q (str): What the user has typed so far
+    limit (int): How many suggestions (default and max 10)
+
+    Returns:
+        200: [ {"type": "product", "id": 42, "text": "Charizard Holo 1st Edition"},
+               {"type": "brand", "id": "wizards of the coast", "text": "Wizards of the Coast"}, ... ]
+    """
+    q = request.args.get('q', '')
+    limit = request.args.get('limit', MAX_SUGGESTIONS, type=int)
+    db = SessionLocal()
+    try:
+        autocomplete_index.ensure_fresh(db)
+    finally:
+        db.close()
+    return jsonify(autocomplete_index.suggest(q, limit)), 200
+
+@products_bp.route('/products/<int:product_id>/similar', methods=['GET'])
+def get_similar_products(product_id):
+    """
+    "Similar items" for a product page: active listings closest in name,
+    brand, category, condition, rarity, material and era. Looked up in a
+    precomputed vector index, not by scanning the catalog.
+
+    GET /api/products/42/similar?limit=10
+
+    Query Parameters:
+    limit (int): How many products (default 10, max 50)
+
+    Returns:
+        200: [ {...product fields..., "similarity": 0.83}, ... ]  (best match first)
+        404: Product not found or inactive
+    """
+    db = SessionLocal()
+    try:
+        limit = request.args.get('limit', 10, type=int)
+        body = SimilarProductService.get_similar_json(db, product_id, limit)
+        if body is None:
+            return jsonify({"error": "Product not found"}), 404
+        return Response(body, mimetype='application/json')
+    finally:
+        db.close()
+
+@products_bp.route('/products/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """
+    Hit / miss / eviction counters for this worker's product caches.
+    Used to size PRODUCT_CACHE_SIZE and FACET_CACHE_SIZE.
+
+    GET /api/products/cache/stats
+
+    Returns:
+        200: { "product_cache": {...}, "facet_cache": {...} }
+    """
+    return jsonify({
+        "product_cache": product_cache.stats(),
+        "facet_cache": facet_cache.stats(),
+        "autocomplete_index": autocomplete_index.stats(),
+        "fuzzy_index": trigram_index.stats(),
+        "similar_index": similar_index.stats(),
+    }), 200
+
 @products_bp.route('/product/search', methods=['GET'])
 def search_products():
     """Search for products by name, description, or brand
     Endpoint: GET /api/product/search?query=keyword&skip=0&limit=10
+    Results are ranked by relevance (name matches first) and every word
+    in the query is matched as a prefix, so "char" finds "Charizard".
     Query Parameters:
     query (str): Search keyword (required)
     skip (int): Number of records to skip (default: 0)
     limit (int): Maximum number of records to return (default: 100)
+    fuzzy (bool): Match misspelled names ("Charzard"), most similar first (default: false)
     Returns:
-    200: List of matching products
-    400: Missing required query parameter
+    200: List of matching products, with a weak ETag over their ids and versions
+    304: Results unchanged (If-None-Match matched)
+    400: Missing required query parameter, or fuzzy query shorter than 3 characters
     500: Server error
     """
     db = SessionLocal()
@@ -148,11 +444,36 @@ def search_products():
         query = request.args.get('query')
         skip = request.args.get('skip', 0, type=int)
         limit = request.args.get('limit',100, type=int)
+        fuzzy = request.args.get('fuzzy', '').lower() in ('1', 'true', 'yes')
 
         if not query:
             return jsonify({"error": "Missing required query parameter 'query'"}), 400
-        products = ProductService.search_products(db, query, skip, limit)
-        return jsonify([product.to_dict() for product in products]), 200
+        products = ProductService.search_products(db, query, skip, limit, fuzzy=fuzzy)
+        etag = list_etag(products, 'product_id', 'updated_at')
+        if is_not_modified(etag):
+            return not_modified(etag, weak=True)
+        response = Response(product_list_encoder.encode_many(products), mimetype='application/json')
+        return with_validators(response, etag, weak=True)
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    finally:
+        db.close()
+
+@products_bp.route('/categories', methods=['GET'])
+def get_categories():
+    """
+    The category tree, for navigation menus. Served from the in-memory
+    category tree cache.
+
+    GET /api/categories
+
+    Returns:
+        200: [ {"category_id": 1, "name": "Trading Cards", "parent_category_id": null,
+                "children": [ {"category_id": 11, "name": "Magic Cards", ..., "children": []}, ... ]}, ... ]
+    """
+    db = SessionLocal()
+    try:
+        return jsonify(CategoryService.get_tree(db).to_nested()), 200
     finally:
         db.close()
 
@@ -205,6 +526,118 @@ def update_product(product_id):
         if not product:
             return jsonify({"error": "Product not found"}), 404
         return jsonify(product.to_dict()), 200
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        db.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        db.close()
+
+@products_bp.route('/products', methods=['PATCH'])
+def bulk_update_products():
+    """Apply many partial product updates in one transaction (repricing, restocking)
+    Endpoint: PATCH /api/products
+
+    Expected JSON body:
+    {
+        "updates": [
+            {"product_id": 1, "price": 19.99},
+            {"product_id": 2, "stock_quantity": 0, "is_active": false},
+            ...
+        ]
+    }
+    Updatable fields: price, stock_quantity, is_active, suggested_price,
+    market_average, price_confidence, condition, rarity
+
+    Returns:
+        200: { "updated": [1, 2, ...], "not_found": [...] }
+        400: Invalid body or deltas (nothing is written): { "error": ..., "details": [{"index": 3, "errors": [...]}] }
+        500: Server error
+    """
+    db = SessionLocal()
+    try:
+        data = request.get_json(silent=True)
+        updates = data.get('updates') if isinstance(data, dict) else None
+        if not isinstance(updates, list) or not updates:
+            return jsonify({"error": "Body must contain a non-empty 'updates' list"}), 400
+
+        result = ProductService.bulk_update_products(db, updates)
+        return jsonify(result), 200
+    except ValueError as ve:
+        return jsonify({"error": str(ve), "details": getattr(ve, 'errors', [])}), 400
+    except Exception as e:
+        db.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        db.close()
+
+@products_bp.route('/products/<int:product_id>/reservations', methods=['POST'])
+def reserve_product(product_id):
+    """
+    Hold units of a product for a few minutes while the buyer pays
+    Endpoint: POST /api/products/<product_id>/reservations
+
+    Expected JSON body:
+    {
+        "user_id": 1,
+        "quantity": 1,      (optional, default: 1)
+        "minutes": 15       (optional, default: RESERVATION_MINUTES, max 60)
+    }
+    Held units show as unavailable to everyone else until the hold is released,
+    expires, or is bought with POST /api/orders {"reservation_ids": [...]}.
+
+    Returns:
+        201: the reservation
+        400: Invalid body, or not enough stock available
+        404: Product not found
+    """
+    db = SessionLocal()
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or 'user_id' not in data:
+            return jsonify({"error": "Missing required field: user_id"}), 400
+        minutes = data.get('minutes')
+        if minutes is not None and (isinstance(minutes, bool) or not isinstance(minutes, (int, float))):
+            return jsonify({"error": "minutes must be a number"}), 400
+
+        reservation = ReservationService.reserve(
+            db, data['user_id'], product_id, quantity=data.get('quantity', 1), minutes=minutes)
+        if reservation is None:
+            return jsonify({"error": "Product not found"}), 404
+        return jsonify(reservation.to_dict()), 201
+    except ValueError as ve:
+        return jsonify({"error": str(ve)}), 400
+    except Exception as e:
+        db.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        db.close()
+
+@products_bp.route('/reservations/<int:reservation_id>', methods=['DELETE'])
+def release_reservation(reservation_id):
+    """
+    Release a hold early
+    Endpoint: DELETE /api/reservations/<reservation_id>?user_id=1
+    (user_id may also be sent in a JSON body); only the user who placed
+    the hold can release it.
+
+    Returns:
+        200: Reservation released
+        400: Missing or invalid user_id
+        404: Reservation not found (or already expired, or another user's)
+    """
+    db = SessionLocal()
+    try:
+        data = request.get_json(silent=True)
+        user_id = request.args.get('user_id', type=int)
+        if user_id is None and isinstance(data, dict):
+            user_id = data.get('user_id')
+        if isinstance(user_id, bool) or not isinstance(user_id, int):
+            return jsonify({"error": "Missing or invalid user_id"}), 400
+        if not ReservationService.release(db, reservation_id, user_id=user_id):
+            return jsonify({"error": "Reservation not found"}), 404
+        return jsonify({"message": "Reservation released"}), 200
     except Exception as e:
         db.rollback()
         return jsonify({"error": str(e)}), 500
@@ -241,4 +674,5 @@ def delete_product(product_id):
 # Trinket-specific search
 GET  /api/products/search?condition=mint&rarity=rare
 GET  /api/products/trending            # What's selling hot right now
+GET  /api/products/autocomplete?q=ch   # Search box typeahead
 """
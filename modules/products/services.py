@@ -2,9 +2,173 @@
 Product service - business logic for product operations
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from modules.products.models import Product, VALID_CONDITIONS, VALID_RARITIES
-from typing import Optional, List
+from sqlalchemy import func, case, literal_column, Integer, insert, update, delete, values, column, select, cast, or_
+from sqlalchemy.exc import IntegrityError, DataError
+from modules.products.models import Product, StockReservation, VALID_CONDITIONS, VALID_RARITIES, PRICE_BANDS
+from modules.common.pagination import SortSpec, paginate, get_sort
+from modules.common.cache import TTLCache
+from modules.common.serialization import RowEncoder
+from modules.products.categories import CategoryService
+from modules.products.indexing import WATERMARK_OVERLAP
+from modules.products.fuzzy import trigram_extension_available, trigram_index, SIMILARITY_THRESHOLD, MIN_QUERY_LENGTH
+from typing import Optional, List, Tuple, Dict, Iterable, Iterator
+from decimal import Decimal, InvalidOperation
+from datetime import datetime
+import os
+import re
+
+# Stable orders for catalog listings, each backed by an (column, product_id) index
+PRODUCT_SORTS = {
+    'newest':     SortSpec('newest', Product.created_at, Product.product_id, descending=True),
+    'price_asc':  SortSpec('price_asc', Product.price, Product.product_id),
+    'price_desc': SortSpec('price_desc', Product.price, Product.product_id, descending=True),
+}
+DEFAULT_PRODUCT_SORT = 'newest'
+
+# Columns (and encoder) for list endpoints: every to_dict() field except the
+# description text and last_market_check, which only the detail view needs.
+# updated_at is included so list responses can carry a version per product.
+PRODUCT_LIST_COLUMNS = [
+    Product.product_id, Product.name, Product.category_id, Product.price, Product.brand,
+    Product.stock_quantity, Product.available_quantity, Product.image_url, Product.created_at, Product.updated_at,
+    Product.is_active, Product.condition, Product.year_manufactured, Product.rarity,
+    Product.material, Product.dimensions, Product.authenticity_verified,
+    Product.suggested_price, Product.price_confidence, Product.market_average,
+]
+product_list_encoder = RowEncoder(PRODUCT_LIST_COLUMNS)
+
+# Catalog export: rows fetched per round trip from the server-side cursor
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_COLUMNS = [
+    Product.product_id, Product.name, Product.category_id, Product.price, Product.description,
+    Product.brand, Product.stock_quantity, Product.image_url, Product.condition,
+    Product.year_manufactured, Product.rarity, Product.material, Product.dimensions,
+    Product.authenticity_verified, Product.suggested_price, Product.price_confidence,
+    Product.market_average, Product.last_market_check, Product.created_at, Product.updated_at,
+    Product.is_active,
+]
+product_export_encoder = RowEncoder(EXPORT_COLUMNS)
+
+# Bulk import: columns accepted per row, and how to parse each from CSV text / JSON
+IMPORT_BATCH_SIZE = 5000
+MAX_IMPORT_ERRORS = 1000   # cap the per-row error report so a bad file can't blow up the response
+_TRUE_STRINGS = {'true', '1', 'yes', 'y', 't'}
+_FALSE_STRINGS = {'false', '0', 'no', 'n', 'f', ''}
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE_STRINGS:
+        return True
+    if text in _FALSE_STRINGS:
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+def _parse_price(value):
+    try:
+        price = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"not a number: {value!r}")
+    if not price.is_finite() or price < 0:
+        raise ValueError(f"must be a non-negative number: {value!r}")
+    return price
+
+IMPORT_FIELDS = {
+    'name':                  str,
+    'price':                 _parse_price,
+    'category_id':           int,
+    'description':           str,
+    'brand':                 str,
+    'stock_quantity':        int,
+    'image_url':             str,
+    'condition':             str,
+    'year_manufactured':     int,
+    'rarity':                str,
+    'material':              str,
+    'dimensions':            str,
+    'authenticity_verified': _parse_bool,
+}
+IMPORT_DEFAULTS = {'stock_quantity': 1, 'authenticity_verified': False}
+
+def _parse_stock(value):
+    quantity = int(value)
+    if quantity < 0:
+        raise ValueError(f"must not be negative: {value!r}")
+    return quantity
+
+# Bulk PATCH: the repricing / restocking fields a delta may carry
+BULK_UPDATE_FIELDS = {
+    'price':            _parse_price,
+    'stock_quantity':   _parse_stock,
+    'is_active':        _parse_bool,
+    'suggested_price':  _parse_price,
+    'market_average':   _parse_price,
+    'price_confidence': str,
+    'condition':        str,
+    'rarity':           str,
+}
+BULK_UPDATE_REQUIRED = {'price', 'stock_quantity', 'is_active'}   # can't be set to null
+# Never written by update_product: maintained by reservations / the database
+PRODUCT_READ_ONLY_FIELDS = {'product_id', 'reserved_quantity', 'available_quantity', 'search_vector'}
+MAX_BULK_UPDATES = 10_000
+BULK_UPDATE_CHUNK_SIZE = 2000   # rows per UPDATE ... FROM (VALUES ...) statement
+
+# Read-through cache of serialized products keyed by product_id.
+# Entries are (updated_at, Product.to_dict()) so the version is cached alongside the body.
+# An entry costs roughly 1-1.5 KB, so the default 50k entries is ~50-75 MB per worker.
+# Caching the whole ~1M listing catalog would need ~1 GB per worker; size for the hot
+# set instead and watch hit_rate / evictions on GET /products/cache/stats.
+# The cache is per process, and a write only invalidates the entry in the worker that
+# made it, so a cached entry is never served on trust: it is checked against the row's
+# current updated_at first (one primary-key lookup, see get_product_entry). Every write
+# through SQLAlchemy, Core UPDATEs included, bumps updated_at via its onupdate. The TTL
+# only bounds how long a raw SQL write that leaves updated_at alone can go unnoticed.
+product_cache = TTLCache(
+    maxsize=int(os.getenv('PRODUCT_CACHE_SIZE', 50_000)),
+    ttl=float(os.getenv('PRODUCT_CACHE_TTL', 300)),
+)
+
+# Facet counts for popular filter combinations, keyed by the normalized filter set.
+# Short TTL: counts may lag new listings by a few seconds, which the sidebar tolerates.
+facet_cache = TTLCache(
+    maxsize=int(os.getenv('FACET_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('FACET_CACHE_TTL', 30)),
+)
+
+# Sidebar facets: name -> SQL expression each product is bucketed by.
+# Constants are inlined (literal_column) rather than bound, so Postgres sees the
+# SELECT and GROUP BY expressions as identical.
+_PRICE_BAND_EXPR = case(
+    *[(Product.price < literal_column(str(upper)), literal_column(f"'{label}'"))
+      for label, _, upper in PRICE_BANDS if upper is not None],
+    else_=literal_column(f"'{PRICE_BANDS[-1][0]}'"),
+)
+_TEN = literal_column('10', Integer)
+_DECADE_EXPR = (Product.year_manufactured // _TEN) * _TEN  # 1987 -> 1980
+FACETS = {
+    'condition':   Product.condition,
+    'rarity':      Product.rarity,
+    'category_id': Product.category_id,
+    'price_band':  _PRICE_BAND_EXPR,
+    'decade':      _DECADE_EXPR,
+}
+
+SEARCH_CONFIG = 'english'
+_SEARCH_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_prefix_tsquery(query: str) -> Optional[str]:
+    """
+    Turn free text into a to_tsquery() string where every word is a prefix match.
+    "vint poke" -> "vint:* & poke:*"
+    Only word characters survive, so user input can't inject tsquery operators.
+    Returns None if there is nothing searchable in the query.
+    """
+    tokens = _SEARCH_TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    return ' & '.join(f"{token}:*" for token in tokens)
 
 class ProductService:
     """"year_manufactured": 1999
@@ -44,11 +208,68 @@ class ProductService:
     def get_product_by_id(db: Session, product_id: int) -> Optional[Product]:
         """Get product by ID"""
         return db.query(Product).filter(Product.product_id == product_id).first()
+
+    @staticmethod
+    def get_product_entry(db: Session, product_id: int,
+                          version: Optional[datetime] = None) -> Optional[Tuple[datetime, dict]]:
+        """
+        Get (updated_at, product.to_dict()) for a product, served from product_cache when possible.
+        updated_at is the product's version, used for ETag / Last-Modified.
+        A cached entry is only used if its version still matches the row's
+        updated_at (pass `version` if the caller just read it, to skip that lookup).
+        Missing products are not cached, so a product created later is found immediately.
+        """
+        entry = product_cache.get(product_id)
+        if entry is not None:
+            if version is None:
+                exists, version = ProductService.get_product_version(db, product_id)
+                if not exists:
+                    product_cache.delete(product_id)
+                    return None
+            if entry[0] == version:
+                return entry
+
+        product = ProductService.get_product_by_id(db, product_id)
+        if not product:
+            return None
+        entry = (product.updated_at, product.to_dict())
+        product_cache.set(product_id, entry)
+        return entry
+
+    @staticmethod
+    def get_product_dict(db: Session, product_id: int) -> Optional[dict]:
+        """Get a product already serialized with to_dict() (see get_product_entry)"""
+        entry = ProductService.get_product_entry(db, product_id)
+        return entry[1] if entry else None
+
+    @staticmethod
+    def get_product_version(db: Session, product_id: int) -> Tuple[bool, Optional[datetime]]:
+        """
+        Cheap version probe for conditional GETs: (exists, updated_at).
+        Always read from the database (the single updated_at column, without
+        loading the row), never from product_cache, which may be stale in
+        this worker.
+        """
+        row = db.query(Product.updated_at).filter(Product.product_id == product_id).first()
+        if row is None:
+            return False, None
+        return True, row.updated_at
+
+    @staticmethod
+    def invalidate_cached_product(product_id: int):
+        """Drop a product from product_cache; call after committing any change to it"""
+        product_cache.delete(product_id)
     
     @staticmethod
-    def get_all_products(db: Session, skip: int = 0, limit: int = 100) -> List[Product]:
-        """Get all products with pagination"""
-        return db.query(Product).filter(Product.is_active == True).offset(skip).limit(limit).all()
+    def get_all_products(db: Session, cursor: str = None, limit: int = 100,
+                         sort: str = None) -> Tuple[List, Optional[str]]:
+        """
+        Get active products one keyset page at a time
+        Returns (rows, next_cursor); rows are Core rows of PRODUCT_LIST_COLUMNS
+        (encode them with product_list_encoder). Pass next_cursor back to get the following page.
+        """
+        query = db.query(*PRODUCT_LIST_COLUMNS).filter(Product.is_active == True)
+        return paginate(query, get_sort(PRODUCT_SORTS, sort, DEFAULT_PRODUCT_SORT), cursor, limit)
     
     @staticmethod
     def get_products_by_category_id(db: Session, category_id: str, skip: int = 0, limit: int = 100) -> List[Product]:
@@ -62,33 +283,283 @@ class ProductService:
         )
     
     @staticmethod
-    def search_products(db: Session, query: str, skip: int = 0, limit: int = 100) -> List[Product]:
-        """Search products by name, description, or brand"""
-        search = f"%{query}%"
-        return db.query(Product).filter(
-            or_(
-                Product.name.ilike(search),
-                Product.description.ilike(search),
-                Product.brand.ilike(search)
-            ),
-            Product.is_active == True
-        ).offset(skip).limit(limit).all()
+    def search_products(db: Session, query: str, skip: int = 0, limit: int = 100,
+                        fuzzy: bool = False) -> List:
+        """
+        Full-text search over name, brand and description.
+        Served by the GIN index on products.search_vector; results come back
+        best match first (name hits outrank brand hits outrank description hits).
+        A query of nothing but stopwords falls back to a substring match.
+        With fuzzy=True, matches misspelled names instead (see fuzzy_search_products).
+        Returns Core rows of PRODUCT_LIST_COLUMNS.
+        """
+        if fuzzy:
+            return ProductService.fuzzy_search_products(db, query, skip, limit)
+
+        tsquery_text = build_prefix_tsquery(query)
+        if tsquery_text is None:
+            return []
+
+        tsquery = func.to_tsquery(SEARCH_CONFIG, tsquery_text)
+        rank = func.ts_rank_cd(Product.search_vector, tsquery)
+        rows = (
+            db.query(*PRODUCT_LIST_COLUMNS)
+            .filter(Product.search_vector.op('@@')(tsquery), Product.is_active == True)
+            .order_by(rank.desc(), Product.product_id)
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+        # Only stopwords ("the", "of a"): the tsquery is empty and matches nothing,
+        # so fall back to a substring match like the search did before full-text
+        if not rows and db.execute(select(func.numnode(tsquery))).scalar() == 0:
+            return ProductService._substring_search(db, query, skip, limit)
+        return rows
+
+    @staticmethod
+    def _substring_search(db: Session, query: str, skip: int, limit: int) -> List:
+        """Case-insensitive substring match over name, brand and description (no index)"""
+        escaped = query.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        pattern = f"%{escaped}%"
+        return (
+            db.query(*PRODUCT_LIST_COLUMNS)
+            .filter(
+                or_(Product.name.ilike(pattern), Product.brand.ilike(pattern), Product.description.ilike(pattern)),
+                Product.is_active == True,
+            )
+            .order_by(Product.product_id)
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
     
+    @staticmethod
+    def fuzzy_search_products(db: Session, query: str, skip: int = 0, limit: int = 100) -> List:
+        """
+        Typo-tolerant name search ("Charzard" finds "Charizard"), most similar first.
+        Uses the pg_trgm GiST index when the extension is installed: a nearest-
+        neighbour index scan that stops after skip + limit rows. Otherwise the
+        in-process TrigramIndex picks the ids and they are fetched by primary key.
+        Returns Core rows of PRODUCT_LIST_COLUMNS.
+        """
+        query = ' '.join((query or '').split())
+        if len(query) < MIN_QUERY_LENGTH:
+            raise ValueError(f"Fuzzy search needs at least {MIN_QUERY_LENGTH} characters")
+
+        if trigram_extension_available(db):
+            # Transaction-local; `name %> q` is word_similarity(q, name) above it
+            db.execute(
+                select(func.set_config('pg_trgm.word_similarity_threshold', str(SIMILARITY_THRESHOLD), True))
+            )
+            return (
+                db.query(*PRODUCT_LIST_COLUMNS)
+                .filter(Product.name.op('%>')(query), Product.is_active == True)
+                .order_by(Product.name.op('<->>')(query), Product.product_id)
+                .offset(skip)
+                .limit(limit)
+                .all()
+            )
+
+        trigram_index.ensure_fresh(db)
+        matches = trigram_index.search(query, skip + limit)[skip:]
+        if not matches:
+            return []
+        position = {product_id: i for i, (product_id, _) in enumerate(matches)}
+        rows = (
+            db.query(*PRODUCT_LIST_COLUMNS)
+            .filter(Product.product_id.in_(position), Product.is_active == True)
+            .all()
+        )
+        return sorted(rows, key=lambda row: position[row.product_id])
+
+    @staticmethod
+    def iter_export_rows(db: Session, updated_since: datetime = None,
+                         chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator:
+        """
+        Stream catalog rows (Core rows of EXPORT_COLUMNS, no ORM objects) from a
+        server-side cursor, chunk_size rows per fetch, so memory stays flat
+        however large the catalog is.
+
+        Without updated_since: every active product, in product_id order.
+        With updated_since: every product changed after that time, including
+        deactivated ones (is_active = false) so partners can drop them, in
+        updated_at order; the last row's updated_at is the next watermark.
+        updated_at is stamped before commit, so a row can commit after a
+        consumer already read past its timestamp; every export therefore
+        starts WATERMARK_OVERLAP before updated_since. Rows near the watermark
+        are sent again, which consumers treat as an upsert.
+        """
+        stmt = select(*EXPORT_COLUMNS)
+        if updated_since is None:
+            stmt = stmt.where(Product.is_active == True).order_by(Product.product_id)
+        else:
+            stmt = stmt.where(Product.updated_at > updated_since - WATERMARK_OVERLAP) \
+                .order_by(Product.updated_at, Product.product_id)
+
+        result = db.execute(stmt.execution_options(yield_per=chunk_size))
+        try:
+            for row in result:
+                yield row
+        finally:
+            result.close()
+
     @staticmethod
     def update_product(db: Session, product_id: int, **kwargs) -> Optional[Product]:
-        """Update product information"""
-        product = db.query(Product).filter(Product.product_id == product_id).first()
+        """
+        Update product information.
+        reserved_quantity and available_quantity are managed by reservations
+        and ignored here. Raises ValueError if stock_quantity would drop below
+        the units held by active reservations.
+        """
+        product = db.query(Product).filter(Product.product_id == product_id).with_for_update().first()
         if not product:
             return None
         
         for key, value in kwargs.items():
+            if key in PRODUCT_READ_ONLY_FIELDS:
+                continue
             if hasattr(product, key):
                 setattr(product, key, value)
+        if product.stock_quantity is not None and product.stock_quantity < product.reserved_quantity:
+            db.rollback()
+            raise ValueError(
+                f"stock_quantity can't go below the {product.reserved_quantity} units reserved for product {product_id}"
+            )
         
         db.commit()
+        ProductService.invalidate_cached_product(product_id)
         db.refresh(product)
         return product
     
+    @staticmethod
+    def _parse_bulk_updates(updates: List[dict]) -> Tuple[Dict[int, dict], List[dict]]:
+        """
+        Validate bulk update deltas.
+        Returns ({product_id: {field: value}}, errors). Later deltas for the same
+        product override earlier ones field by field.
+        """
+        merged = {}
+        errors = []
+        for index, delta in enumerate(updates):
+            if not isinstance(delta, dict):
+                errors.append({'index': index, 'errors': ["Each update must be an object"]})
+                continue
+            row_errors = []
+            try:
+                product_id = int(delta.get('product_id'))
+            except (TypeError, ValueError):
+                errors.append({'index': index, 'errors': ["Missing or invalid product_id"]})
+                continue
+
+            fields = {}
+            for key, raw in delta.items():
+                if key == 'product_id':
+                    continue
+                parse = BULK_UPDATE_FIELDS.get(key)
+                if parse is None:
+                    row_errors.append(f"Field cannot be bulk updated: {key}")
+                    continue
+                if raw is None and key not in BULK_UPDATE_REQUIRED:
+                    fields[key] = None   # clearing an optional field
+                    continue
+                try:
+                    fields[key] = parse(raw)
+                except (ValueError, TypeError) as e:
+                    row_errors.append(f"Invalid {key}: {e}")
+            row_errors.extend(ProductService.validate_trinket_fields(fields.get('condition'), fields.get('rarity')))
+            if not fields and not row_errors:
+                row_errors.append("No fields to update")
+
+            if row_errors:
+                errors.append({'index': index, 'product_id': product_id, 'errors': row_errors})
+            else:
+                merged.setdefault(product_id, {}).update(fields)
+        return merged, errors
+
+    @staticmethod
+    def _stock_below_held(db: Session, product_ids: List[int]) -> List[dict]:
+        """Errors for the products (of those not updated) that exist, i.e. whose new stock was below their holds"""
+        rows = db.query(Product.product_id, Product.reserved_quantity) \
+            .filter(Product.product_id.in_(product_ids)).all()
+        return [
+            {'product_id': row.product_id,
+             'errors': [f"stock_quantity can't go below the {row.reserved_quantity} reserved units"]}
+            for row in rows
+        ]
+
+    @staticmethod
+    def bulk_update_products(db: Session, updates: List[dict]) -> dict:
+        """
+        Apply many partial updates, e.g. from a repricing job or inventory sync:
+            [{"product_id": 1, "price": 19.99}, {"product_id": 2, "stock_quantity": 0}, ...]
+
+        Deltas are grouped by the set of fields they change and each group is applied
+        with set-based UPDATE products ... FROM (VALUES ...) statements, all in one
+        transaction. No Product objects are loaded or refreshed.
+
+        All-or-nothing: if any delta is invalid, or would set stock_quantity below
+        the units held by reservations, nothing is written and ValueError is
+        raised carrying the per-delta errors in its .errors attribute.
+
+        Returns {"updated": [product_id, ...], "not_found": [product_id, ...]}
+        """
+        if len(updates) > MAX_BULK_UPDATES:
+            raise ValueError(f"Too many updates: {len(updates)}. Send at most {MAX_BULK_UPDATES} per request")
+        merged, errors = ProductService._parse_bulk_updates(updates)
+        if errors:
+            error = ValueError("Invalid updates")
+            error.errors = errors
+            raise error
+
+        groups = {}
+        for product_id, fields in merged.items():
+            groups.setdefault(tuple(sorted(fields)), []).append((product_id, fields))
+
+        table = Product.__table__
+        updated = []
+        held_errors = []
+        try:
+            for field_names, rows in groups.items():
+                for start in range(0, len(rows), BULK_UPDATE_CHUNK_SIZE):
+                    chunk = rows[start:start + BULK_UPDATE_CHUNK_SIZE]
+                    deltas = values(
+                        column('product_id', Integer),
+                        *[column(name, table.c[name].type) for name in field_names],
+                        name='deltas',
+                    ).data([(product_id, *[fields[name] for name in field_names]) for product_id, fields in chunk])
+                    stmt = (
+                        update(table)
+                        .where(table.c.product_id == deltas.c.product_id)
+                        # Cast: a VALUES column that is NULL in every row is typed text by Postgres
+                        .values({name: cast(deltas.c[name], table.c[name].type) for name in field_names})
+                        .returning(table.c.product_id)
+                    )
+                    if 'stock_quantity' in field_names:
+                        # Stock may not drop below the units held by reservations
+                        stmt = stmt.where(deltas.c.stock_quantity >= table.c.reserved_quantity)
+                    returned = db.execute(stmt).scalars().all()
+                    updated.extend(returned)
+                    if 'stock_quantity' in field_names and len(returned) < len(chunk):
+                        returned_ids = set(returned)
+                        held_errors.extend(ProductService._stock_below_held(
+                            db, [product_id for product_id, _ in chunk if product_id not in returned_ids]))
+            if held_errors:
+                db.rollback()
+                error = ValueError("Invalid updates")
+                error.errors = held_errors
+                raise error
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        product_cache.delete_many(updated)
+        updated_ids = set(updated)
+        return {
+            'updated': sorted(updated_ids),
+            'not_found': sorted(product_id for product_id in merged if product_id not in updated_ids),
+        }
+
     @staticmethod
     def delete_product(db: Session, product_id: int) -> bool:
         """Soft delete a product (set is_active to False)"""
@@ -98,19 +569,203 @@ class ProductService:
         
         product.is_active = False
         db.commit()
+        ProductService.invalidate_cached_product(product_id)
         return True
     
     @staticmethod
     def update_stock(db: Session, product_id: int, quantity_change: int) -> Optional[Product]:
-        """Update product stock quantity"""
-        product = db.query(Product).filter(Product.product_id == product_id).first()
-        if not product:
-            return None
-        
-        product.stock_quantity += quantity_change
+        """
+        Update product stock quantity with one atomic UPDATE (no read-modify-write),
+        so concurrent changes can't overwrite each other.
+        Raises ValueError if a decrease would take stock below zero, or below
+        the units held by active reservations. Nothing is written then, and the
+        session is left as it was: rolling back is up to the caller.
+        """
+        table = Product.__table__
+        stmt = (
+            update(table)
+            .where(table.c.product_id == product_id)
+            .values(stock_quantity=table.c.stock_quantity + quantity_change)
+            .returning(table.c.stock_quantity)
+        )
+        if quantity_change < 0:
+            stmt = stmt.where(table.c.stock_quantity + quantity_change >= table.c.reserved_quantity)
+        new_stock = db.execute(stmt).scalar()
+        if new_stock is None:
+            if ProductService.get_product_by_id(db, product_id) is None:
+                return None
+            raise ValueError(f"Insufficient stock for product {product_id}")
         db.commit()
-        db.refresh(product)
-        return product
+        ProductService.invalidate_cached_product(product_id)
+        return ProductService.get_product_by_id(db, product_id)
+
+    @staticmethod
+    def _locked_products(product_ids: Iterable[int]):
+        """CTE locking the products in product_id order, so concurrent multi-row updates can't deadlock"""
+        table = Product.__table__
+        return (
+            select(table.c.product_id)
+            .where(table.c.product_id.in_(list(product_ids)))
+            .order_by(table.c.product_id)
+            .with_for_update()
+            .cte('locked')
+            .prefix_with('MATERIALIZED')
+        )
+
+    @staticmethod
+    def take_stock(db: Session, quantities: Dict[int, int], reserved: bool = False) -> Dict[int, tuple]:
+        """
+        Atomically take stock for several products, e.g. for a checkout:
+            UPDATE products SET stock_quantity = stock_quantity - q
+            WHERE is_active AND stock_quantity - reserved_quantity >= q ... RETURNING
+        The check and the decrement are one statement, so two buyers can't both
+        take the last unit, and units held by other buyers' reservations are
+        left alone. With reserved=True the units come out of the caller's own
+        reservations instead (reserved_quantity goes down with the stock), and
+        the stock must still cover them.
+        Rows are locked in product_id order first, so concurrent multi-item
+        checkouts can't deadlock. Products that come up short get their
+        expired holds released (see release_expired_holds) and are tried again,
+        so a hold that lapsed before the sweeper ran doesn't block the sale.
+
+        Does not commit: the caller commits (or rolls back) with the rest of its
+        transaction, which is when the row locks are released.
+        Returns {product_id: (name, price)} for the products that were decremented;
+        anything missing was unknown, inactive or short on stock.
+        """
+        if not quantities:
+            return {}
+        table = Product.__table__
+        wanted = values(
+            column('product_id', Integer), column('quantity', Integer), name='wanted',
+        ).data(sorted(quantities.items()))
+        locked = ProductService._locked_products(quantities)
+        stmt = (
+            update(table)
+            .where(
+                table.c.product_id == wanted.c.product_id,
+                table.c.product_id.in_(select(locked.c.product_id)),
+                table.c.is_active == True,
+            )
+            .returning(table.c.product_id, table.c.name, table.c.price)
+        )
+        if reserved:
+            stmt = stmt.where(
+                table.c.reserved_quantity >= wanted.c.quantity,
+                table.c.stock_quantity >= wanted.c.quantity,
+            ).values(
+                stock_quantity=table.c.stock_quantity - wanted.c.quantity,
+                reserved_quantity=table.c.reserved_quantity - wanted.c.quantity,
+            )
+        else:
+            stmt = stmt.where(table.c.stock_quantity - table.c.reserved_quantity >= wanted.c.quantity).values(
+                stock_quantity=table.c.stock_quantity - wanted.c.quantity,
+            )
+        taken = {row.product_id: (row.name, row.price) for row in db.execute(stmt)}
+        short = [product_id for product_id in quantities if product_id not in taken]
+        if not reserved and short and ProductService.release_expired_holds(db, short):
+            taken.update(ProductService.take_stock(db, {product_id: quantities[product_id] for product_id in short}))
+        return taken
+
+    @staticmethod
+    def hold_stock(db: Session, product_id: int, quantity: int) -> bool:
+        """
+        Move `quantity` available units into reserved_quantity, with the same
+        atomic check as take_stock, which also releases expired holds when the
+        product comes up short. Does not commit. False if the product is
+        unknown, inactive or doesn't have that many units available.
+        """
+        table = Product.__table__
+        stmt = (
+            update(table)
+            .where(
+                table.c.product_id == product_id,
+                table.c.is_active == True,
+                table.c.stock_quantity - table.c.reserved_quantity >= quantity,
+            )
+            .values(reserved_quantity=table.c.reserved_quantity + quantity)
+            .returning(table.c.product_id)
+        )
+        if db.execute(stmt).scalar() is not None:
+            return True
+        return bool(ProductService.release_expired_holds(db, [product_id])) and db.execute(stmt).scalar() is not None
+
+    @staticmethod
+    def release_expired_holds(db: Session, product_ids: Iterable[int]) -> List[int]:
+        """
+        Delete the expired reservations of these products and give their units
+        back, without waiting for the sweeper. Reservations another transaction
+        has locked (the sweeper, a release) are skipped: that transaction frees
+        them, and waiting could deadlock on the product rows the caller holds.
+        Does not commit. Returns the product ids that got units back.
+        """
+        expired = (
+            select(StockReservation.reservation_id)
+            .where(
+                StockReservation.product_id.in_(list(product_ids)),
+                StockReservation.expires_at <= datetime.utcnow(),
+            )
+            .with_for_update(skip_locked=True)
+        )
+        rows = db.execute(
+            delete(StockReservation)
+            .where(StockReservation.reservation_id.in_(expired))
+            .returning(StockReservation.product_id, StockReservation.quantity)
+        ).all()
+        quantities: Dict[int, int] = {}
+        for product_id, quantity in rows:
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        return ProductService.release_held_stock(db, quantities)
+
+    @staticmethod
+    def release_held_stock(db: Session, quantities: Dict[int, int]) -> List[int]:
+        """
+        Give reserved units back (released or expired reservations) in one
+        UPDATE ... FROM (VALUES ...), locking rows in product_id order.
+        Does not commit. Returns the product ids updated.
+        """
+        if not quantities:
+            return []
+        table = Product.__table__
+        released = values(
+            column('product_id', Integer), column('quantity', Integer), name='released',
+        ).data(sorted(quantities.items()))
+        locked = ProductService._locked_products(quantities)
+        stmt = (
+            update(table)
+            .where(
+                table.c.product_id == released.c.product_id,
+                table.c.product_id.in_(select(locked.c.product_id)),
+            )
+            .values(reserved_quantity=func.greatest(table.c.reserved_quantity - released.c.quantity, 0))
+            .returning(table.c.product_id)
+        )
+        return db.execute(stmt).scalars().all()
+
+    @staticmethod
+    def restore_stock(db: Session, quantities: Dict[int, int]) -> List[int]:
+        """
+        Put stock back (e.g. for cancelled orders) in one UPDATE ... FROM (VALUES ...),
+        locking rows in product_id order like take_stock.
+        Does not commit. Returns the product ids updated.
+        """
+        if not quantities:
+            return []
+        table = Product.__table__
+        returned = values(
+            column('product_id', Integer), column('quantity', Integer), name='returned',
+        ).data(sorted(quantities.items()))
+        locked = ProductService._locked_products(quantities)
+        stmt = (
+            update(table)
+            .where(
+                table.c.product_id == returned.c.product_id,
+                table.c.product_id.in_(select(locked.c.product_id)),
+            )
+            .values(stock_quantity=table.c.stock_quantity + returned.c.quantity)
+            .returning(table.c.product_id)
+        )
+        return db.execute(stmt).scalars().all()
 
     @staticmethod
     def is_overpriced(product):
@@ -131,32 +786,104 @@ class ProductService:
         return float(product.price) < float(product.market_average) * 0.8
     
     @staticmethod
-    def filter_products(db: Session, category:str = None, 
-                        condition: str = None,
-                        rarity: str = None,
-                        year_min: int = None,
-                        year_max: int = None,
-                        price_min: float = None,
-                        price_max: float = None,
-                        skip: int = 0,
-                        limit: int = 100) -> List[Product]:
-        """Filter products based on multiple criteria"""
-        if category:
-            query = db.query.filter(Product.category_id == category)
+    def apply_filters(query, category_id: int = None,
+                      category_ids: Iterable[int] = None,
+                      condition: str = None,
+                      rarity: str = None,
+                      year_min: int = None,
+                      year_max: int = None,
+                      price_min: float = None,
+                      price_max: float = None):
+        """
+        Narrow a Product query to active listings matching the given filters.
+        category_id matches that category only; category_ids (see
+        with_category_subtree) matches any of them.
+        """
+        query = query.filter(Product.is_active == True)
+        if category_ids is not None:
+            query = query.filter(Product.category_id.in_(category_ids))
+        elif category_id is not None:
+            query = query.filter(Product.category_id == category_id)
         if condition:
             query = query.filter(Product.condition == condition)
         if rarity:
             query = query.filter(Product.rarity == rarity)
-        if year_min:
+        if year_min is not None:
             query = query.filter(Product.year_manufactured >= year_min)
-        if year_max:
+        if year_max is not None:
             query = query.filter(Product.year_manufactured <= year_max)
-        if price_min:
+        if price_min is not None:
             query = query.filter(Product.price >= price_min)
-        if price_max:
+        if price_max is not None:
             query = query.filter(Product.price <= price_max)
+        return query
+
+    @staticmethod
+    def with_category_subtree(db: Session, filters: dict) -> dict:
+        """Swap a category_id filter for the ids of that category and all its descendants"""
+        category_id = filters.get('category_id')
+        if category_id is None:
+            return filters
+        expanded = {key: value for key, value in filters.items() if key != 'category_id'}
+        expanded['category_ids'] = CategoryService.subtree_ids(db, category_id)
+        return expanded
+
+    @staticmethod
+    def filter_products(db: Session, cursor: str = None, limit: int = 100,
+                        sort: str = None, **filters) -> Tuple[List, Optional[str]]:
+        """
+        Filter products based on multiple criteria (see apply_filters).
+        A category_id filter includes its subcategories.
+        Returns (rows, next_cursor), same contract as get_all_products
+        """
+        filters = ProductService.with_category_subtree(db, filters)
+        query = ProductService.apply_filters(db.query(*PRODUCT_LIST_COLUMNS), **filters)
+        return paginate(query, get_sort(PRODUCT_SORTS, sort, DEFAULT_PRODUCT_SORT), cursor, limit)
+
+    @staticmethod
+    def get_facet_counts(db: Session, **filters) -> Dict[str, List[Dict]]:
+        """
+        Count matching products per condition, rarity, category, price band and
+        decade, under the filters already applied.
+
+        All facets come from ONE aggregation pass using GROUPING SETS; grouping()
+        tells us which facet each result row belongs to.
+
+        Returns {"condition": [{"value": "mint", "count": 12}, ...], ...},
+        each list sorted by count (highest first). Products with no value for a
+        facet (e.g. unknown year) are left out of that facet.
+        A category_id filter includes its subcategories.
+        """
+        filters = ProductService.with_category_subtree(db, filters)
+        cache_key = tuple(sorted((k, v) for k, v in filters.items() if v is not None))
+        cached = facet_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        names = list(FACETS)
+        exprs = [FACETS[name] for name in names]
+        query = db.query(
+            *[expr.label(name) for name, expr in zip(names, exprs)],
+            *[func.grouping(expr).label(f"grouping_{name}") for name, expr in zip(names, exprs)],
+            func.count().label('count'),
+        )
+        query = ProductService.apply_filters(query, **filters).group_by(func.grouping_sets(*exprs))
+
+        facets = {name: [] for name in names}
+        for row in query.all():
+            for name in names:
+                # grouping() is 0 for the column this row was grouped by
+                if getattr(row, f"grouping_{name}") == 0:
+                    value = getattr(row, name)
+                    if value is not None:
+                        facets[name].append({'value': value, 'count': row.count})
+                    break
+        for buckets in facets.values():
+            buckets.sort(key=lambda bucket: bucket['count'], reverse=True)
+
+        facet_cache.set(cache_key, facets)
+        return facets
 
-        return query.filter(Product.is_active == True).offset(skip).limit(limit).all()
     @staticmethod
     def get_by_condition(db: Session, condition: str, skip: int = 0, limit: int = 100) -> List[Product]:
         """
@@ -181,4 +908,102 @@ class ProductService:
             errors.append(f"Invalid condition: {condition}. Must be one of {', '.join(VALID_CONDITIONS)}")
         if rarity and rarity not in VALID_RARITIES:
             errors.append(f"Invalid rarity: {rarity}. Must be one of {', '.join(VALID_RARITIES)}")
-        return errors
\ No newline at end of file
+        return errors
+
+    @staticmethod
+    def parse_import_row(record: dict) -> Tuple[Optional[dict], List[str]]:
+        """
+        Turn one uploaded record (CSV strings or JSON values) into Product column values.
+        Unknown keys are ignored; empty strings count as missing.
+        Returns (values, errors); values is None when there are errors.
+        """
+        row_values = dict(IMPORT_DEFAULTS)
+        errors = []
+        for field, parse in IMPORT_FIELDS.items():
+            raw = record.get(field)
+            if raw is None or (isinstance(raw, str) and raw.strip() == ''):
+                continue
+            try:
+                row_values[field] = parse(raw.strip() if isinstance(raw, str) else raw)
+            except (ValueError, TypeError) as e:
+                errors.append(f"Invalid {field}: {e}")
+
+        for field in ('name', 'price'):
+            if field not in row_values and not any(e.startswith(f"Invalid {field}:") for e in errors):
+                errors.append(f"Missing required field: {field}")
+        errors.extend(ProductService.validate_trinket_fields(row_values.get('condition'), row_values.get('rarity')))
+
+        if errors:
+            return None, errors
+        for field in IMPORT_FIELDS:
+            row_values.setdefault(field, None)
+        return row_values, []
+
+    @staticmethod
+    def _insert_import_batch(db: Session, batch: List[Tuple[int, dict]], report: dict):
+        """
+        Insert one batch with a single executemany and commit it.
+        If the database rejects the batch (e.g. an unknown category_id), retry it row
+        by row so only the offending rows are reported.
+        """
+        try:
+            db.execute(insert(Product.__table__), [row_values for _, row_values in batch])
+            db.commit()
+            report['inserted'] += len(batch)
+            return
+        except (IntegrityError, DataError):
+            db.rollback()
+
+        for row_number, row_values in batch:
+            try:
+                db.execute(insert(Product.__table__), row_values)
+                db.commit()
+                report['inserted'] += 1
+            except (IntegrityError, DataError) as e:
+                db.rollback()
+                ProductService._report_import_error(report, row_number, [str(e.orig).strip()])
+
+    @staticmethod
+    def _report_import_error(report: dict, row_number: int, errors: List[str]):
+        report['failed'] += 1
+        if len(report['errors']) < MAX_IMPORT_ERRORS:
+            report['errors'].append({'row': row_number, 'errors': errors})
+        else:
+            report['errors_truncated'] = True
+
+    @staticmethod
+    def bulk_import(db: Session, records: Iterable[Tuple[int, Optional[dict], Optional[str]]],
+                    batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+        """
+        Validate and insert products from a stream of (row_number, record, parse_error)
+        tuples, as produced by modules.common.streaming.iter_records.
+
+        Rows are inserted batch_size at a time, one executemany + commit per batch,
+        so memory stays flat however large the upload is. Invalid rows are skipped
+        and reported; valid rows in the same upload are still inserted.
+
+        Returns:
+        {
+            "inserted": 49990,
+            "failed": 10,
+            "errors": [{"row": 17, "errors": ["Invalid rarity: ..."]}, ...],
+            "errors_truncated": false
+        }
+        """
+        report = {'inserted': 0, 'failed': 0, 'errors': [], 'errors_truncated': False}
+        batch = []
+        for row_number, record, parse_error in records:
+            if parse_error:
+                ProductService._report_import_error(report, row_number, [parse_error])
+                continue
+            row_values, errors = ProductService.parse_import_row(record)
+            if errors:
+                ProductService._report_import_error(report, row_number, errors)
+                continue
+            batch.append((row_number, row_values))
+            if len(batch) >= batch_size:
+                ProductService._insert_import_batch(db, batch, report)
+                batch = []
+        if batch:
+            ProductService._insert_import_batch(db, batch, report)
+        return report
@@ -0,0 +1,260 @@
+"""
+"Similar items" for product detail pages - nearest neighbours by cosine similarity
+
+How it works:
+- Each active product is a vector: TF-IDF over its name, plus one-hot
+  features for brand, category (and parent category), condition, rarity,
+  material and decade, hashed into a fixed number of columns. Rows are L2
+  normalized, so a dot product is the cosine similarity.
+- The catalog matrix is precomputed (CSC: a query only touches the columns
+  its own features use) and a lookup is one sparse product plus an
+  argpartition for the top K.
+- Refreshes are incremental: changed products are appended to a small
+  delta matrix and their old rows masked out; once the delta or the masked
+  rows grow too large, everything is refit from scratch.
+- Queries read an immutable snapshot, so they never wait for a refresh.
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+from sqlalchemy.orm import Session
+from modules.products.models import Product
+from modules.products.indexing import IncrementalProductIndex
+from modules.products.categories import CategoryService
+from modules.products.services import PRODUCT_LIST_COLUMNS, product_list_encoder
+from modules.common.cache import TTLCache
+
+MAX_SIMILAR = 50
+# Relative weight of each feature group in the combined vector
+NAME_WEIGHT = 1.0
+ATTRIBUTE_WEIGHTS = {
+    'brand':           0.6,
+    'category':        0.6,
+    'parent_category': 0.3,
+    'condition':       0.3,
+    'rarity':          0.3,
+    'material':        0.3,
+    'decade':          0.4,
+}
+HASHED_FEATURES = 2 ** 16
+# Refit once the delta holds this share of the base, or this share of rows is masked out
+REBUILD_DELTA_FRACTION = 0.10
+REBUILD_DEAD_FRACTION = 0.20
+MIN_REBUILD_ROWS = 1000
+
+# Encoded results per (product_id, limit); short-lived since the index refreshes
+similar_cache = TTLCache(maxsize=int(os.getenv('SIMILAR_CACHE_SIZE', 10_000)),
+                         ttl=float(os.getenv('SIMILAR_CACHE_TTL', 60)))
+
+
+class _Snapshot:
+    """Immutable: a refresh builds a new one and swaps it in"""
+
+    def __init__(self, vectorizer, base_ids, base, delta_ids, delta, alive):
+        self.vectorizer = vectorizer
+        self.base_ids = base_ids          # np.int64[n]
+        self.base = base                  # CSC n x d
+        self.delta_ids = delta_ids        # np.int64[m]
+        self.delta = delta                # CSR m x d
+        self.alive = alive                # np.bool_[n + m]
+        self.ids = np.concatenate([base_ids, delta_ids])
+        self.row_of: Dict[int, int] = {}
+        for row in np.flatnonzero(alive):
+            self.row_of[int(self.ids[row])] = int(row)
+
+    @property
+    def dead_rows(self) -> int:
+        return int(len(self.alive) - self.alive.sum())
+
+
+class SimilarProductIndex(IncrementalProductIndex):
+    columns = [
+        Product.product_id, Product.updated_at, Product.is_active,
+        Product.name, Product.brand, Product.category_id, Product.condition,
+        Product.rarity, Product.material, Product.year_manufactured,
+    ]
+    refresh_interval = float(os.getenv('SIMILAR_INDEX_REFRESH_SECONDS', 60))
+
+    def __init__(self):
+        super().__init__()
+        self._snapshot: Optional[_Snapshot] = None
+        self._hasher = FeatureHasher(n_features=HASHED_FEATURES, input_type='pairs', alternate_sign=False)
+        self._changed: List = []
+        self._tree = None
+
+    # ------------------------------------------------------------------
+    # Vectors
+    # ------------------------------------------------------------------
+
+    def _attribute_pairs(self, row) -> List[Tuple[str, float]]:
+        pairs = []
+
+        def add(group, value):
+            if value is not None and value != '':
+                pairs.append((f'{group}={str(value).strip().lower()}', ATTRIBUTE_WEIGHTS[group]))
+
+        add('brand', row.brand)
+        add('category', row.category_id)
+        if row.category_id is not None and self._tree is not None:
+            for parent_id in self._tree.ancestors(row.category_id)[:1]:
+                add('parent_category', parent_id)
+        add('condition', row.condition)
+        add('rarity', row.rarity)
+        add('material', row.material)
+        if row.year_manufactured:
+            add('decade', row.year_manufactured // 10 * 10)
+        return pairs
+
+    def _vectorize(self, vectorizer, rows) -> sp.csr_matrix:
+        names = vectorizer.transform([row.name or '' for row in rows]) * NAME_WEIGHT
+        attributes = self._hasher.transform([self._attribute_pairs(row) for row in rows])
+        return normalize(sp.hstack([names, attributes], format='csr', dtype=np.float32))
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def _reset(self):
+        self._changed = []
+
+    def _apply_rows(self, rows, initial: bool):
+        self._changed.extend(rows)
+
+    def refresh(self, db: Session, full: bool = False) -> int:
+        with self._lock:
+            self._tree = CategoryService.get_tree(db)
+            count = super().refresh(db, full=full)
+            snapshot = self._snapshot
+            if snapshot is not None and not full:
+                total = len(snapshot.alive)
+                if (total >= MIN_REBUILD_ROWS and
+                        (len(snapshot.delta_ids) > REBUILD_DELTA_FRACTION * len(snapshot.base_ids) or
+                         snapshot.dead_rows > REBUILD_DEAD_FRACTION * total)):
+                    count = super().refresh(db, full=True)
+            return count
+
+    def _finish_refresh(self, initial: bool):
+        rows, self._changed = self._changed, []
+        if initial or self._snapshot is None:
+            self._snapshot = self._build(rows)
+        elif rows:
+            self._snapshot = self._extend(self._snapshot, rows)
+        self.product_count = len(self._snapshot.row_of) if self._snapshot else 0
+
+    def _build(self, rows) -> Optional[_Snapshot]:
+        # Later rows win if a product was read twice
+        latest = {row.product_id: row for row in rows if row.is_active}
+        rows = list(latest.values())
+        if not rows:
+            return None
+        vectorizer = TfidfVectorizer(token_pattern=r'(?u)\b\w+\b', sublinear_tf=True, dtype=np.float32)
+        vectorizer.fit([row.name or '' for row in rows])
+        matrix = self._vectorize(vectorizer, rows)
+        ids = np.array([row.product_id for row in rows], dtype=np.int64)
+        empty = sp.csr_matrix((0, matrix.shape[1]), dtype=np.float32)
+        return _Snapshot(vectorizer, ids, matrix.tocsc(), np.zeros(0, dtype=np.int64), empty,
+                         np.ones(len(ids), dtype=bool))
+
+    def _extend(self, snapshot: _Snapshot, rows) -> _Snapshot:
+        latest = {row.product_id: row for row in rows}
+        alive = snapshot.alive.copy()
+        for product_id in latest:
+            row = snapshot.row_of.get(product_id)
+            if row is not None:
+                alive[row] = False
+        added = [row for row in latest.values() if row.is_active]
+        delta, delta_ids = snapshot.delta, snapshot.delta_ids
+        if added:
+            delta = sp.vstack([delta, self._vectorize(snapshot.vectorizer, added)], format='csr')
+            delta_ids = np.concatenate([delta_ids, np.array([row.product_id for row in added], dtype=np.int64)])
+            alive = np.concatenate([alive, np.ones(len(added), dtype=bool)])
+        return _Snapshot(snapshot.vectorizer, snapshot.base_ids, snapshot.base, delta_ids, delta, alive)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def nearest(self, row, limit: int) -> List[Tuple[int, float]]:
+        """[(product_id, cosine similarity)] for the `limit` products most like `row`"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return []
+        query = self._vectorize(snapshot.vectorizer, [row])
+        features, weights = query.indices, query.data
+
+        scores = np.empty(len(snapshot.ids), dtype=np.float32)
+        n = len(snapshot.base_ids)
+        scores[:n] = snapshot.base[:, features] @ weights
+        if snapshot.delta.shape[0]:
+            scores[n:] = (snapshot.delta @ query.T).toarray().ravel()
+        scores[~snapshot.alive] = -np.inf
+        own = snapshot.row_of.get(row.product_id)
+        if own is not None:
+            scores[own] = -np.inf
+
+        k = min(limit, len(scores))
+        top = np.argpartition(scores, len(scores) - k)[-k:]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(snapshot.ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'products': 0}
+        return {
+            'products': len(snapshot.row_of),
+            'base_rows': len(snapshot.base_ids),
+            'delta_rows': len(snapshot.delta_ids),
+            'dead_rows': snapshot.dead_rows,
+            'features': snapshot.base.shape[1],
+            'watermark': self._watermark.isoformat() if self._watermark else None,
+        }
+
+
+similar_index = SimilarProductIndex()
+
+
+class SimilarProductService:
+
+    @staticmethod
+    def get_similar_json(db: Session, product_id: int, limit: int = 10) -> Optional[str]:
+        """
+        Up to `limit` active products most similar to product_id, as a JSON array
+        of product list fields plus "similarity" (cosine, 0..1), best first.
+        Returns None if the product doesn't exist or is inactive.
+        """
+        limit = max(1, min(limit, MAX_SIMILAR))
+        cache_key = (product_id, limit)
+        cached = similar_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        product = (
+            db.query(*SimilarProductIndex.columns)
+            .filter(Product.product_id == product_id, Product.is_active == True)
+            .first()
+        )
+        if product is None:
+            return None
+        similar_index.ensure_fresh(db)
+        matches = similar_index.nearest(product, limit)
+
+        encoded = '[]'
+        if matches:
+            similarity = dict(matches)
+            rows = (
+                db.query(*PRODUCT_LIST_COLUMNS)
+                .filter(Product.product_id.in_(similarity), Product.is_active == True)
+                .all()
+            )
+            rows.sort(key=lambda row: similarity[row.product_id], reverse=True)
+            encoded = '[' + ','.join([
+                product_list_encoder.encode(row, similarity=repr(round(similarity[row.product_id], 4)))
+                for row in rows
+            ]) + ']'
+        similar_cache.set(cache_key, encoded)
+        return encoded